@@ -1,48 +1,303 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import openpyxl
 import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import threading
 
-# Leitura das planilhas, desconsiderando as linhas de cabeçalho da planilha AX
-def ler_planilha(caminho, skiprows=0, encoding='utf-8'):
-    if caminho.endswith('.xlsx') or caminho.endswith('.xls'):
-        return pd.read_excel(caminho, skiprows=skiprows)
-    elif caminho.endswith('.csv'):
-        try:
-            return pd.read_csv(caminho, encoding=encoding, skiprows=skiprows, on_bad_lines='warn', delimiter=';')
-        except UnicodeDecodeError:
-            return pd.read_csv(caminho, encoding='iso-8859-1', skiprows=skiprows, on_bad_lines='warn', delimiter=';')
+from Chaves import contem, indexar, juntar, normalizar_chave
+from Compacto import compactar_resultado, liberar_memoria
+from Historico import registrar
+from Metricas import MB, contar, etapa, memoria_rss
+from Planilha import converter_backend
+from Sessao import PlanilhaAX, ax_da_janela, caminho_ax_da_sessao
+from Exportacao import FORMATOS_EXPORTACAO
+from Tarefas import obter_agendador
+from Visualizacao import IndicadorProgresso, PainelPaginado, exportar_em_segundo_plano, selecionar_planilhas_ax
+
+logger = logging.getLogger(__name__)
+
+# Abaixo deste tamanho, iniciar os processos custa mais do que ler as abas em sequência
+TAMANHO_MINIMO_PARALELO = 2 * 1024 * 1024
+
+# Conciliação por valor: colunas de valor e data da planilha AX e do consolidado do banco
+COLUNA_VALOR_AX = 'Valor'
+COLUNA_DATA_AX = 'Data'
+COLUNA_VALOR_BANCO = 'Valor Pago'
+COLUNA_DATA_BANCO = 'Data Pagamento'
+# Diferença aceita entre o valor da fatura e o total pago, em reais, e distância máxima, em dias,
+# entre a data da fatura e a do crédito sem Nosso Número associado a ela pelo valor
+TOLERANCIA = float(os.environ.get('NFSE_BANCO_TOLERANCIA', '0.01'))
+JANELA_DIAS = int(os.environ.get('NFSE_BANCO_JANELA_DIAS', '5'))
+SITUACOES = ['Conciliada', 'Pagamento parcial', 'Crédito duplicado', 'Valor divergente', 'Sem pagamento']
+ORIGENS = ['Nosso Número', 'Data e valor']
+
+# Lê uma aba do arquivo de movimentação, parando na linha de TOTAL da coluna 'Nosso Número'.
+# Para .xlsx a aba é percorrida em modo somente leitura, sem carregar o resumo após o TOTAL.
+def ler_aba_movimento(caminho_movimento, nome_planilha, skiprows=3):
+    inicio = time.perf_counter()
+    if caminho_movimento.endswith('.xlsx'):
+        df = _ler_aba_xlsx(caminho_movimento, nome_planilha, skiprows)
     else:
-        raise ValueError("Formato de arquivo não suportado.")
-
-# Consolida as planilhas do arquivo de movimentação
-def consolidar_planilhas_movimento(caminho_movimento):
-    excel_data = pd.read_excel(caminho_movimento, sheet_name=None, skiprows=3)
-    todas_planilhas = []
-
-    for nome_planilha, df in excel_data.items():
+        df = pd.read_excel(caminho_movimento, sheet_name=nome_planilha, skiprows=skiprows)
         if 'Nosso Número' in df.columns:
             indice_total = df[df['Nosso Número'].astype(str).str.contains('TOTAL', case=False, na=False)].index
             if not indice_total.empty:
                 df = df.loc[:indice_total[0] - 1]
-        todas_planilhas.append(df)
-
-    consolidado_df = pd.concat(todas_planilhas, ignore_index=True)
+    return nome_planilha, df, time.perf_counter() - inicio
+
+def _ler_aba_xlsx(caminho_movimento, nome_planilha, skiprows):
+    livro = openpyxl.load_workbook(caminho_movimento, read_only=True, data_only=True)
+    try:
+        linhas = livro[nome_planilha].iter_rows(values_only=True)
+        for _ in range(skiprows):
+            next(linhas, None)
+        cabecalho = list(next(linhas, None) or [])
+        nomes = _nomes_colunas(cabecalho)
+        posicao_total = nomes.index('Nosso Número') if 'Nosso Número' in nomes else None
+
+        dados = []
+        encontrou_total = False
+        for linha in linhas:
+            if posicao_total is not None and posicao_total < len(linha) and 'TOTAL' in str(linha[posicao_total]).upper():
+                encontrou_total = True
+                break
+            dados.append(linha)
+    finally:
+        livro.close()
+
+    # Sem a linha de TOTAL, as linhas vazias do final da aba são descartadas, como no read_excel
+    if not encontrou_total:
+        while dados and all(valor is None for valor in dados[-1]):
+            dados.pop()
+
+    # Colunas vazias à direita do cabeçalho e dos dados também são descartadas
+    largura = max((_largura_util(linha) for linha in [cabecalho] + dados), default=0)
+    nomes = _nomes_colunas(cabecalho[:largura] + [None] * (largura - len(cabecalho)))
+    dados = [[np.nan if valor is None else valor for valor in linha[:largura]] + [np.nan] * (largura - len(linha)) for linha in dados]
+    return pd.DataFrame(dados, columns=nomes)
+
+def _largura_util(linha):
+    for posicao in range(len(linha), 0, -1):
+        if linha[posicao - 1] is not None:
+            return posicao
+    return 0
+
+def _nomes_colunas(cabecalho):
+    """Nomeia as colunas como o read_excel: 'Unnamed: n' para vazias e sufixo .n para repetidas."""
+    nomes = []
+    for posicao, valor in enumerate(cabecalho):
+        nome = f"Unnamed: {posicao}" if valor is None else valor
+        repeticoes = nomes.count(nome)
+        nomes.append(f"{nome}.{repeticoes}" if repeticoes else nome)
+    return nomes
+
+def listar_abas(caminho_movimento):
+    if caminho_movimento.endswith('.xlsx'):
+        livro = openpyxl.load_workbook(caminho_movimento, read_only=True)
+        try:
+            return livro.sheetnames
+        finally:
+            livro.close()
+    return list(pd.ExcelFile(caminho_movimento).sheet_names)
+
+# Consolida as planilhas do arquivo de movimentação.
+# As abas são lidas em paralelo, em processos separados; ao_concluir_aba recebe (nome, linhas, segundos) de cada aba.
+# Se ao_concluir_aba levantar uma exceção (por exemplo, o cancelamento da tarefa), as abas ainda não iniciadas não são lidas.
+def consolidar_planilhas_movimento(caminho_movimento, paralelo=True, ao_concluir_aba=None):
+    abas = listar_abas(caminho_movimento)
+    lidas = {}
+    processos = min(len(abas), os.cpu_count() or 1)
+
+    if paralelo and processos > 1 and os.path.getsize(caminho_movimento) >= TAMANHO_MINIMO_PARALELO:
+        with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futuros = [executor.submit(ler_aba_movimento, caminho_movimento, nome) for nome in abas]
+            try:
+                for futuro in as_completed(futuros):
+                    nome, df, segundos = futuro.result()
+                    lidas[nome] = df
+                    _registrar_aba(nome, df, segundos, ao_concluir_aba)
+            except BaseException:
+                for futuro in futuros:
+                    futuro.cancel()
+                raise
+    else:
+        for nome in abas:
+            nome, df, segundos = ler_aba_movimento(caminho_movimento, nome)
+            lidas[nome] = df
+            _registrar_aba(nome, df, segundos, ao_concluir_aba)
+
+    # Uma única concatenação, na ordem das abas do arquivo
+    consolidado_df = converter_backend(pd.concat([lidas[nome] for nome in abas], ignore_index=True))
+    registrar('banco', caminho_movimento, consolidado_df)
     return consolidado_df
 
+def _registrar_aba(nome, df, segundos, ao_concluir_aba):
+    logger.info("Aba %s: %d linha(s) em %.3fs", nome, len(df), segundos)
+    if ao_concluir_aba:
+        ao_concluir_aba(nome, len(df), segundos)
+
 # Comparação das colunas 'Nosso Número' do consolidado e 'Fatura' da planilha AX
-def comparar_consolidado_ax(consolidado_df, caminho_ax):
-    ax_df = ler_planilha(caminho_ax, skiprows=11)
+# caminho_ax é o caminho da planilha ou a PlanilhaAX já carregada na sessão.
+# Com medicao, o tempo e a memória de cada etapa são registrados (veja Metricas)
+def comparar_consolidado_ax(consolidado_df, caminho_ax, medicao=None):
+    ax_df = PlanilhaAX.obter(caminho_ax, medicao).dados
+    ax_df = ax_df.drop(columns=[COLUNA_VALOR_AX, COLUNA_DATA_AX], errors='ignore')  # Usados só na conciliação por valor
 
-    # Convertendo as colunas para o tipo adequado
-    consolidado_df['Nosso Número'] = consolidado_df['Nosso Número'].astype(float)
-    ax_df['Fatura'] = ax_df['Fatura'].astype(float)
+    # Convertendo as chaves para inteiro
+    with etapa(medicao, 'Normalização'):
+        nosso_numero = normalizar_chave(consolidado_df['Nosso Número'])
 
     # Encontrando as faturas que estão na AX e não na consolidação
-    resultado_comparacao = ax_df[~ax_df['Fatura'].isin(consolidado_df['Nosso Número'])]
+    with etapa(medicao, 'Junção'):
+        resultado_comparacao = ax_df[~contem(ax_df['Fatura'], nosso_numero)]
 
     return resultado_comparacao
 
+def _centavos(serie):
+    """Valores em centavos (Int64), lidos como número ou como texto no formato 1.234,56."""
+    if not pd.api.types.is_numeric_dtype(serie.dtype):
+        texto = serie.astype('string').str.strip()
+        virgula = texto.str.contains(',', regex=False, na=False)
+        texto = texto.where(~virgula, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+        serie = pd.to_numeric(texto, errors='coerce')
+    return (serie.astype('Float64') * 100).round().astype('Int64')
+
+def _datas(serie):
+    """Datas (dd/mm/aaaa ou as datas do Excel) em datetime64[ns]; as inválidas ficam vazias."""
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie.astype('datetime64[ns]')
+    datas = pd.to_datetime(serie, format='%d/%m/%Y', errors='coerce')
+    falhas = datas.isna() & serie.notna()
+    if falhas.any():
+        datas[falhas] = pd.to_datetime(serie[falhas].astype(str), dayfirst=True, errors='coerce', format='mixed')
+    return datas.astype('datetime64[ns]')
+
+def _parear_por_data(creditos, faturas, janela_dias):
+    """Associa cada fatura a um crédito de mesmo valor com a data mais próxima, em até janela_dias (pd.merge_asof).
+
+    creditos e faturas têm as colunas posicao, centavos e data, sem vazios. Quando várias faturas querem o
+    mesmo crédito, ele fica com a mais próxima; as demais são pareadas de novo com os créditos que sobraram
+    (por exemplo, mensalidades de mesmo valor), até não surgirem novos pares. Cada crédito e cada fatura
+    aparecem em no máximo um par. Retorna as posições dos créditos e das faturas.
+    """
+    posicoes_credito, posicoes_fatura = [], []
+    creditos = creditos.assign(data_credito=creditos['data']).sort_values('data', kind='stable')
+    faturas = faturas.sort_values('data', kind='stable')
+    while not creditos.empty and not faturas.empty:
+        pares = pd.merge_asof(
+            faturas, creditos, on='data', by='centavos', suffixes=('_fatura', '_credito'),
+            tolerance=pd.Timedelta(days=janela_dias), direction='nearest',
+        ).dropna(subset=['posicao_credito'])
+        if pares.empty:
+            break
+        distancia = (pares['data_credito'] - pares['data']).abs()
+        pares = pares.iloc[np.argsort(distancia.to_numpy(), kind='stable')].drop_duplicates('posicao_credito')
+        posicoes_credito.append(pares['posicao_credito'].to_numpy('int64'))
+        posicoes_fatura.append(pares['posicao_fatura'].to_numpy('int64'))
+        creditos = creditos[~creditos['posicao'].isin(posicoes_credito[-1])]
+        faturas = faturas[~faturas['posicao'].isin(posicoes_fatura[-1])]
+    if not posicoes_credito:
+        return np.array([], dtype='int64'), np.array([], dtype='int64')
+    return np.concatenate(posicoes_credito), np.concatenate(posicoes_fatura)
+
+# Conciliação pelo valor: além de verificar se a fatura aparece no banco, compara o total creditado com o valor
+def conciliar_valores(consolidado_df, caminho_ax, tolerancia=TOLERANCIA, janela_dias=JANELA_DIAS, medicao=None):
+    """Concilia os créditos do consolidado com as faturas do AX considerando os valores.
+
+    Cada crédito vai para a fatura do seu Nosso Número. Os créditos sem Nosso Número, ou com um que não está
+    no AX, vão para uma fatura ainda sem crédito de mesmo valor (ao centavo), com a data mais próxima em até
+    janela_dias. A soma dos créditos de cada fatura é comparada com o valor, com a tolerância em reais, e
+    define a Situação (veja SITUACOES): pagamentos parciais, créditos em duplicidade e valores divergentes.
+
+    Uma fatura que aparece em mais de uma linha do AX (por exemplo, uma linha por item) é conciliada pela
+    soma dos valores dessas linhas: o Valor do resultado é essa soma, e Linhas AX informa quantas eram.
+    As demais colunas vêm da primeira linha.
+
+    Retorna as faturas do AX com Linhas AX, Créditos, Valor pago, Diferença, Data pagamento, Origem e
+    Situação, e os créditos do consolidado que não correspondem a nenhuma fatura.
+    """
+    ax = PlanilhaAX.obter(caminho_ax, medicao)
+    for coluna, colunas in ((COLUNA_VALOR_AX, ax.dados.columns), (COLUNA_DATA_AX, ax.dados.columns), (COLUNA_VALOR_BANCO, consolidado_df.columns)):
+        if coluna not in colunas:
+            raise ValueError(f"A conciliação por valor precisa da coluna {coluna}.")
+
+    with etapa(medicao, 'Normalização'):
+        faturas = ax.dados[ax.dados['Fatura'].notna()]
+        # Uma fatura repetida no AX vale pela soma das suas linhas (na ordem da primeira ocorrência)
+        codigos, _ = pd.factorize(faturas['Fatura'])
+        linhas_ax = np.bincount(codigos)
+        valor_fatura = _centavos(faturas[COLUNA_VALOR_AX]).groupby(codigos).sum(min_count=1).reset_index(drop=True)
+        faturas = faturas[~faturas['Fatura'].duplicated()].reset_index(drop=True)
+        if (linhas_ax > 1).any():
+            faturas[COLUNA_VALOR_AX] = valor_fatura / 100
+        data_fatura = _datas(faturas[COLUNA_DATA_AX])
+        nosso_numero = normalizar_chave(consolidado_df['Nosso Número'])
+        valor_credito = _centavos(consolidado_df[COLUNA_VALOR_BANCO])
+        if COLUNA_DATA_BANCO in consolidado_df.columns:
+            data_credito = _datas(consolidado_df[COLUNA_DATA_BANCO])
+        else:
+            data_credito = pd.Series(pd.NaT, index=consolidado_df.index, dtype='datetime64[ns]')
+
+    with etapa(medicao, 'Junção'):
+        # Os números das faturas são únicos: cada crédito corresponde a uma fatura ou a nenhuma (-1)
+        _, fatura_do_credito = juntar(nosso_numero, indexar(faturas['Fatura']))
+        origem = np.where(fatura_do_credito >= 0, 0, -1)
+
+    with etapa(medicao, 'Data e valor'):
+        sem_credito = np.bincount(fatura_do_credito[fatura_do_credito >= 0], minlength=len(faturas)) == 0
+        livres = (fatura_do_credito < 0) & valor_credito.notna().to_numpy() & data_credito.notna().to_numpy()
+        pendentes = sem_credito & valor_fatura.notna().to_numpy() & data_fatura.notna().to_numpy()
+        posicoes_credito, posicoes_fatura = _parear_por_data(
+            pd.DataFrame({'posicao': np.flatnonzero(livres), 'centavos': valor_credito.to_numpy('int64', na_value=0)[livres],
+                          'data': data_credito.to_numpy()[livres]}),
+            pd.DataFrame({'posicao': np.flatnonzero(pendentes), 'centavos': valor_fatura.to_numpy('int64', na_value=0)[pendentes],
+                          'data': data_fatura.to_numpy()[pendentes]}),
+            janela_dias)
+        fatura_do_credito[posicoes_credito] = posicoes_fatura
+        origem[posicoes_credito] = 1
+
+    with etapa(medicao, 'Valores'):
+        casados = fatura_do_credito >= 0
+        posicoes = fatura_do_credito[casados]
+        valores = valor_credito.to_numpy('int64', na_value=0)[casados]
+        valor = valor_fatura.to_numpy('int64', na_value=0)
+        com_valor = valor_fatura.notna().to_numpy()
+        limite = round(tolerancia * 100)
+
+        creditos = np.bincount(posicoes, minlength=len(faturas))
+        pago = np.rint(np.bincount(posicoes, weights=valores, minlength=len(faturas))).astype('int64')
+        # Um crédito com o valor da fatura entre vários indica o mesmo pagamento creditado mais de uma vez
+        credito_igual = np.bincount(posicoes, weights=np.abs(valores - valor[posicoes]) <= limite, minlength=len(faturas)) > 0
+        diferenca = pago - valor
+        situacao = np.select(
+            [creditos == 0,
+             com_valor & (np.abs(diferenca) <= limite),
+             com_valor & (creditos > 1) & credito_igual & (diferenca > limite),
+             com_valor & (diferenca < -limite)],
+            [4, 0, 2, 1], default=3)
+        origem_fatura = np.full(len(faturas), -1)
+        origem_fatura[posicoes] = origem[casados]
+
+        resultado = faturas.copy(deep=False)
+        resultado['Linhas AX'] = linhas_ax
+        resultado['Créditos'] = creditos
+        resultado['Valor pago'] = pago / 100
+        resultado['Diferença'] = np.where(com_valor, diferenca / 100, np.nan)
+        resultado['Data pagamento'] = pd.Series(data_credito.to_numpy()[casados]).groupby(posicoes).max().reindex(range(len(faturas))).to_numpy()
+        resultado['Origem'] = pd.Categorical.from_codes(origem_fatura, categories=ORIGENS)
+        resultado['Situação'] = pd.Categorical.from_codes(situacao, categories=SITUACOES)
+        creditos_sem_fatura = consolidado_df[fatura_do_credito < 0].reset_index(drop=True)
+
+    contar(medicao, 'faturas divergentes', int((situacao != 0).sum()))
+    contar(medicao, 'créditos sem fatura', len(creditos_sem_fatura))
+    return resultado, creditos_sem_fatura
+
 class ApplicationBanco(tk.Toplevel):
     def __init__(self, master=None):
         super().__init__(master)
@@ -50,7 +305,7 @@ class ApplicationBanco(tk.Toplevel):
         self.geometry("800x600")
         self.create_widgets()
         self.movimento_file_path = ""
-        self.ax_file_path = ""
+        self.ax_file_path = caminho_ax_da_sessao(self)  # A planilha AX já carregada no menu, se houver
         self.consolidado_df = None  # Para armazenar o DataFrame consolidado
 
     def create_widgets(self):
@@ -79,9 +334,20 @@ class ApplicationBanco(tk.Toplevel):
 
         self.btn_process = ttk.Button(frame, text="Processar", command=self.process_files)
         self.btn_process.pack(side=tk.LEFT, padx=5)
+
+        # Compara também os valores pagos (veja conciliar_valores)
+        self.conferir_valores = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Conferir valores", variable=self.conferir_valores).pack(side=tk.LEFT, padx=5)
+
+        self.indicador = IndicadorProgresso(self.tab_nfs_e)
+        self.indicador.pack()
+
+        # Tempo de cada etapa da última execução
+        self.label_metricas = ttk.Label(self.tab_nfs_e, text="", wraplength=760)
+        self.label_metricas.pack()
        
-        self.text_result = tk.Text(self.tab_nfs_e, height=10, width=75)
-        self.text_result.pack(pady=20)
+        self.painel_resultado = PainelPaginado(self.tab_nfs_e, height=10, width=75)
+        self.painel_resultado.pack(pady=20, expand=True, fill=tk.BOTH)
 
         frame_botoes_inferiores = ttk.Frame(self.tab_nfs_e)
         frame_botoes_inferiores.pack(pady=10)
@@ -96,10 +362,10 @@ class ApplicationBanco(tk.Toplevel):
         self.btn_clear.pack(side=tk.LEFT, padx=5)
        
         self.last_result = None
-        self.loading_label = None
 
     def load_file(self, file_type):
-        file_path = filedialog.askopenfilename()
+        # Várias planilhas AX (por exemplo, uma por empresa ou período) são unidas antes da comparação
+        file_path = selecionar_planilhas_ax() if file_type == "ax" else filedialog.askopenfilename()
         if file_path:
             if file_type == "movimento":
                 self.movimento_file_path = file_path
@@ -109,61 +375,92 @@ class ApplicationBanco(tk.Toplevel):
                 self.btn_select_ax.config(bg='green')
 
     def process_files(self):
+        if self.indicador.ocupado:
+            return  # Já existe um processamento em andamento nesta janela
         if self.movimento_file_path and self.ax_file_path:
-            self.loading_label = tk.Label(self.tab_nfs_e, text="Processando...", fg="blue")
-            self.loading_label.pack()
-            thread = threading.Thread(target=self.process_files_in_thread)
-            thread.start()
+            valores = self.conferir_valores.get()
+            tarefa = obter_agendador().enviar(
+                ('banco', self.ax_file_path, self.movimento_file_path, valores),
+                self.process_files_in_thread, self.ax_file_path, self.movimento_file_path, valores,
+            )
+            self.indicador.acompanhar(
+                tarefa,
+                ao_concluir=lambda resultados: self.show_processed(resultados, tarefa.medicao),
+                ao_falhar=lambda erro: self.show_failure(erro, tarefa.medicao),
+                ao_cancelar=lambda: self.show_cancelled(tarefa.medicao),
+            )
         else:
             messagebox.showerror("Erro", "Por favor, selecione ambos os arquivos antes de processar.")
 
-    def process_files_in_thread(self):
-        try:
-            self.consolidado_df = consolidar_planilhas_movimento(self.movimento_file_path)  # Armazena o DataFrame consolidado
-            self.last_result = comparar_consolidado_ax(self.consolidado_df, self.ax_file_path)
-            self.show_result(self.last_result)
-        except Exception as e:
-            messagebox.showerror("Erro", str(e))
-            self.show_error(str(e))
-        finally:
-            if self.loading_label:
-                self.loading_label.destroy()
-
-    def show_result(self, resultado):
-        self.text_result.delete('1.0', tk.END)
-        if not resultado.empty:
-            # Selecionando as colunas "Status", "Fatura" e "Conta de cliente"
-            resultado_filtrado = resultado[["Status", "Fatura", "Conta de cliente"]]
-
-            # Remover linhas onde o Status é NaN
-            resultado_filtrado = resultado_filtrado[resultado_filtrado['Status'].notna() & (resultado_filtrado['Status'] != 'Paga')]
-
-            # Ajustando a apresentação dos valores
-            resultado_filtrado['Fatura'] = resultado_filtrado['Fatura'].apply(lambda x: int(x) if isinstance(x, float) and x.is_integer() else x)
-
-            # Removendo o sufixo .0 da coluna "Conta de cliente"
-            resultado_filtrado['Conta de cliente'] = resultado_filtrado['Conta de cliente'].apply(lambda x: int(x) if isinstance(x, float) and x.is_integer() else x)
+    # Roda em uma thread do agendador: não acessa os widgets, que só são atualizados pelos callbacks do indicador
+    def process_files_in_thread(self, tarefa, ax_file_path, movimento_file_path, valores=False):
+        with tarefa.medir('banco_valores' if valores else 'banco', ax=ax_file_path, movimento=movimento_file_path) as medicao:
+            with medicao.etapa('Leitura banco'):
+                # Cada aba lida informa o andamento (e é o ponto em que o cancelamento é atendido)
+                consolidado_df = consolidar_planilhas_movimento(
+                    movimento_file_path, ao_concluir_aba=lambda nome, linhas, segundos: medicao.progresso(aba=nome, linhas_aba=linhas))
+            contar(medicao, 'banco', len(consolidado_df))
+            # A janela guarda o consolidado compacto e sem as colunas vazias (que a exportação descartaria)
+            consolidado_df = compactar_resultado(
+                consolidado_df, medicao, 'consolidado', chaves=('Nosso Número',),
+                colunas=[coluna for coluna in consolidado_df.columns if not str(coluna).startswith('Unnamed')])
+            if valores:
+                faturas, _ = conciliar_valores(consolidado_df, ax_da_janela(self, ax_file_path, medicao), medicao=medicao)
+                resultado = faturas[faturas['Situação'] != 'Conciliada']
+            else:
+                resultado = comparar_consolidado_ax(consolidado_df, ax_da_janela(self, ax_file_path, medicao), medicao)
+            return consolidado_df, compactar_resultado(resultado, medicao, chaves=('Fatura',))
+
+    def show_processed(self, resultados, medicao):
+        self.consolidado_df, self.last_result = resultados  # Armazena o DataFrame consolidado
+        self.show_result(self.last_result, medicao)
+
+    def show_failure(self, erro, medicao):
+        self.show_metrics(medicao)
+        self.show_error(str(erro))
+        messagebox.showerror("Erro", str(erro))
+
+    def show_cancelled(self, medicao):
+        self.show_metrics(medicao)
+        self.painel_resultado.mostrar_mensagem("Processamento cancelado.")
+
+    def show_result(self, resultado, medicao=None):
+        with etapa(medicao, 'Renderização'):
+            if not resultado.empty and 'Situação' in resultado.columns:
+                # Conferência de valores: as faturas em que os créditos não conferem com o valor
+                self.painel_resultado.mostrar(resultado[["Situação", "Fatura", "Conta de cliente", COLUNA_VALOR_AX, "Valor pago", "Diferença", "Créditos", "Origem"]])
+            elif not resultado.empty:
+                # Selecionando as colunas "Status", "Fatura" e "Conta de cliente"
+                resultado_filtrado = resultado[["Status", "Fatura", "Conta de cliente"]]
+
+                # Remover linhas onde o Status é NaN
+                resultado_filtrado = resultado_filtrado[resultado_filtrado['Status'].notna() & (resultado_filtrado['Status'] != 'Paga')]
+
+                # O painel remove o sufixo .0 de "Fatura" e "Conta de cliente" e exibe apenas a primeira página
+                self.painel_resultado.mostrar(resultado_filtrado)
+            else:
+                self.painel_resultado.mostrar_mensagem("Nenhuma correspondência encontrada.")
+        if medicao:
+            contar(medicao, 'resultado', len(resultado))
+            medicao.finalizar()
+            self.show_metrics(medicao)
 
-            self.text_result.insert(tk.END, resultado_filtrado.to_string(index=False))
-        else:
-            self.text_result.insert(tk.END, "Nenhuma correspondência encontrada.")
+    def show_metrics(self, medicao):
+        if medicao:
+            self.label_metricas.config(text=medicao.resumo())
 
     def show_error(self, message):
-        self.text_result.delete('1.0', tk.END)
-        self.text_result.insert(tk.END, message)
+        self.painel_resultado.mostrar_mensagem(message)
 
     def export_consolidado(self):
         if self.consolidado_df is not None:
-            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=FORMATOS_EXPORTACAO)
             if file_type:
                 # Remove colunas completamente vazias
                 self.consolidado_df = self.consolidado_df.loc[:, ~self.consolidado_df.columns.str.contains('^Unnamed')]
 
-                if file_type.endswith('.xlsx'):
-                    self.consolidado_df.to_excel(file_type, index=False)
-                elif file_type.endswith('.csv'):
-                    self.consolidado_df.to_csv(file_type, index=False)
-                messagebox.showinfo("Exportar", "Consolidado exportado com sucesso.")
+                # Grava em segundo plano, bloco a bloco, com o andamento no indicador
+                exportar_em_segundo_plano(self, self.consolidado_df, file_type, 'banco_consolidado_exportacao', 'linhas', "Consolidado exportado com sucesso.")
             else:
                 messagebox.showinfo("Ação necessária", "Exportação cancelada.")
         else:
@@ -171,26 +468,32 @@ class ApplicationBanco(tk.Toplevel):
 
     def export_result(self):
         if self.last_result is not None and not self.last_result.empty:
-            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=FORMATOS_EXPORTACAO)
             if file_type:
                 # Remove colunas completamente vazias
                 self.last_result = self.last_result.loc[:, ~self.last_result.columns.str.contains('^Unnamed')]
 
-                if file_type.endswith('.xlsx'):
-                    self.last_result.to_excel(file_type, index=False)
-                elif file_type.endswith('.csv'):
-                    self.last_result.to_csv(file_type, index=False)
-                messagebox.showinfo("Exportar", "Resultados exportados com sucesso.")
+                # Grava em segundo plano, bloco a bloco, com o andamento no indicador
+                exportar_em_segundo_plano(self, self.last_result, file_type, 'banco_exportacao', 'linhas', "Resultados exportados com sucesso.")
             else:
                 messagebox.showinfo("Ação necessária", "Exportação cancelada.")
         else:
             messagebox.showerror("Erro", "Nenhum resultado para exportar. Por favor, processe os arquivos primeiro.")
 
     def clear_results(self):
-        self.text_result.delete('1.0', tk.END)
+        self.painel_resultado.limpar()
+        self.label_metricas.config(text="")
         self.movimento_file_path = ""
         self.ax_file_path = ""
         self.consolidado_df = None  # Limpa o DataFrame consolidado
+        self.last_result = None
+        self.show_memory()
+
+    def show_memory(self):
+        """Memória do processo depois de liberar os resultados."""
+        liberar_memoria()
+        rss = memoria_rss()
+        self.label_metricas.config(text="" if rss is None else f"Memória do processo: {rss / MB:.0f} MB")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,499 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import Banco
+import Cache
+import Clinica
+import Comparador
+import Faturamento
+import Planilha
+from Chaves import contem, normalizar_chave
+from Compacto import tamanho
+from Exportacao import exportar
+from Planilha import juntar_blocos, ler_planilha
+from Sessao import COLUNAS_AX
+from Visualizacao import PainelPaginado, colunas_inteiras, formatar_inteiros
+
+# O Excel aceita até 1.048.576 linhas por aba (incluindo cabeçalhos e rodapé)
+LIMITE_LINHAS_EXCEL = 1_048_576
+PRIMEIRA_FATURA = 100_000
+STATUS = ['Aberta', 'Paga', 'Cancelada', 'Vencida']
+VARIANTES_PREFEITURA = {'nfs_e': 'Nº NFS-e', 'nota_fiscal': 'Nº da Nota Fiscal Eletrônica'}
+
+
+# ---------------------------------------------------------------------------
+# Geradores de planilhas sintéticas, no layout dos arquivos reais
+# ---------------------------------------------------------------------------
+
+def gravar(caminho, abas, encoding='utf-8'):
+    """Grava as abas [(nome, linhas_antes, df, linhas_depois)] em .xlsx ou a única aba em CSV delimitado por ;."""
+    if caminho.endswith('.csv'):
+        if len(abas) != 1:
+            raise ValueError("Um arquivo CSV tem apenas uma aba.")
+        _, antes, df, depois = abas[0]
+        with open(caminho, 'w', encoding=encoding, newline='') as arquivo:
+            escritor = csv.writer(arquivo, delimiter=';')
+            escritor.writerows(antes)
+            df.to_csv(arquivo, sep=';', index=False)
+            escritor.writerows(depois)
+        return caminho
+
+    # Modo somente escrita: as linhas vão direto para o arquivo, sem montar a planilha em memória
+    livro = openpyxl.Workbook(write_only=True)
+    for nome, antes, df, depois in abas:
+        if len(antes) + len(df) + len(depois) + 1 > LIMITE_LINHAS_EXCEL:
+            raise ValueError(f"A aba {nome} excede o limite de {LIMITE_LINHAS_EXCEL} linhas do Excel.")
+        aba = livro.create_sheet(nome)
+        for linha in antes:
+            aba.append(linha)
+        aba.append(list(df.columns))
+        colunas = [df.iloc[:, posicao].astype(object).where(df.iloc[:, posicao].notna(), None).tolist() for posicao in range(df.shape[1])]
+        for linha in zip(*colunas):
+            aba.append(linha)
+        for linha in depois:
+            aba.append(linha)
+    livro.save(caminho)
+    return caminho
+
+
+def _faturas(linhas):
+    return np.arange(PRIMEIRA_FATURA, PRIMEIRA_FATURA + linhas, dtype='int64')
+
+
+def _amostra(faturas, fracao, rng):
+    """Subconjunto das faturas, mantendo a ordem original."""
+    return faturas[np.sort(rng.choice(len(faturas), int(len(faturas) * fracao), replace=False))]
+
+
+def gerar_ax(caminho, linhas, semente=0):
+    """Exportação do AX: 11 linhas de cabeçalho do relatório e uma linha 'Total' no final.
+
+    Como no AX, o rótulo 'Total' fica na primeira coluna e a Fatura da linha de totais fica vazia.
+    """
+    rng = np.random.default_rng(semente)
+    df = pd.DataFrame({
+        'Conta de cliente': rng.integers(1000, 1000 + max(1, linhas // 50), linhas),
+        'Fatura': _faturas(linhas),
+        'Data': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, linhas), unit='D'),
+        'Status': rng.choice(STATUS, linhas),
+        'Valor': rng.integers(1000, 500_000, linhas) / 100,
+        'Cliente': rng.choice([f"Cliente {numero}" for numero in range(200)], linhas),
+    })
+    df['Data'] = df['Data'].dt.strftime('%d/%m/%Y')
+    antes = [['Relatório de faturas']] + [[]] * 9 + [['Gerado em', '01/01/2025']]
+    depois = [['Total', None, None, None, round(float(df['Valor'].sum()), 2), None]]
+    return gravar(caminho, [('AX', antes, df, depois)])
+
+
+def gerar_clinica(caminho, linhas, semente=1):
+    """Planilha da clínica: 90% das faturas do AX, em outra ordem, e 5% de notas que não existem no AX."""
+    rng = np.random.default_rng(semente)
+    faturas = _amostra(_faturas(linhas), 0.9, rng)
+    extras = np.arange(len(faturas) // 20, dtype='int64') + PRIMEIRA_FATURA + linhas + 10_000
+    nfax = rng.permutation(np.concatenate([faturas, extras]))
+    df = pd.DataFrame({
+        'NFAX': nfax,
+        'Paciente': rng.choice([f"Paciente {numero}" for numero in range(1000)], len(nfax)),
+        'Unidade': rng.choice(['Centro', 'Norte', 'Sul', 'Leste'], len(nfax)),
+        'Valor': rng.integers(1000, 500_000, len(nfax)) / 100,
+    })
+    return gravar(caminho, [('Clinica', [], df, [])])
+
+
+def gerar_prefeitura(caminho, linhas, variante='nfs_e', semente=2):
+    """Relatório da prefeitura (ISO-8859-1 em CSV), com a coluna 'Nº NFS-e' ou 'Nº da Nota Fiscal Eletrônica'."""
+    rng = np.random.default_rng(semente)
+    rps = _amostra(_faturas(linhas), 0.6, rng)
+    numeros = (np.arange(len(rps)) + 5000).astype('float64')
+    numeros[rng.random(len(rps)) < 0.02] = np.nan  # Notas ainda sem número
+    df = pd.DataFrame({
+        'Número do RPS': rps,
+        VARIANTES_PREFEITURA[variante]: pd.array(numeros).astype('Int64'),
+        'Razão Social do Tomador': rng.choice(['Ação Saúde Ltda', 'Clínica São José', 'Hospital Coração'], len(rps)),
+        'Valor dos Serviços': rng.integers(1000, 500_000, len(rps)) / 100,
+    })
+    return gravar(caminho, [('Prefeitura', [], df, [])], encoding='iso-8859-1')
+
+
+def gerar_emitidas(caminho, linhas, semente=3):
+    """Planilha de emitidas: 7 linhas de cabeçalho e colunas repetidas ('Cliente' duas vezes)."""
+    rng = np.random.default_rng(semente)
+    titulos = np.concatenate([_amostra(_faturas(linhas), 0.2, rng), np.arange(linhas // 100, dtype='int64') + 900_000_000])
+    clientes = rng.choice([f"Cliente {numero}" for numero in range(200)], len(titulos))
+    df = pd.DataFrame({
+        'Título': titulos,
+        'Nº da Nota Fiscal Eletrônica': np.arange(len(titulos)) + 1,
+        'Cliente': clientes,
+        'Cliente (razão social)': np.char.upper(clientes),
+    })
+    df.columns = ['Título', 'Nº da Nota Fiscal Eletrônica', 'Cliente', 'Cliente']
+    antes = [['Notas emitidas']] + [[]] * 5 + [['Período', '2024']]
+    return gravar(caminho, [('Emitidas', antes, df, [])])
+
+
+def gerar_banco(caminho, linhas, abas=10, semente=4):
+    """Movimentação bancária: uma aba por período, 3 linhas de cabeçalho, linha TOTAL e um resumo depois dela."""
+    rng = np.random.default_rng(semente)
+    pagas = _amostra(_faturas(linhas), 0.8, rng)
+    conteudo = []
+    for numero, parte in enumerate(np.array_split(pagas, abas), start=1):
+        df = pd.DataFrame({
+            'Nosso Número': parte,
+            'Data Pagamento': '10/01/2024',
+            'Valor Pago': rng.integers(1000, 500_000, len(parte)) / 100,
+            'Pagador': rng.choice(['Ação Saúde Ltda', 'Clínica São José'], len(parte)),
+        })
+        antes = [['Extrato de cobrança'], [f"Período {numero}"], []]
+        depois = [['TOTAL', None, round(float(df['Valor Pago'].sum()), 2)], [], ['Resumo', 'Títulos', len(df)]]
+        conteudo.append((f"Periodo {numero:02d}", antes, df, depois))
+    return gravar(caminho, conteudo)
+
+
+def gerar_arquivos(diretorio, linhas, formato):
+    """Gera (ou reaproveita) os arquivos de um tamanho e formato. O banco é sempre .xlsx, pois tem várias abas."""
+    os.makedirs(diretorio, exist_ok=True)
+    geradores = {
+        'ax': (gerar_ax, formato, {}),
+        'clinica': (gerar_clinica, formato, {}),
+        'prefeitura_nfs_e': (gerar_prefeitura, formato, {'variante': 'nfs_e'}),
+        'prefeitura_nota_fiscal': (gerar_prefeitura, formato, {'variante': 'nota_fiscal'}),
+        'emitidas': (gerar_emitidas, formato, {}),
+        'banco': (gerar_banco, 'xlsx', {}),
+    }
+    arquivos = {}
+    for nome, (gerador, extensao, opcoes) in geradores.items():
+        caminho = os.path.join(diretorio, f"{nome}_{linhas}.{extensao}")
+        if not os.path.exists(caminho):
+            temporario = f"{caminho}.{os.getpid()}.tmp.{extensao}"
+            try:
+                gerador(temporario, linhas, **opcoes)
+            except ValueError as e:
+                arquivos[nome] = e
+                continue
+            os.replace(temporario, caminho)
+        arquivos[nome] = caminho
+    return arquivos
+
+
+# ---------------------------------------------------------------------------
+# Medição das etapas de cada conciliação
+# ---------------------------------------------------------------------------
+
+class Cronometro:
+    """Acumula o tempo de cada etapa medida com `with cronometro.etapa(nome)` e a memória dos DataFrames de cada etapa."""
+
+    def __init__(self):
+        self.tempos = {}
+        self.memoria = {}
+
+    def medir_memoria(self, nome, *dfs):
+        self.memoria[nome] = sum(tamanho(df) for df in dfs)
+
+    @contextlib.contextmanager
+    def etapa(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tempos[nome] = self.tempos.get(nome, 0.0) + time.perf_counter() - inicio
+
+
+def _renderizar(*resultados):
+    # Como o PainelPaginado: colunas inteiras do resultado e texto formatado da primeira página
+    for df in resultados:
+        formatar_inteiros(df.iloc[:PainelPaginado.TAMANHO_PAGINA], colunas_inteiras(df)).to_string(index=False)
+
+
+def _exportar(pasta, formato, *resultados):
+    # Como o botão "Exportar" das janelas
+    for numero, df in enumerate(resultados):
+        exportar(df, os.path.join(pasta, f"resultado_{numero}.{formato}"))
+
+
+def _total(cronometro, conciliar):
+    # Primeiro com o cache vazio e depois com as planilhas já no cache
+    Cache.limpar_cache()
+    with cronometro.etapa('total'):
+        conciliar()
+    with cronometro.etapa('total_em_cache'):
+        conciliar()
+
+
+def medir_clinica(arquivos, formato, pasta):
+    cronometro = Cronometro()
+    with cronometro.etapa('leitura'):
+        ax_df = ler_planilha(arquivos['ax'], skiprows=11, colunas=COLUNAS_AX, usar_cache=False)
+        clinica_df = ler_planilha(arquivos['clinica'], colunas=Clinica.COLUNAS_CLINICA, usar_cache=False)
+    cronometro.medir_memoria('leitura', ax_df, clinica_df)
+    with cronometro.etapa('normalizacao'):
+        ax_df = Clinica.remover_total(ax_df, 'Fatura')
+        ax_df['Fatura'] = normalizar_chave(ax_df['Fatura'])
+        clinica_df['NFAX'] = normalizar_chave(clinica_df['NFAX'])
+    with cronometro.etapa('juncao'):
+        faltando_no_ax = ax_df.loc[~contem(ax_df['Fatura'], clinica_df['NFAX']), ['Fatura']].drop_duplicates()
+        faltando_na_clinica = clinica_df.loc[~contem(clinica_df['NFAX'], ax_df['Fatura']), ['NFAX']].drop_duplicates()
+    with cronometro.etapa('renderizacao'):
+        _renderizar(faltando_na_clinica, faltando_no_ax)
+    with cronometro.etapa('exportacao'):
+        _exportar(pasta, formato, faltando_na_clinica, faltando_no_ax)
+    _total(cronometro, lambda: Clinica.comparar_planilhas(arquivos['ax'], arquivos['clinica']))
+    return cronometro, len(faltando_na_clinica) + len(faltando_no_ax)
+
+
+def _medir_comparador(arquivos, formato, pasta, variante):
+    prefeitura = arquivos['prefeitura_' + variante]
+    cronometro = Cronometro()
+    with cronometro.etapa('leitura'):
+        ax_df = ler_planilha(arquivos['ax'], skiprows=11, colunas=COLUNAS_AX, usar_cache=False)
+        prefeitura_df = ler_planilha(prefeitura, colunas=Comparador.COLUNAS_PREFEITURA, usar_cache=False)
+    cronometro.medir_memoria('leitura', ax_df, prefeitura_df)
+    with cronometro.etapa('normalizacao'):
+        ax_df['Fatura'] = normalizar_chave(ax_df['Fatura'])
+        prefeitura_df['Número do RPS'] = normalizar_chave(prefeitura_df['Número do RPS'])
+    with cronometro.etapa('juncao'):
+        resultado = Comparador.juntar_nfs_e(ax_df, prefeitura_df)
+    with cronometro.etapa('renderizacao'):
+        _renderizar(resultado)
+    with cronometro.etapa('exportacao'):
+        _exportar(pasta, formato, resultado)
+    _total(cronometro, lambda: Comparador.encontrar_nfs_e(arquivos['ax'], prefeitura))
+    if formato == 'csv':
+        with cronometro.etapa('total_em_blocos'):
+            juntar_blocos(Comparador.encontrar_nfs_e_em_blocos(arquivos['ax'], prefeitura), ['Fatura', 'Status'])
+    return cronometro, len(resultado)
+
+
+def medir_comparador_nfs_e(arquivos, formato, pasta):
+    return _medir_comparador(arquivos, formato, pasta, 'nfs_e')
+
+
+def medir_comparador_nota_fiscal(arquivos, formato, pasta):
+    return _medir_comparador(arquivos, formato, pasta, 'nota_fiscal')
+
+
+def medir_faturamento(arquivos, formato, pasta):
+    cronometro = Cronometro()
+    with cronometro.etapa('leitura'):
+        ax_df = ler_planilha(arquivos['ax'], skiprows=11, colunas=COLUNAS_AX, usar_cache=False)
+        emitidas_df = ler_planilha(arquivos['emitidas'], skiprows=7, colunas=Faturamento.COLUNAS_FATURAMENTO, usar_cache=False)
+    cronometro.medir_memoria('leitura', ax_df, emitidas_df)
+    with cronometro.etapa('normalizacao'):
+        ax_df['Fatura'] = normalizar_chave(ax_df['Fatura'])
+        emitidas_df['Título'] = normalizar_chave(emitidas_df['Título'])
+    with cronometro.etapa('juncao'):
+        resultado = emitidas_df.loc[~contem(emitidas_df['Título'], ax_df['Fatura']), ['Título']]
+    with cronometro.etapa('renderizacao'):
+        _renderizar(resultado)
+    with cronometro.etapa('exportacao'):
+        _exportar(pasta, formato, resultado)
+    _total(cronometro, lambda: Faturamento.encontrar_nfs_e(arquivos['ax'], arquivos['emitidas']))
+    if formato == 'csv':
+        with cronometro.etapa('total_em_blocos'):
+            juntar_blocos(Faturamento.encontrar_nfs_e_em_blocos(arquivos['ax'], arquivos['emitidas']), ['Título'])
+    return cronometro, len(resultado)
+
+
+def medir_banco(arquivos, formato, pasta):
+    cronometro = Cronometro()
+    with cronometro.etapa('leitura'):
+        consolidado_df = Banco.consolidar_planilhas_movimento(arquivos['banco'])
+        ax_df = ler_planilha(arquivos['ax'], skiprows=11, colunas=COLUNAS_AX, usar_cache=False)
+    cronometro.medir_memoria('leitura', consolidado_df, ax_df)
+    with cronometro.etapa('normalizacao'):
+        ax_df['Fatura'] = normalizar_chave(ax_df['Fatura'])
+        nosso_numero = normalizar_chave(consolidado_df['Nosso Número'])
+    with cronometro.etapa('juncao'):
+        resultado = ax_df[~contem(ax_df['Fatura'], nosso_numero)]
+    with cronometro.etapa('renderizacao'):
+        _renderizar(resultado)
+    with cronometro.etapa('exportacao'):
+        _exportar(pasta, formato, resultado)
+    _total(cronometro, lambda: Banco.comparar_consolidado_ax(Banco.consolidar_planilhas_movimento(arquivos['banco']), arquivos['ax']))
+    return cronometro, len(resultado)
+
+
+# Cada medição usa as planilhas indicadas; sem alguma delas (por exemplo, acima do limite do Excel), é ignorada
+PIPELINES = {
+    'clinica': (medir_clinica, ['ax', 'clinica']),
+    'comparador_nfs_e': (medir_comparador_nfs_e, ['ax', 'prefeitura_nfs_e']),
+    'comparador_nota_fiscal': (medir_comparador_nota_fiscal, ['ax', 'prefeitura_nota_fiscal']),
+    'faturamento': (medir_faturamento, ['ax', 'emitidas']),
+    'banco': (medir_banco, ['ax', 'banco']),
+}
+
+
+def executar(tamanhos, formatos, pipelines, diretorio, repeticoes=1, ao_medir=None, backends=('numpy',)):
+    """Mede cada conciliação em cada tamanho, formato e backend (veja Planilha.DTYPE_BACKEND) e devolve uma medição
+    por etapa (o menor tempo das repetições); a etapa de leitura traz também a memória das planilhas lidas."""
+    medicoes = []
+    cache_original = Cache.CACHE_DIR
+    backend_original = Planilha.DTYPE_BACKEND
+    with tempfile.TemporaryDirectory() as temporario:
+        # O cache do benchmark fica separado do cache do usuário
+        Cache.CACHE_DIR = os.path.join(temporario, 'cache')
+        try:
+            for linhas in tamanhos:
+                for formato in formatos:
+                    arquivos = gerar_arquivos(diretorio, linhas, formato)
+                    for nome, backend in ((nome, backend) for nome in pipelines for backend in backends):
+                        Planilha.DTYPE_BACKEND = backend
+                        medir, necessarios = PIPELINES[nome]
+                        ausentes = [str(arquivos[arquivo]) for arquivo in necessarios if isinstance(arquivos[arquivo], Exception)]
+                        if ausentes:
+                            medicao = {'pipeline': nome, 'formato': formato, 'linhas': linhas, 'backend': backend, 'ignorado': '; '.join(ausentes)}
+                            medicoes.append(medicao)
+                            if ao_medir:
+                                ao_medir(medicao)
+                            continue
+                        melhores = {}
+                        for _ in range(repeticoes):
+                            cronometro, linhas_resultado = medir(arquivos, formato, temporario)
+                            for etapa, segundos in cronometro.tempos.items():
+                                melhores[etapa] = min(segundos, melhores.get(etapa, segundos))
+                        for etapa, segundos in melhores.items():
+                            medicao = {'pipeline': nome, 'formato': formato, 'linhas': linhas, 'backend': backend, 'etapa': etapa,
+                                       'segundos': round(segundos, 4), 'linhas_resultado': linhas_resultado}
+                            if etapa in cronometro.memoria:
+                                medicao['memoria_mb'] = round(cronometro.memoria[etapa] / (1024 * 1024), 1)
+                            medicoes.append(medicao)
+                            if ao_medir:
+                                ao_medir(medicao)
+        finally:
+            Cache.CACHE_DIR = cache_original
+            Planilha.DTYPE_BACKEND = backend_original
+    return medicoes
+
+
+def _chave(medicao, backend=True):
+    # Relatórios anteriores ao backend pyarrow foram medidos com o padrão (numpy)
+    chave = medicao['pipeline'], medicao['formato'], medicao['linhas'], medicao.get('etapa')
+    return chave + (medicao.get('backend', 'numpy'),) if backend else chave
+
+
+def comparar_backends(medicoes, referencia='numpy'):
+    """Razão entre cada backend e o de referência, etapa a etapa: tempo e memória (abaixo de 1, o backend é melhor)."""
+    base = {_chave(medicao, backend=False): medicao for medicao in medicoes
+            if 'segundos' in medicao and medicao.get('backend', 'numpy') == referencia}
+    razoes = []
+    for medicao in medicoes:
+        anterior = base.get(_chave(medicao, backend=False))
+        if 'segundos' not in medicao or anterior is None or medicao.get('backend', 'numpy') == referencia:
+            continue
+        razao = dict(medicao, referencia=referencia,
+                     razao_tempo=round(medicao['segundos'] / anterior['segundos'], 3) if anterior['segundos'] else None)
+        if medicao.get('memoria_mb') is not None and anterior.get('memoria_mb'):
+            razao['razao_memoria'] = round(medicao['memoria_mb'] / anterior['memoria_mb'], 3)
+        razoes.append(razao)
+    return razoes
+
+
+def comparar(medicoes, anteriores, tolerancia=0.2, minimo=0.05):
+    """Acrescenta o tempo anterior e a razão a cada medição; regressão é ficar acima de (1 + tolerancia) vezes o anterior
+    com pelo menos `minimo` segundos de diferença, para não acusar ruído em etapas muito curtas."""
+    referencia = {_chave(medicao): medicao for medicao in anteriores if 'segundos' in medicao}
+    regressoes = []
+    for medicao in medicoes:
+        anterior = referencia.get(_chave(medicao))
+        if 'segundos' not in medicao or anterior is None:
+            continue
+        medicao['anterior'] = anterior['segundos']
+        medicao['razao'] = round(medicao['segundos'] / anterior['segundos'], 3) if anterior['segundos'] else None
+        medicao['regressao'] = (medicao['segundos'] > anterior['segundos'] * (1 + tolerancia)
+                                and medicao['segundos'] - anterior['segundos'] >= minimo)
+        if medicao['regressao']:
+            regressoes.append(medicao)
+    return regressoes
+
+
+def formatar_medicao(medicao):
+    inicio = f"{medicao['pipeline']:<24} {medicao['formato']:<5} {medicao['linhas']:>9} {medicao.get('backend', 'numpy'):<7}"
+    if 'ignorado' in medicao:
+        return f"{inicio}  ignorado: {medicao['ignorado']}"
+    texto = f"{inicio}  {medicao['etapa']:<16} {medicao['segundos']:9.3f}s"
+    if 'memoria_mb' in medicao:
+        texto += f" {medicao['memoria_mb']:8.1f} MB"
+    if 'razao_tempo' in medicao:
+        texto += f"  x{medicao['razao_tempo']} do tempo"
+        if 'razao_memoria' in medicao:
+            texto += f", x{medicao['razao_memoria']} da memória"
+        texto += f" ({medicao['referencia']})"
+    if 'anterior' in medicao:
+        texto += f"  anterior {medicao['anterior']:9.3f}s  x{medicao['razao']}"
+        if medicao['regressao']:
+            texto += "  REGRESSÃO"
+    return texto
+
+
+def _versao_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow.__version__
+
+
+def ambiente():
+    return {
+        'data': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': _versao_pyarrow(),
+        'sistema': platform.platform(),
+        'processadores': os.cpu_count(),
+        'motor_excel': os.environ.get('NFSE_MOTOR_EXCEL', 'auto'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o desempenho das conciliações com planilhas sintéticas.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000], help="Tamanhos (linhas do AX), de 10 mil a 5 milhões")
+    parser.add_argument('--formatos', nargs='+', choices=['xlsx', 'csv'], default=['xlsx', 'csv'])
+    parser.add_argument('--pipelines', nargs='+', choices=sorted(PIPELINES), default=list(PIPELINES))
+    parser.add_argument('--diretorio', default=os.path.join(tempfile.gettempdir(), 'nfse_benchmark'), help="Onde os arquivos sintéticos são gerados e reaproveitados")
+    parser.add_argument('--repeticoes', type=int, default=1, help="Repetições de cada medição (vale o menor tempo)")
+    parser.add_argument('--backends', nargs='+', choices=['numpy', 'pyarrow'], default=['numpy'],
+                        help="Tipos das colunas lidas (veja NFSE_DTYPE_BACKEND); com os dois, o pyarrow é comparado ao numpy")
+    parser.add_argument('--saida', default='benchmark.json', help="Relatório JSON")
+    parser.add_argument('--comparar', help="Relatório JSON anterior para comparação")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Aumento relativo aceito antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    medicoes = executar(args.linhas, args.formatos, args.pipelines, args.diretorio, args.repeticoes,
+                        ao_medir=lambda medicao: print(formatar_medicao(medicao), flush=True), backends=args.backends)
+
+    razoes = comparar_backends(medicoes)
+    if razoes:
+        print("\nComparação entre os backends:")
+        for razao in razoes:
+            print(formatar_medicao(razao))
+
+    regressoes = []
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anteriores = json.load(f)['medicoes']
+        regressoes = comparar(medicoes, anteriores, args.tolerancia)
+        print(f"\nComparação com {args.comparar}:")
+        for medicao in medicoes:
+            if 'anterior' in medicao:
+                print(formatar_medicao(medicao))
+
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump({'ambiente': ambiente(), 'medicoes': medicoes, 'backends': razoes}, f, ensure_ascii=False, indent=2)
+    print(f"\n{len(medicoes)} medição(ões) gravada(s) em {args.saida}; {len(regressoes)} regressão(ões)")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+
+# Diretório e tamanho máximo do cache local (podem ser alterados por variáveis de ambiente)
+CACHE_DIR = os.environ.get('NFSE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'nfse_cancelamento'))
+TAMANHO_MAXIMO = int(os.environ.get('NFSE_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+EXTENSOES = ('.parquet', '.pkl')
+
+logger = logging.getLogger(__name__)
+
+
+def identificar(caminho, **parametros):
+    """Gera a chave do cache a partir do caminho, tamanho, data de modificação e parâmetros de leitura."""
+    info = os.stat(caminho)
+    identidade = {
+        'caminho': os.path.abspath(caminho),
+        'tamanho': info.st_size,
+        'mtime': info.st_mtime_ns,
+        'parametros': parametros,
+    }
+    texto = json.dumps(identidade, sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest(), identidade
+
+
+def _arquivo_dados(chave):
+    for extensao in EXTENSOES:
+        arquivo = os.path.join(CACHE_DIR, chave + extensao)
+        if os.path.exists(arquivo):
+            return arquivo
+    return None
+
+
+def _ler_dados(arquivo):
+    if arquivo.endswith('.parquet'):
+        return pd.read_parquet(arquivo)
+    return pd.read_pickle(arquivo)
+
+
+def _gravar_dados(df, chave):
+    """Grava em Parquet; se o DataFrame não for compatível (colunas com tipos mistos), usa pickle."""
+    destino = os.path.join(CACHE_DIR, chave + '.parquet')
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    try:
+        df.to_parquet(temporario, index=True)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        destino = os.path.join(CACHE_DIR, chave + '.pkl')
+        temporario = f'{destino}.{os.getpid()}.tmp'
+        df.to_pickle(temporario)
+    os.replace(temporario, destino)
+    return destino
+
+
+def obter_ou_ler(caminho, leitor, **parametros):
+    """Retorna o DataFrame do cache ou executa o leitor e armazena o resultado."""
+    chave, identidade = identificar(caminho, **parametros)
+    arquivo = _arquivo_dados(chave)
+    if arquivo:
+        try:
+            df = _ler_dados(arquivo)
+            os.utime(arquivo)  # Marca o acesso para a política LRU
+            logger.info("%s: lido do cache", os.path.basename(caminho))
+            return df
+        except Exception:
+            remover_entrada(chave)
+
+    df = leitor()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        remover_versoes_antigas(identidade)
+        _gravar_dados(df, chave)
+        with open(os.path.join(CACHE_DIR, chave + '.json'), 'w', encoding='utf-8') as meta:
+            json.dump(dict(identidade, criado_em=time.time()), meta, default=str)
+        aplicar_limite()
+    except OSError:
+        pass  # Falha ao gravar o cache não deve impedir a leitura
+    return df
+
+
+def listar_cache():
+    """Lista as entradas do cache, da mais recente para a mais antiga."""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    entradas = []
+    for nome in os.listdir(CACHE_DIR):
+        chave, extensao = os.path.splitext(nome)
+        if extensao not in EXTENSOES:
+            continue
+        arquivo = os.path.join(CACHE_DIR, nome)
+        meta = {}
+        try:
+            with open(os.path.join(CACHE_DIR, chave + '.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        info = os.stat(arquivo)
+        entradas.append({
+            'chave': chave,
+            'arquivo': arquivo,
+            'origem': meta.get('caminho'),
+            'parametros': meta.get('parametros'),
+            'versao': (meta.get('tamanho'), meta.get('mtime')),
+            'bytes': info.st_size,
+            'ultimo_acesso': info.st_mtime,
+        })
+    return sorted(entradas, key=lambda entrada: entrada['ultimo_acesso'], reverse=True)
+
+
+def remover_entrada(chave):
+    for extensao in EXTENSOES + ('.json',):
+        arquivo = os.path.join(CACHE_DIR, chave + extensao)
+        if os.path.exists(arquivo):
+            os.remove(arquivo)
+
+
+def remover_versoes_antigas(identidade):
+    """Remove as entradas de versões anteriores do mesmo arquivo de origem."""
+    versao = (identidade['tamanho'], identidade['mtime'])
+    for entrada in listar_cache():
+        if entrada['origem'] == identidade['caminho'] and entrada['versao'] != versao:
+            remover_entrada(entrada['chave'])
+
+
+def limpar_cache(caminho=None):
+    """Remove todas as entradas do cache, ou apenas as do arquivo informado. Retorna a quantidade removida."""
+    origem = os.path.abspath(caminho) if caminho else None
+    removidas = 0
+    for entrada in listar_cache():
+        if origem is None or entrada['origem'] == origem:
+            remover_entrada(entrada['chave'])
+            removidas += 1
+    return removidas
+
+
+def aplicar_limite(tamanho_maximo=None):
+    """Remove as entradas menos usadas até o cache caber no tamanho máximo."""
+    limite = TAMANHO_MAXIMO if tamanho_maximo is None else tamanho_maximo
+    entradas = listar_cache()
+    total = sum(entrada['bytes'] for entrada in entradas)
+    while entradas and total > limite:
+        entrada = entradas.pop()
+        remover_entrada(entrada['chave'])
+        total -= entrada['bytes']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerencia o cache de planilhas lidas.")
+    parser.add_argument('--listar', action='store_true', help="Lista as entradas do cache")
+    parser.add_argument('--limpar', action='store_true', help="Remove as entradas do cache")
+    parser.add_argument('--caminho', help="Restringe a limpeza a um arquivo de origem")
+    args = parser.parse_args()
+
+    if args.limpar:
+        print(f"{limpar_cache(args.caminho)} entrada(s) removida(s).")
+    else:
+        entradas = listar_cache()
+        for entrada in entradas:
+            acesso = time.strftime('%d/%m/%Y %H:%M', time.localtime(entrada['ultimo_acesso']))
+            print(f"{entrada['chave'][:12]}  {entrada['bytes'] / 1024 / 1024:8.1f} MB  {acesso}  {entrada['origem']}")
+        print(f"Total: {len(entradas)} entrada(s) em {CACHE_DIR}")
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+# Valor usado no lugar das chaves vazias: os números de fatura, RPS e NFS-e nunca são negativos.
+# Assim, como no isin e no merge do pandas, uma chave vazia casa com outra chave vazia.
+NULO = -1
+
+# Chaves preenchidas que não são números (ou têm mais de 18 dígitos) não viram vazias: recebem um
+# código negativo, menor que NULO, calculado a partir do texto. Assim só casam com o mesmo texto,
+# como na comparação de textos, e nunca com uma chave vazia ou numérica.
+
+# Até 18 dígitos cabem em int64 sem perda de precisão
+_PADRAO_NUMERO = r'^\s*(\d{1,18})(?:\.0*)?\s*$'
+_PADRAO_NUMERO_ARROW = r'^\s*(?P<numero>\d{1,18})(?:\.0*)?\s*$'  # O extract_regex do Arrow exige o grupo nomeado
+
+# Tipo das chaves normalizadas de colunas Arrow (veja Planilha.DTYPE_BACKEND)
+INT64_ARROW = 'int64[pyarrow]'
+
+
+def normalizar_chave(serie):
+    """Converte uma coluna de chave (Fatura, NFAX, Título, Número do RPS, Nosso Número) em Int64.
+
+    Números inteiros e textos como '123' ou '123.0' viram 123; valores vazios viram <NA>. Valores
+    não numéricos, com casas decimais ou com mais de 18 dígitos viram um código negativo do texto
+    (veja codigos_texto). Colunas Arrow continuam em Arrow (int64[pyarrow]).
+    """
+    if isinstance(serie.dtype, pd.ArrowDtype):
+        return _normalizar_chave_arrow(serie)
+
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return serie.astype('Int64')
+
+    if pd.api.types.is_float_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+        validos = np.isfinite(valores) & (valores == np.floor(valores)) & (np.abs(valores) < 2 ** 63)
+        inteiros = np.where(validos, valores, 0).astype('int64')
+        textos = ~validos & ~np.isnan(valores)
+        inteiros[textos] = codigos_texto(valores[textos].astype(str))
+        return pd.Series(pd.arrays.IntegerArray(inteiros, ~(validos | textos)), index=serie.index, name=serie.name)
+
+    if isinstance(serie.dtype, pd.StringDtype) and serie.dtype.storage == 'pyarrow':
+        # Textos já guardados em Arrow: os dígitos são extraídos sem criar um objeto Python por linha.
+        # O astype('Int64') passaria os códigos negativos por float, por isso a conversão é feita aqui
+        chaves = _digitos_arrow(serie)
+        inteiros = chaves.to_numpy(dtype='int64', na_value=0)
+        return pd.Series(pd.arrays.IntegerArray(inteiros, chaves.isna().to_numpy()), index=serie.index, name=serie.name)
+
+    # Texto ou tipos mistos: extrai os dígitos e converte sem passar por float
+    textos = serie.astype('string').str.strip()
+    digitos = textos.str.extract(_PADRAO_NUMERO, expand=False)
+    validos = digitos.notna().to_numpy()
+    preenchidos = textos.fillna('').to_numpy(dtype=object) != ''
+    inteiros = np.zeros(len(serie), dtype='int64')
+    inteiros[validos] = digitos[validos].to_numpy(dtype=str).astype('int64')
+    sem_numero = preenchidos & ~validos
+    inteiros[sem_numero] = codigos_texto(textos[sem_numero].to_numpy(dtype=object))
+    return pd.Series(pd.arrays.IntegerArray(inteiros, ~preenchidos), index=serie.index, name=serie.name)
+
+
+def codigos_texto(textos):
+    """Código int64 de cada texto, sempre menor que NULO e igual para textos iguais em qualquer execução."""
+    hashes = pd.util.hash_array(np.asarray(textos, dtype=object))
+    return -(hashes >> np.uint64(2)).astype('int64') - 2
+
+
+def _digitos_arrow(serie):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    textos = pc.utf8_trim_whitespace(pa.array(serie.array))
+    digitos = pc.cast(pc.struct_field(pc.extract_regex(textos, _PADRAO_NUMERO_ARROW), [0]), pa.int64())
+    sem_numero = pc.fill_null(pc.and_(pc.is_null(digitos), pc.greater(pc.utf8_length(textos), 0)), False)
+    if pc.any(sem_numero).as_py():
+        # Poucas linhas, em geral: os códigos são calculados só para elas
+        posicoes = np.flatnonzero(sem_numero.to_numpy(zero_copy_only=False))
+        codigos = np.zeros(len(textos), dtype='int64')
+        codigos[posicoes] = codigos_texto(textos.take(posicoes).to_numpy(zero_copy_only=False))
+        digitos = pc.if_else(sem_numero, pa.array(codigos), digitos)
+    return pd.Series(pd.arrays.ArrowExtensionArray(digitos), index=serie.index, name=serie.name)
+
+
+def _normalizar_chave_arrow(serie):
+    import pyarrow as pa
+
+    tipo = serie.dtype.pyarrow_dtype
+    if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+        return _digitos_arrow(serie)
+    if pa.types.is_integer(tipo):
+        return serie.astype(INT64_ARROW)
+    # Decimais e demais tipos: convertidos como as colunas NumPy e devolvidos em Arrow
+    if pa.types.is_floating(tipo):
+        numpy = pd.Series(serie.to_numpy(dtype='float64', na_value=np.nan), index=serie.index, name=serie.name)
+    else:
+        numpy = serie.astype(object)
+    return normalizar_chave(numpy).astype(INT64_ARROW)
+
+
+def valores_chave(chaves):
+    """Retorna a chave normalizada como array int64, com NULO no lugar das chaves vazias."""
+    if not isinstance(chaves.dtype, pd.Int64Dtype) and chaves.dtype != INT64_ARROW:
+        chaves = normalizar_chave(chaves)
+    return chaves.to_numpy(dtype='int64', na_value=NULO)
+
+
+def indexar(chaves):
+    """Ordena as chaves uma única vez para várias consultas. Retorna (chaves ordenadas, posições originais)."""
+    valores = valores_chave(chaves)
+    ordem = np.argsort(valores, kind='stable')
+    return valores[ordem], ordem
+
+
+def _indice(referencia):
+    return referencia if isinstance(referencia, tuple) else indexar(referencia)
+
+
+def contem(chaves, referencia):
+    """Máscara das chaves presentes na referência (Series ou resultado de indexar), por busca binária."""
+    ordenados, _ = _indice(referencia)
+    valores = valores_chave(chaves)
+    if len(ordenados) == 0:
+        return np.zeros(len(valores), dtype=bool)
+    posicoes = np.minimum(np.searchsorted(ordenados, valores), len(ordenados) - 1)
+    return ordenados[posicoes] == valores
+
+
+def juntar(chaves_esquerda, referencia, como='left'):
+    """Junta as chaves da esquerda com a referência, como o pd.merge.
+
+    Retorna as posições das linhas da esquerda e da direita de cada linha do resultado, na ordem
+    do merge (esquerda e, para cada chave, as linhas da direita na ordem original). Com como='left',
+    as linhas sem correspondência recebem a posição -1 na direita.
+    """
+    ordenados, ordem = _indice(referencia)
+    valores = valores_chave(chaves_esquerda)
+    inicio = np.searchsorted(ordenados, valores, side='left')
+    quantidade = np.searchsorted(ordenados, valores, side='right') - inicio
+
+    linhas = np.maximum(quantidade, 1) if como == 'left' else quantidade
+    posicoes_esquerda = np.repeat(np.arange(len(valores)), linhas)
+    deslocamento = np.arange(linhas.sum()) - np.repeat(np.cumsum(linhas) - linhas, linhas)
+    encontrou = np.repeat(quantidade, linhas) > 0
+    posicoes_direita = np.full(len(posicoes_esquerda), -1, dtype='int64')
+    posicoes_direita[encontrou] = ordem[np.repeat(inicio, linhas)[encontrou] + deslocamento[encontrou]]
+    return posicoes_esquerda, posicoes_direita
+
+
+def combinar(esquerda, direita, posicoes_esquerda, posicoes_direita):
+    """Monta o DataFrame do resultado de juntar; as colunas da direita ficam vazias onde a posição é -1."""
+    resultado = esquerda.iloc[posicoes_esquerda].reset_index(drop=True)
+    for coluna in direita.columns:
+        resultado[coluna] = direita[coluna].array.take(posicoes_direita, allow_fill=True)
+    return resultado
@@ -1,51 +1,210 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import threading
-
-def ler_planilha(caminho, skiprows=None):
-    """Lê a planilha especificada e retorna um DataFrame."""
-    extensao = caminho.split('.')[-1].lower()
-    leitores = {
-        'xlsx': lambda: pd.read_excel(caminho, skiprows=skiprows, engine='openpyxl'),
-        'xls': lambda: pd.read_excel(caminho, skiprows=skiprows, engine='openpyxl'),
-        'csv': lambda: pd.read_csv(caminho, skiprows=skiprows, delimiter=';')
-    }
-    try:
-        return leitores.get(extensao, lambda: ValueError("Formato não suportado"))()
-    except Exception as e:
-        raise ValueError(f"Erro ao abrir o arquivo: {e}")
-
-def converter_para_string(df, coluna):
-    """Converte uma coluna numérica para string removendo casas decimais."""
-    df[coluna] = df[coluna].astype(str).str.split('.').str[0]
-    return df
 
-def remover_total(df):
-    """Remove a última linha se ela contiver 'Total'."""
-    if 'Total' in df.iloc[-1].to_string():
+from Chaves import contem, juntar, normalizar_chave
+from Compacto import compactar_resultado, liberar_memoria
+from Historico import registrar
+from Metricas import MB, contar, etapa, memoria_rss
+from Planilha import ler_planilha
+from Sessao import PlanilhaAX, arquivos_ax, ax_da_janela, caminho_ax_da_sessao
+from Exportacao import FORMATOS_EXPORTACAO
+from Tarefas import obter_agendador
+from Visualizacao import IndicadorProgresso, TabelaVirtual, exportar_em_segundo_plano, selecionar_planilhas_ax
+
+# Colunas lidas da planilha da clínica; a chave é lida como texto e convertida sem passar por float
+COLUNAS_CLINICA = {'NFAX': str}
+
+# Faturas do AX de contas que não pertencem a nenhuma unidade conciliada
+SEM_UNIDADE = '(sem unidade)'
+EXTENSOES = ('.xlsx', '.xls', '.csv')
+
+def remover_total(df, coluna=None):
+    """Remove a última linha se ela contiver 'Total'.
+
+    Como só as colunas usadas são lidas, o texto 'Total' pode ter ficado de fora;
+    nesse caso a linha de totais é reconhecida pela coluna chave vazia.
+    """
+    ultima = df.iloc[-1]
+    if 'Total' in ultima.to_string() or (coluna is not None and pd.isna(ultima[coluna])):
         return df.iloc[:-1]
     return df
 
-def comparar_planilhas(planilha_ax, planilha_clinica):
-    ax_df = remover_total(ler_planilha(planilha_ax, skiprows=11))  # Lê e remove totais
-    clinica_df = ler_planilha(planilha_clinica)  # Lê a Planilha Clínica diretamente
+# planilha_ax é o caminho da planilha ou a PlanilhaAX já carregada na sessão.
+# Com medicao, o tempo e a memória de cada etapa são registrados (veja Metricas)
+def comparar_planilhas(planilha_ax, planilha_clinica, medicao=None):
+    ax_df = remover_total(PlanilhaAX.obter(planilha_ax, medicao).colunas('Fatura'), 'Fatura')  # Remove totais
+    with etapa(medicao, 'Leitura clínica'):
+        clinica_df = ler_planilha(planilha_clinica, colunas=COLUNAS_CLINICA)  # Lê a Planilha Clínica diretamente
+    contar(medicao, 'clínica', len(clinica_df))
 
-    ax_df = converter_para_string(ax_df, 'Fatura')
-    clinica_df = converter_para_string(clinica_df, 'NFAX')
+    with etapa(medicao, 'Normalização'):
+        clinica_df['NFAX'] = normalizar_chave(clinica_df['NFAX'])
+    registrar('clinica', planilha_clinica, clinica_df, medicao)
 
-    faltando_no_ax = ax_df.loc[~ax_df['Fatura'].isin(clinica_df['NFAX']), 'Fatura'].drop_duplicates().reset_index(drop=True)
-    faltando_na_clinica = clinica_df.loc[~clinica_df['NFAX'].isin(ax_df['Fatura']), 'NFAX'].drop_duplicates().reset_index(drop=True)
+    with etapa(medicao, 'Junção'):
+        faltando_no_ax = ax_df.loc[~contem(ax_df['Fatura'], clinica_df['NFAX']), 'Fatura'].drop_duplicates().reset_index(drop=True)
+        faltando_na_clinica = clinica_df.loc[~contem(clinica_df['NFAX'], ax_df['Fatura']), 'NFAX'].drop_duplicates().reset_index(drop=True)
 
     return pd.DataFrame(faltando_na_clinica, columns=['NFAX']), pd.DataFrame(faltando_no_ax, columns=['Fatura'])
 
+
+def unidade_da_planilha(caminho):
+    """Nome da unidade: o nome do arquivo, sem a extensão."""
+    return os.path.splitext(os.path.basename(caminho))[0]
+
+
+def planilhas_clinica(entrada):
+    """Planilhas das unidades: uma pasta, um padrão glob, uma sequência de arquivos ou um dict unidade -> arquivo.
+
+    Retorna o dict unidade -> arquivo; sem o dict, a unidade é o nome do arquivo.
+    """
+    if isinstance(entrada, dict):
+        return dict(entrada)
+    if isinstance(entrada, (str, os.PathLike)) and os.path.isdir(entrada):
+        entrada = sorted(os.path.join(entrada, nome) for nome in os.listdir(entrada)
+                         if nome.lower().endswith(EXTENSOES) and not nome.startswith(('~$', '.')))
+    arquivos = arquivos_ax(entrada)  # Aceita caminhos e padrões glob, como as planilhas AX
+    planilhas = {unidade_da_planilha(arquivo): arquivo for arquivo in arquivos}
+    if len(planilhas) != len(arquivos):
+        raise ValueError("Há planilhas de unidades diferentes com o mesmo nome de arquivo; informe as unidades explicitamente.")
+    return planilhas
+
+
+def ler_contas(caminho):
+    """Lê a relação das unidades com as Contas de cliente do AX (colunas Unidade e Conta de cliente)."""
+    df = ler_planilha(caminho, colunas={'Unidade': str, 'Conta de cliente': str})
+    contas = {}
+    for unidade, conta in df.dropna().itertuples(index=False, name=None):
+        contas.setdefault(unidade.strip(), []).append(conta)
+    return contas
+
+
+def _rotulo_conta(valor):
+    # A conta pode ter sido lida como número (1001 ou 1001.0) ou como texto ('1001')
+    if isinstance(valor, (float, np.floating)) and float(valor).is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _ler_clinica(caminho):
+    clinica_df = ler_planilha(caminho, colunas=COLUNAS_CLINICA)
+    clinica_df['NFAX'] = normalizar_chave(clinica_df['NFAX'])
+    return clinica_df
+
+
+def _cruzar_clinica(nfax, indice, linhas_ax):
+    """Notas da clínica que não estão no AX e as posições no AX das que estão (com uma única busca no índice)."""
+    esquerda, direita = juntar(nfax, indice)
+    direita[direita >= linhas_ax] = -1  # A linha de totais do AX não é uma fatura
+    encontradas = np.zeros(len(nfax), dtype=bool)
+    encontradas[esquerda[direita >= 0]] = True
+    faltando = nfax[~encontradas].drop_duplicates().reset_index(drop=True)
+    return faltando, direita[direita >= 0]
+
+
+def _donos_das_contas(codigos, posicoes, contas_ax, unidades, contas):
+    """Unidade (posição em unidades, ou -1) responsável por cada Conta de cliente do AX."""
+    if contas is not None:
+        unidade_da_conta = {_rotulo_conta(conta): indice for indice, unidade in enumerate(unidades) for conta in contas.get(unidade, [])}
+        return np.array([unidade_da_conta.get(_rotulo_conta(conta), -1) for conta in contas_ax], dtype='int64')
+    # Sem a relação, cada conta fica com a unidade cujas notas mais aparecem nela
+    ocorrencias = np.zeros((len(unidades), len(contas_ax)), dtype='int64')
+    for indice, posicoes_unidade in enumerate(posicoes):
+        codigos_unidade = codigos[posicoes_unidade]
+        ocorrencias[indice] = np.bincount(codigos_unidade[codigos_unidade >= 0], minlength=len(contas_ax))
+    if not len(unidades):
+        return np.full(len(contas_ax), -1, dtype='int64')
+    return np.where(ocorrencias.max(axis=0) > 0, ocorrencias.argmax(axis=0), -1)
+
+
+def comparar_unidades(planilha_ax, planilhas, contas=None, medicao=None, processos=None):
+    """Concilia as planilhas de várias unidades com uma única leitura e um único índice da planilha AX.
+
+    planilhas é aceita como em planilhas_clinica. As faturas do AX são divididas pela Conta de cliente:
+    com contas (dict unidade -> contas, veja ler_contas), cada unidade fica com as suas; sem ele, cada
+    conta fica com a unidade cujas notas mais aparecem nela. Cada unidade é então comparada apenas com
+    a sua parte do AX, em paralelo; as faturas de contas sem unidade ficam em SEM_UNIDADE.
+
+    Retorna o resumo por unidade e as notas faltando na clínica e no AX, com a coluna Unidade.
+    """
+    ax = PlanilhaAX.obter(planilha_ax, medicao)
+    planilhas = planilhas_clinica(planilhas)
+    unidades = list(planilhas)
+    trabalhadores = max(1, min(len(unidades), processos or os.cpu_count() or 1))
+
+    with etapa(medicao, 'Leitura clínicas'):
+        # A leitura e a normalização de cada planilha rodam em paralelo
+        with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+            clinicas = list(executor.map(_ler_clinica, planilhas.values()))
+    contar(medicao, 'clínicas', sum(len(clinica_df) for clinica_df in clinicas))
+    for caminho, clinica_df in zip(planilhas.values(), clinicas):
+        registrar('clinica', caminho, clinica_df, medicao)
+
+    if 'Conta de cliente' not in ax.dados.columns:
+        raise ValueError("A planilha AX não possui a coluna Conta de cliente, usada para dividir as faturas por unidade.")
+    with etapa(medicao, 'Partição AX'):
+        ax_df = remover_total(ax.colunas('Fatura', 'Conta de cliente'), 'Fatura')
+        indice = ax.indice  # Montado uma vez e reaproveitado por todas as unidades (e pela sessão)
+        with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+            cruzamentos = list(executor.map(lambda clinica_df: _cruzar_clinica(clinica_df['NFAX'], indice, len(ax_df)), clinicas))
+        codigos, contas_ax = pd.factorize(ax_df['Conta de cliente'])
+        donos = _donos_das_contas(codigos, [posicoes for _, posicoes in cruzamentos], contas_ax, unidades, contas)
+        # Faturas agrupadas pela unidade dona da conta (-1 para as sem unidade e sem conta)
+        dono_da_linha = np.append(donos, -1)[codigos]
+        ordem = np.argsort(dono_da_linha, kind='stable')
+        limites = np.searchsorted(dono_da_linha[ordem], np.arange(-1, len(unidades) + 1))
+        partes = [ordem[limites[indice + 1]:limites[indice + 2]] for indice in range(-1, len(unidades))]
+
+    def faltando_no_ax_da_unidade(argumentos):
+        posicoes, clinica_df = argumentos
+        faturas = ax_df['Fatura'].iloc[posicoes]
+        if clinica_df is not None:
+            faturas = faturas[~contem(faturas, clinica_df['NFAX'])]
+        return faturas.drop_duplicates().reset_index(drop=True)
+
+    with etapa(medicao, 'Junção'):
+        with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+            faltando_no_ax_por_unidade = list(executor.map(faltando_no_ax_da_unidade, zip(partes, [None] + clinicas)))
+
+    nomes = [SEM_UNIDADE] + unidades
+    resumo = pd.DataFrame({
+        'Unidade': nomes,
+        'Contas': np.bincount(donos + 1, minlength=len(nomes)) if len(donos) else np.zeros(len(nomes), dtype='int64'),
+        'Faturas AX': [len(posicoes) for posicoes in partes],
+        'Notas clínica': [0] + [len(clinica_df) for clinica_df in clinicas],
+        'Faltando na clínica': [0] + [len(faltando) for faltando, _ in cruzamentos],
+        'Faltando no AX': [len(faturas) for faturas in faltando_no_ax_por_unidade],
+    })
+    if not resumo.loc[0, 'Faturas AX']:
+        resumo = resumo.iloc[1:].reset_index(drop=True)
+
+    categorias = pd.CategoricalDtype(nomes)
+    faltando_na_clinica = pd.DataFrame({
+        'Unidade': pd.Categorical.from_codes(np.repeat(np.arange(1, len(nomes)), [len(faltando) for faltando, _ in cruzamentos]), dtype=categorias),
+        'NFAX': pd.concat([faltando for faltando, _ in cruzamentos], ignore_index=True) if unidades else pd.Series(dtype='Int64'),
+    })
+    faltando_no_ax = pd.DataFrame({
+        'Unidade': pd.Categorical.from_codes(np.repeat(np.arange(len(nomes)), [len(faturas) for faturas in faltando_no_ax_por_unidade]), dtype=categorias),
+        'Fatura': pd.concat(faltando_no_ax_por_unidade, ignore_index=True),
+    })
+    # Com todas as faturas do AX em alguma unidade, a categoria SEM_UNIDADE não aparece nos resultados
+    if not len(faltando_no_ax_por_unidade[0]):
+        faltando_no_ax['Unidade'] = faltando_no_ax['Unidade'].cat.remove_categories(SEM_UNIDADE)
+    faltando_na_clinica['Unidade'] = faltando_na_clinica['Unidade'].cat.remove_categories(SEM_UNIDADE)
+    return resumo, faltando_na_clinica, faltando_no_ax
+
 class ApplicationClinica(tk.Toplevel):
     def __init__(self, master=None):
         super().__init__(master)
         self.title("Comparativo de Planilhas")
         self.geometry("1000x600")
         self.create_widgets()
-        self.ax_file_path = None
+        self.ax_file_path = caminho_ax_da_sessao(self) or None  # A planilha AX já carregada no menu, se houver
         self.clinica_file_path = None
 
     def create_widgets(self):
@@ -55,7 +214,7 @@ class ApplicationClinica(tk.Toplevel):
         self.btn_select_ax = ttk.Button(top_frame, text="Selecionar Planilha AX", command=lambda: self.load_file("ax"))
         self.btn_select_ax.pack(side=tk.LEFT, padx=5, pady=10)
 
-        self.btn_select_clinica = ttk.Button(top_frame, text="Selecionar Planilha Clínica", command=lambda: self.load_file("clinica"))
+        self.btn_select_clinica = ttk.Button(top_frame, text="Selecionar Planilhas Clínica", command=lambda: self.load_file("clinica"))
         self.btn_select_clinica.pack(side=tk.LEFT, padx=5)
 
         self.btn_process = ttk.Button(top_frame, text="Processar", command=self.process_files)
@@ -64,68 +223,120 @@ class ApplicationClinica(tk.Toplevel):
         self.btn_clear = ttk.Button(top_frame, text="Limpar", command=self.clear_results)
         self.btn_clear.pack(side=tk.LEFT, padx=5)
 
+        self.indicador = IndicadorProgresso(self)
+        self.indicador.pack()
+
+        # Tempo de cada etapa da última execução
+        self.label_metricas = ttk.Label(self, text="", wraplength=960)
+        self.label_metricas.pack(fill=tk.X)
+
         self.result_frame = tk.Frame(self)
         self.result_frame.pack(fill=tk.BOTH, expand=True)
 
     def load_file(self, file_type):
-        file_path = filedialog.askopenfilename()
+        # Várias planilhas AX (por exemplo, uma por empresa ou período) são unidas antes da comparação;
+        # várias planilhas da clínica (uma por unidade) são comparadas cada uma com as faturas da sua unidade
+        if file_type == "ax":
+            file_path = selecionar_planilhas_ax()
+        else:
+            arquivos = filedialog.askopenfilenames()
+            file_path = arquivos[0] if len(arquivos) == 1 else tuple(arquivos)
         if file_path:
             setattr(self, f"{file_type}_file_path", file_path)
 
     def process_files(self):
+        if self.indicador.ocupado:
+            return  # Já existe um processamento em andamento nesta janela
         if self.ax_file_path and self.clinica_file_path:
-            self.show_loading_indicator()  # Mostra o indicador de carregamento
-            thread = threading.Thread(target=self.process_files_in_thread)
-            thread.start()
+            unidades = isinstance(self.clinica_file_path, tuple)
+            tarefa = obter_agendador().enviar(
+                ('clinica', self.ax_file_path, self.clinica_file_path),
+                self.process_units_in_thread if unidades else self.process_files_in_thread, self.ax_file_path, self.clinica_file_path,
+            )
+            mostrar = self.show_unit_results if unidades else self.show_all_results
+            # Os widgets são criados na thread da interface, pelos callbacks do indicador
+            self.indicador.acompanhar(
+                tarefa,
+                ao_concluir=lambda resultados: mostrar(*resultados, tarefa.medicao),
+                ao_falhar=lambda erro: self.show_failure(erro, tarefa.medicao),
+                ao_cancelar=lambda: self.show_metrics(tarefa.medicao),  # O resumo indica o cancelamento
+            )
         else:
             messagebox.showerror("Erro", "Selecione ambas as planilhas antes de processar.")
 
-    def show_loading_indicator(self):
-        self.loading_label = tk.Label(self, text="Processando...", fg="blue")
-        self.loading_label.pack()
+    # Roda em uma thread do agendador: não acessa os widgets
+    def process_files_in_thread(self, tarefa, ax_file_path, clinica_file_path):
+        with tarefa.medir('clinica', ax=ax_file_path, clinica=clinica_file_path) as medicao:
+            faltando_na_clinica, faltando_no_ax = comparar_planilhas(ax_da_janela(self, ax_file_path, medicao), clinica_file_path, medicao)
+            contar(medicao, 'faltando na clínica', len(faltando_na_clinica))
+            contar(medicao, 'faltando no AX', len(faltando_no_ax))
+            return (compactar_resultado(faltando_na_clinica, medicao, 'faltando na clínica', chaves=('NFAX',)),
+                    compactar_resultado(faltando_no_ax, medicao, 'faltando no AX', chaves=('Fatura',)),
+                    unidade_da_planilha(clinica_file_path))
+
+    # Várias unidades: a planilha AX é lida uma vez e dividida pela Conta de cliente
+    def process_units_in_thread(self, tarefa, ax_file_path, clinica_files):
+        with tarefa.medir('clinicas', ax=ax_file_path, clinica=list(clinica_files)) as medicao:
+            resumo, faltando_na_clinica, faltando_no_ax = comparar_unidades(ax_da_janela(self, ax_file_path, medicao), clinica_files, medicao=medicao)
+            contar(medicao, 'faltando na clínica', len(faltando_na_clinica))
+            contar(medicao, 'faltando no AX', len(faltando_no_ax))
+            return (resumo,
+                    compactar_resultado(faltando_na_clinica, medicao, 'faltando na clínica', chaves=('NFAX',)),
+                    compactar_resultado(faltando_no_ax, medicao, 'faltando no AX', chaves=('Fatura',)))
 
-    def process_files_in_thread(self):
-        try:
-            faltando_na_clinica, faltando_no_ax = comparar_planilhas(self.ax_file_path, self.clinica_file_path)
-            self.show_results(faltando_na_clinica, 'NFAX', self.result_frame, "left", "Sistema Clínica - Camarões")
+    def show_all_results(self, faltando_na_clinica, faltando_no_ax, unidade, medicao):
+        with medicao.etapa('Renderização'):
+            self.show_results(faltando_na_clinica, 'NFAX', self.result_frame, "left", f"Sistema Clínica - {unidade}")
             self.show_results(faltando_no_ax, 'Fatura', self.result_frame, "right", "Sistema AX (Cancelar NF-e)")
-        except Exception as e:
-            messagebox.showerror("Erro", str(e))
-        finally:
-            self.loading_label.destroy()  # Remove o indicador de carregamento
+        medicao.finalizar()
+        self.show_metrics(medicao)
+
+    def show_unit_results(self, resumo, faltando_na_clinica, faltando_no_ax, medicao):
+        with medicao.etapa('Renderização'):
+            frame = tk.Frame(self.result_frame)
+            frame.pack(side="top", fill=tk.X, padx=10, pady=10)
+            ttk.Label(frame, text="Resumo por unidade:").pack()
+            TabelaVirtual(frame, resumo).pack(fill=tk.X)
+            self.adicionar_botao_export(frame, resumo, 'Unidade', "Exportar resumo")
+            self.show_results(faltando_na_clinica, 'NFAX', self.result_frame, "left", "Sistema Clínica - por unidade", ['Unidade'])
+            self.show_results(faltando_no_ax, 'Fatura', self.result_frame, "right", "Sistema AX (Cancelar NF-e)", ['Unidade'])
+        medicao.finalizar()
+        self.show_metrics(medicao)
+
+    def show_failure(self, erro, medicao):
+        self.show_metrics(medicao)
+        messagebox.showerror("Erro", str(erro))
+
+    def show_metrics(self, medicao):
+        if medicao:
+            self.label_metricas.config(text=medicao.resumo())
 
-    def show_results(self, dataframe, coluna, parent, side, tabela_nome):
+    def show_memory(self):
+        """Memória do processo depois de liberar os resultados."""
+        liberar_memoria()
+        rss = memoria_rss()
+        self.label_metricas.config(text="" if rss is None else f"Memória do processo: {rss / MB:.0f} MB")
+
+    def show_results(self, dataframe, coluna, parent, side, tabela_nome, outras_colunas=()):
         frame = tk.Frame(parent)
         frame.pack(side=side, expand=True, fill=tk.BOTH, padx=10, pady=10)
         label = ttk.Label(frame, text=f"{tabela_nome}:")
         label.pack()
-        tabela = self.criar_treeview(frame, [coluna], coluna)
-        self.preencher_treeview(tabela, dataframe, coluna)
-        self.adicionar_botao_export(frame, dataframe, coluna)
-
-    def criar_treeview(self, parent, colunas, coluna):
-        """Cria e configura a Treeview."""
-        tabela = ttk.Treeview(parent, columns=colunas, show="headings")
-        tabela.heading(coluna, text=coluna)
-        tabela.column(coluna, anchor='center')
+        tabela = TabelaVirtual(frame, dataframe, [*outras_colunas, coluna])  # Só as linhas visíveis viram itens da Treeview
         tabela.pack(expand=True, fill=tk.BOTH)
-        return tabela
-
-    def preencher_treeview(self, tabela, dataframe, coluna):
-        """Preenche a Treeview com os dados do DataFrame."""
-        for _, row in dataframe.iterrows():
-            tabela.insert('', 'end', values=(row[coluna],))
+        self.adicionar_botao_export(frame, dataframe, coluna)
 
-    def adicionar_botao_export(self, parent, df, coluna):
+    def adicionar_botao_export(self, parent, df, coluna, texto=None):
         """Adiciona botão de exportação para Excel."""
-        btn_export = ttk.Button(parent, text=f"Exportar {coluna}", command=lambda: self.export_result(df, coluna))
+        btn_export = ttk.Button(parent, text=texto or f"Exportar {coluna}", command=lambda: self.export_result(df, coluna))
         btn_export.pack(pady=10)
 
     def export_result(self, df, coluna):
-        filename = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx")])
+        filename = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=FORMATOS_EXPORTACAO)
         if filename:
-            df.to_excel(filename, index=False)
-            messagebox.showinfo("Sucesso", f"Dados {coluna} exportados com sucesso para Excel.")
+            # Grava em segundo plano, bloco a bloco, com o andamento no indicador
+            exportar_em_segundo_plano(self, df, filename, 'clinica_exportacao', coluna,
+                                      f"Dados {coluna} exportados com sucesso.", titulo="Sucesso")
 
     def clear_results(self):
         """Limpa os resultados exibidos e redefine os caminhos dos arquivos."""
@@ -133,6 +344,7 @@ class ApplicationClinica(tk.Toplevel):
             widget.destroy()  # Limpa a Treeview e os botões de exportação
         self.ax_file_path = None
         self.clinica_file_path = None
+        self.show_memory()
         messagebox.showinfo("Limpar", "Resultados limpos com sucesso!")
 
 if __name__ == "__main__":
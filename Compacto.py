@@ -0,0 +1,92 @@
+import ctypes
+import gc
+import os
+import sys
+
+import pandas as pd
+
+from Chaves import normalizar_chave
+from Metricas import etapa
+
+# Com NFSE_COMPACTO=0, as janelas guardam os resultados como foram produzidos pelas conciliações
+COMPACTO = os.environ.get('NFSE_COMPACTO', '1') != '0'
+
+# Colunas de texto com até esta proporção de valores distintos viram category (por exemplo, Status)
+PROPORCAO_CATEGORIAS = 0.5
+
+_LIMITE_UINT32 = 2 ** 32
+
+
+def tamanho(df):
+    """Memória ocupada pelo DataFrame em bytes, incluindo os textos."""
+    return 0 if df is None else int(df.memory_usage(deep=True).sum())
+
+
+def _chave_compacta(serie):
+    if serie.dtype == object and pd.api.types.infer_dtype(serie, skipna=True) in ('integer', 'floating', 'mixed-integer-float'):
+        serie = pd.to_numeric(serie)  # Evita converter cada número em texto para extrair os dígitos
+    # Só converte quando nenhum valor preenchido se perde (por exemplo, um texto não numérico,
+    # que normalizar_chave troca por um código negativo)
+    chaves = normalizar_chave(serie)
+    valores = chaves.dropna()
+    if chaves.isna().sum() != serie.isna().sum() or (not valores.empty and valores.min() < 0):
+        return None
+    cabe_uint32 = valores.empty or (valores.min() >= 0 and valores.max() < _LIMITE_UINT32)
+    if isinstance(chaves.dtype, pd.ArrowDtype):
+        return chaves.astype('uint32[pyarrow]' if cabe_uint32 else chaves.dtype)  # Continua em Arrow
+    if chaves.hasnans:
+        return chaves.astype('UInt32') if cabe_uint32 else chaves
+    return chaves.astype('uint32' if cabe_uint32 else 'int64')
+
+
+def _texto_compacto(serie):
+    tipo = pd.api.types.infer_dtype(serie, skipna=True)
+    if tipo in ('integer', 'floating', 'mixed-integer-float'):
+        return pd.to_numeric(serie)  # Números guardados como objetos Python
+    if tipo == 'string' and serie.nunique(dropna=True) <= len(serie) * PROPORCAO_CATEGORIAS:
+        return serie.astype('category')
+    return None
+
+
+def compactar(df, chaves=(), colunas=None):
+    """Versão compacta do DataFrame, com os mesmos valores.
+
+    As colunas de chaves (números de fatura, RPS, NFS-e...) viram uint32, ou int64 quando não cabem;
+    com vazios, UInt32/Int64. Textos repetidos viram category e números guardados como objetos viram
+    colunas numéricas. Com colunas, as demais colunas são descartadas.
+    """
+    if colunas is not None:
+        df = df[[coluna for coluna in colunas if coluna in df.columns]]
+    resultado = df.copy(deep=False)
+    for coluna in df.columns:
+        serie = df[coluna]
+        if coluna in chaves and not isinstance(serie.dtype, pd.CategoricalDtype):
+            compacta = _chave_compacta(serie)
+        elif serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype):
+            compacta = _texto_compacto(serie)
+        else:
+            compacta = None
+        if compacta is not None:
+            resultado[coluna] = compacta
+    return resultado
+
+
+def compactar_resultado(df, medicao=None, nome='resultado', chaves=(), colunas=None):
+    """Compacta o DataFrame que a janela vai guardar e registra na medição a memória antes e depois."""
+    antes = tamanho(df)
+    if COMPACTO:
+        with etapa(medicao, 'Compactação'):
+            df = compactar(df, chaves, colunas)
+    if medicao:
+        medicao.registrar_memoria(nome, antes, tamanho(df))
+    return df
+
+
+def liberar_memoria():
+    """Coleta os objetos sem referência e devolve ao sistema a memória livre do processo (glibc)."""
+    gc.collect()
+    if sys.platform.startswith('linux'):
+        try:
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
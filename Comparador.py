@@ -1,31 +1,48 @@
-import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import threading
-
-# Leitura das planilhas, desconsiderando as linhas de cabeçalho da planilha AX
-def ler_planilha(caminho, skiprows=0, encoding='utf-8'):
-    if caminho.endswith('.xlsx') or caminho.endswith('.xls'):
-        return pd.read_excel(caminho, skiprows=skiprows)
-    elif caminho.endswith('.csv'):
-        try:
-            # Tenta ler o arquivo com a codificação padrão e delimitador detectado automaticamente, ou seja, delimitado por ;
-            return pd.read_csv(caminho, encoding=encoding, skiprows=skiprows, on_bad_lines='warn', delimiter=';')
-        except UnicodeDecodeError:
-            # Tenta novamente com uma codificação diferente se a primeira falhar
-            return pd.read_csv(caminho, encoding='iso-8859-1', skiprows=skiprows, on_bad_lines='warn', delimiter=';')
-    else:
-        raise ValueError("Formato de arquivo não suportado.")
+
+from Chaves import combinar, indexar, juntar, normalizar_chave
+from Compacto import compactar_resultado, liberar_memoria
+from Historico import registrar
+from Metricas import MB, contar, etapa, memoria_rss, progresso
+from Planilha import TAMANHO_BLOCO, deve_ler_em_blocos, juntar_blocos, ler_csv_em_blocos, ler_planilha
+from Sessao import PlanilhaAX, ax_da_janela, caminho_ax_da_sessao
+from Exportacao import FORMATOS_EXPORTACAO
+from Tarefas import obter_agendador
+from Visualizacao import IndicadorProgresso, PainelPaginado, exportar_em_segundo_plano, selecionar_planilhas_ax
+
+COLUNAS_NFS_E = ['Nº NFS-e', 'Nº da Nota Fiscal Eletrônica']
+
+# Colunas lidas da planilha da prefeitura e seus tipos (None mantém a inferência do pandas).
+# A chave é lida como texto e convertida para inteiro sem passar por float.
+COLUNAS_PREFEITURA = {'Número do RPS': str, 'Nº NFS-e': None, 'Nº da Nota Fiscal Eletrônica': None}
 
 # Repassando os campos de busca, ou seja, relacionando as Tabelas com colunas correspondentes
 # Coluna 'Fatura' da Planilha do AX
 # Coluna 'Número do RPS' da Planilha Prefeitura
-def encontrar_nfs_e(planilha_ax, planilha_prefeitura):
-    ax_df = ler_planilha(planilha_ax, skiprows=11)
-    prefeitura_df = ler_planilha(planilha_prefeitura)
-    ax_df['Fatura'] = ax_df['Fatura'].astype(float)
-    prefeitura_df['Número do RPS'] = prefeitura_df['Número do RPS'].astype(float)
+# planilha_ax é o caminho da planilha ou a PlanilhaAX já carregada na sessão.
+# Com medicao, o tempo e a memória de cada etapa são registrados (veja Metricas)
+def encontrar_nfs_e(planilha_ax, planilha_prefeitura, medicao=None):
+    if deve_ler_em_blocos(planilha_prefeitura):
+        with etapa(medicao, 'Leitura e junção em blocos'):
+            return juntar_blocos(encontrar_nfs_e_em_blocos(planilha_ax, planilha_prefeitura, medicao=medicao), ['Fatura', 'Status'])
 
+    ax_df, prefeitura_df = ler_nfs_e(planilha_ax, planilha_prefeitura, medicao)
+    with etapa(medicao, 'Junção'):
+        return juntar_nfs_e(ax_df, prefeitura_df)
+
+# Lê as duas planilhas com as chaves já convertidas para inteiro
+def ler_nfs_e(planilha_ax, planilha_prefeitura, medicao=None):
+    ax_df = PlanilhaAX.obter(planilha_ax, medicao).colunas('Fatura', 'Status')
+    with etapa(medicao, 'Leitura prefeitura'):
+        prefeitura_df = ler_planilha(planilha_prefeitura, colunas=COLUNAS_PREFEITURA)
+    contar(medicao, 'prefeitura', len(prefeitura_df))
+    with etapa(medicao, 'Normalização'):
+        prefeitura_df['Número do RPS'] = normalizar_chave(prefeitura_df['Número do RPS'])
+    registrar('prefeitura', planilha_prefeitura, prefeitura_df, medicao)
+    return ax_df, prefeitura_df
+
+def juntar_nfs_e(ax_df, prefeitura_df):
     # Determina quais colunas estão disponíveis para o merge
     colunas_prefeitura = ['Número do RPS']
     if 'Nº NFS-e' in prefeitura_df.columns:
@@ -34,7 +51,8 @@ def encontrar_nfs_e(planilha_ax, planilha_prefeitura):
         colunas_prefeitura.append('Nº da Nota Fiscal Eletrônica')
     
     # Realiza o merge com base nas colunas disponíveis
-    resultado = pd.merge(ax_df[['Fatura', 'Status']], prefeitura_df[colunas_prefeitura], left_on='Fatura', right_on='Número do RPS', how='left')
+    posicoes_ax, posicoes_prefeitura = juntar(ax_df['Fatura'], prefeitura_df['Número do RPS'], como='left')
+    resultado = combinar(ax_df[['Fatura', 'Status']], prefeitura_df[colunas_prefeitura], posicoes_ax, posicoes_prefeitura)
     
     # Seleciona as colunas para o resultado final, verificando se elas existem antes de tentar acessá-las
     colunas_resultado = ['Fatura', 'Status']
@@ -46,13 +64,40 @@ def encontrar_nfs_e(planilha_ax, planilha_prefeitura):
     resultado_final = resultado[colunas_resultado].dropna()
     return resultado_final
 
+# Versão em blocos para arquivos CSV grandes da prefeitura: só as faturas do AX ficam em memória
+# e cada bloco do CSV é comparado com elas. O índice de cada bloco gerado é a posição da fatura na planilha AX.
+def encontrar_nfs_e_em_blocos(planilha_ax, planilha_prefeitura, tamanho_bloco=TAMANHO_BLOCO, medicao=None):
+    chaves_ax = PlanilhaAX.obter(planilha_ax).colunas('Fatura', 'Status').dropna()
+    indice_ax = indexar(chaves_ax['Fatura'])
+
+    linhas_lidas = 0
+    for bloco in ler_csv_em_blocos(planilha_prefeitura, colunas=COLUNAS_PREFEITURA, tamanho_bloco=tamanho_bloco):
+        linhas_lidas += len(bloco)
+        progresso(medicao, linhas_lidas=linhas_lidas)
+        colunas_nfs_e = [coluna for coluna in COLUNAS_NFS_E if coluna in bloco.columns]
+        if not colunas_nfs_e:
+            raise ValueError("A planilha da prefeitura não possui a coluna do número da NFS-e.")
+
+        # Linhas sem número da NFS-e seriam descartadas pelo dropna do resultado final
+        bloco = bloco.dropna()
+        bloco['Número do RPS'] = normalizar_chave(bloco['Número do RPS'])
+        posicoes_bloco, posicoes_ax = juntar(bloco['Número do RPS'], indice_ax, como='inner')
+        if len(posicoes_bloco) == 0:
+            continue
+
+        # O índice de cada linha é a posição da fatura no AX, para juntar_blocos restaurar a ordem do merge
+        resultado = chaves_ax.iloc[posicoes_ax].copy()
+        for coluna in colunas_nfs_e:
+            resultado[coluna] = bloco[coluna].to_numpy()[posicoes_bloco]
+        yield resultado
+
 class ApplicationComparador(tk.Toplevel):
     def __init__(self, master=None):
         super().__init__(master)  # Chama o inicializador da classe base corretamente
         self.title("Sistema de Validação")
         self.geometry("800x600")
         self.create_widgets()
-        self.ax_file_path = ""  # Inicializa a variável
+        self.ax_file_path = caminho_ax_da_sessao(self)  # A planilha AX já carregada no menu, se houver
         self.prefeitura_file_path = ""  # Inicializa a variável
 
     def create_widgets(self):
@@ -62,7 +107,12 @@ class ApplicationComparador(tk.Toplevel):
         self.tab_nfs_e = ttk.Frame(self.notebook)
         self.notebook.add(self.tab_nfs_e, text="Comparativo NFS-e")
         
+        self.tab_mudancas = ttk.Frame(self.notebook)
+        self.notebook.add(self.tab_mudancas, text="Mudanças")
+        
         self.configurar_tab_nfs_e()
+        self.painel_mudancas = PainelPaginado(self.tab_mudancas, height=10, width=75)
+        self.painel_mudancas.pack(pady=20, expand=True, fill=tk.BOTH)
 
     def configurar_tab_nfs_e(self):
         frame = ttk.Frame(self.tab_nfs_e)
@@ -76,8 +126,20 @@ class ApplicationComparador(tk.Toplevel):
         self.btn_process = ttk.Button(frame, text="Processar", command=self.process_files)
         self.btn_process.pack(side=tk.LEFT, padx=10)
         
-        self.text_result = tk.Text(self.tab_nfs_e, height=10, width=75)
-        self.text_result.pack(pady=20)
+        # Compara com a última execução e refaz apenas as faturas que mudaram
+        self.incremental = tk.BooleanVar(value=False)
+        self.check_incremental = ttk.Checkbutton(frame, text="Incremental", variable=self.incremental)
+        self.check_incremental.pack(side=tk.LEFT, padx=10)
+        
+        self.indicador = IndicadorProgresso(self.tab_nfs_e)
+        self.indicador.pack()
+        
+        # Tempo de cada etapa da última execução
+        self.label_metricas = ttk.Label(self.tab_nfs_e, text="", wraplength=760)
+        self.label_metricas.pack()
+        
+        self.painel_resultado = PainelPaginado(self.tab_nfs_e, height=10, width=75)
+        self.painel_resultado.pack(pady=20, expand=True, fill=tk.BOTH)
         
         frame_botoes_inferiores = ttk.Frame(self.tab_nfs_e)
         frame_botoes_inferiores.pack(pady=10)
@@ -91,10 +153,10 @@ class ApplicationComparador(tk.Toplevel):
         self.ax_file_path = ""
         self.prefeitura_file_path = ""
         self.last_result = None
-        self.loading_label = None  # Inicializa o label de carregamento
 
     def load_file(self, file_type):
-        file_path = filedialog.askopenfilename()
+        # Várias planilhas AX (por exemplo, uma por empresa ou período) são unidas antes da comparação
+        file_path = selecionar_planilhas_ax() if file_type == "ax" else filedialog.askopenfilename()
         if file_path:
             if file_type == "ax":
                 self.ax_file_path = file_path
@@ -104,58 +166,101 @@ class ApplicationComparador(tk.Toplevel):
                 self.btn_select_prefeitura.config(bg='green')
 
     def process_files(self):
+        if self.indicador.ocupado:
+            return  # Já existe um processamento em andamento nesta janela
         if self.ax_file_path and self.prefeitura_file_path:
-            self.loading_label = tk.Label(self.tab_nfs_e, text="Processando...", fg="blue")
-            self.loading_label.pack()
-            thread = threading.Thread(target=self.process_files_in_thread)
-            thread.start()
+            incremental = self.incremental.get()
+            tarefa = obter_agendador().enviar(
+                ('comparador', self.ax_file_path, self.prefeitura_file_path, incremental),
+                self.process_files_in_thread, self.ax_file_path, self.prefeitura_file_path, incremental,
+            )
+            self.indicador.acompanhar(
+                tarefa,
+                ao_concluir=lambda resultados: self.show_processed(resultados, tarefa.medicao),
+                ao_falhar=lambda erro: self.show_failure(erro, tarefa.medicao),
+                ao_cancelar=lambda: self.show_cancelled(tarefa.medicao),
+            )
         else:
             messagebox.showerror("Erro", "Por favor, selecione ambos os arquivos antes de processar.")
 
-    def process_files_in_thread(self):
-        try:
-            self.last_result = encontrar_nfs_e(self.ax_file_path, self.prefeitura_file_path)
-            self.show_result(self.last_result)
-        except Exception as e:
-            messagebox.showerror("Erro", str(e))
-            self.show_error(str(e))
-        finally:
-            self.loading_label.destroy()  # Remove o indicador de carregamento
-
-    def show_result(self, resultado):
-        self.text_result.delete('1.0', tk.END)
-        if not resultado.empty:
-            resultado_str = resultado.applymap(lambda x: int(x) if isinstance(x, float) and x.is_integer() else x)
-            self.text_result.insert(tk.END, resultado_str.to_string(index=False))
+    # Roda em uma thread do agendador: não acessa os widgets, que só são atualizados pelos callbacks do indicador
+    def process_files_in_thread(self, tarefa, ax_file_path, prefeitura_file_path, incremental):
+        with tarefa.medir('comparador', ax=ax_file_path, prefeitura=prefeitura_file_path) as medicao:
+            planilha_ax = ax_da_janela(self, ax_file_path, medicao)
+            if incremental:
+                from Incremental import encontrar_nfs_e_incremental
+                resultado, mudancas = encontrar_nfs_e_incremental(planilha_ax, prefeitura_file_path, medicao=medicao)
+            else:
+                resultado, mudancas = encontrar_nfs_e(planilha_ax, prefeitura_file_path, medicao), None
+            return compactar_resultado(resultado, medicao, chaves=['Fatura'] + COLUNAS_NFS_E), mudancas
+
+    def show_processed(self, resultados, medicao):
+        self.last_result, mudancas = resultados
+        if mudancas is not None:
+            self.show_changes(mudancas)
+        self.show_result(self.last_result, medicao)
+
+    def show_failure(self, erro, medicao):
+        self.show_metrics(medicao)
+        self.show_error(str(erro))
+        messagebox.showerror("Erro", str(erro))
+
+    def show_cancelled(self, medicao):
+        self.show_metrics(medicao)
+        self.painel_resultado.mostrar_mensagem("Processamento cancelado.")
+
+    def show_result(self, resultado, medicao=None):
+        with etapa(medicao, 'Renderização'):
+            if not resultado.empty:
+                self.painel_resultado.mostrar(resultado)  # Formata e exibe apenas a primeira página
+            else:
+                self.painel_resultado.mostrar_mensagem("Nenhuma correspondência encontrada.")
+        if medicao:
+            contar(medicao, 'resultado', len(resultado))
+            medicao.finalizar()
+            self.show_metrics(medicao)
+            
+    def show_metrics(self, medicao):
+        if medicao:
+            self.label_metricas.config(text=medicao.resumo())
+            
+    def show_changes(self, mudancas):
+        if not mudancas.empty:
+            self.painel_mudancas.mostrar(mudancas)
         else:
-            self.text_result.insert(tk.END, "Nenhuma correspondência encontrada.")
+            self.painel_mudancas.mostrar_mensagem("Nenhuma mudança desde a última execução.")
             
     def show_error(self, message):
-        self.text_result.delete('1.0', tk.END)
-        self.text_result.insert(tk.END, message)
+        self.painel_resultado.mostrar_mensagem(message)
         
     def export_result(self):
         if self.last_result is not None and not self.last_result.empty:
-            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=FORMATOS_EXPORTACAO)
             if file_type:
-                if file_type.endswith('.xlsx'):
-                    self.last_result.to_excel(file_type, index=False)
-                elif file_type.endswith('.csv'):
-                    self.last_result.to_csv(file_type, index=False)
-                messagebox.showinfo("Exportar", "Resultado exportado com sucesso.")
+                # Grava em segundo plano, bloco a bloco, com o andamento no indicador
+                exportar_em_segundo_plano(self, self.last_result, file_type, 'comparador_exportacao', 'resultado', "Resultado exportado com sucesso.")
             else:
                 messagebox.showinfo("Ação necessária", "Exportação cancelada.")
         else:
             messagebox.showerror("Erro", "Nenhum resultado para exportar. Por favor, processe os arquivos primeiro.")
             
     def clear_results(self):
-        self.text_result.delete('1.0', tk.END)
+        self.painel_resultado.limpar()
+        self.painel_mudancas.limpar()
+        self.label_metricas.config(text="")
         self.btn_select_ax.config(bg='light grey')
         self.btn_select_prefeitura.config(bg='light grey')
         self.ax_file_path = ""
         self.prefeitura_file_path = ""
         self.last_result = None
-        
+        self.show_memory()
+
+    def show_memory(self):
+        """Memória do processo depois de liberar os resultados."""
+        liberar_memoria()
+        rss = memoria_rss()
+        self.label_metricas.config(text="" if rss is None else f"Memória do processo: {rss / MB:.0f} MB")
+
 if __name__ == "__main__":
     app = ApplicationComparador()
     app.mainloop()
@@ -0,0 +1,183 @@
+import functools
+import gzip
+import os
+
+from Metricas import contar, progresso
+
+# Formatos oferecidos na janela de salvar; o formato é escolhido pela extensão do arquivo
+FORMATOS_EXPORTACAO = [
+    ("Excel files", "*.xlsx"),
+    ("CSV files", "*.csv"),
+    ("CSV compactado (gzip)", "*.csv.gz"),
+    ("Parquet", "*.parquet"),
+]
+
+# O Excel aceita 1.048.576 linhas por aba; a primeira é o cabeçalho
+LINHAS_POR_ABA = 1_048_575
+
+# Linhas convertidas e gravadas de cada vez (e a cada bloco o andamento é informado)
+TAMANHO_BLOCO_EXPORTACAO = 50_000
+
+
+def formato_do_arquivo(caminho):
+    nome = caminho.lower()
+    for extensao, formato in (('.csv.gz', 'csv_gzip'), ('.csv', 'csv'), ('.parquet', 'parquet'), ('.xlsx', 'xlsx')):
+        if nome.endswith(extensao):
+            return formato
+    raise ValueError(f"Formato de exportação não suportado: {os.path.basename(caminho)}")
+
+
+def _blocos(df, medicao, exportadas=0):
+    """Fatias do DataFrame; depois de cada uma, informa o total de linhas exportadas (e atende o cancelamento)."""
+    for inicio in range(0, len(df), TAMANHO_BLOCO_EXPORTACAO):
+        bloco = df.iloc[inicio:inicio + TAMANHO_BLOCO_EXPORTACAO]
+        yield bloco
+        progresso(medicao, linhas_exportadas=exportadas + inicio + len(bloco))
+
+
+def _abas(df, nome_aba, linhas_por_aba=LINHAS_POR_ABA):
+    """(nome, primeira linha, fatia) de cada aba; acima do limite do Excel, as abas são numeradas."""
+    if len(df) <= linhas_por_aba:
+        yield nome_aba, 0, df
+        return
+    for numero, inicio in enumerate(range(0, len(df), linhas_por_aba), start=1):
+        yield f"{nome_aba}_{numero}", inicio, df.iloc[inicio:inicio + linhas_por_aba]
+
+
+def _linhas(df, medicao, exportadas):
+    # Valores Python, com None nas células vazias (NaN, NaT e <NA> ficam em branco, como no to_excel)
+    for bloco in _blocos(df, medicao, exportadas):
+        yield from bloco.astype(object).where(bloco.notna(), None).itertuples(index=False, name=None)
+
+
+def _gravar_xlsx(df, destino, medicao, nome_aba):
+    # Modo de memória constante: cada linha vai para o disco assim que a seguinte é escrita
+    try:
+        import xlsxwriter
+    except ImportError:
+        return _gravar_xlsx_openpyxl(df, destino, medicao, nome_aba)
+
+    livro = xlsxwriter.Workbook(destino, {
+        'constant_memory': True,
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
+    try:
+        cabecalho = livro.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        colunas = [str(coluna) for coluna in df.columns]
+        for nome, inicio, parte in _abas(df, nome_aba):
+            aba = livro.add_worksheet(nome)
+            aba.write_row(0, 0, colunas, cabecalho)
+            for numero, valores in enumerate(_linhas(parte, medicao, inicio), start=1):
+                aba.write_row(numero, 0, valores)
+    finally:
+        livro.close()
+
+
+def _gravar_xlsx_openpyxl(df, destino, medicao, nome_aba):
+    # Sem o xlsxwriter: o modo somente escrita do openpyxl também grava linha a linha
+    import openpyxl
+
+    livro = openpyxl.Workbook(write_only=True)
+    colunas = [str(coluna) for coluna in df.columns]
+    for nome, inicio, parte in _abas(df, nome_aba):
+        aba = livro.create_sheet(nome)
+        aba.append(colunas)
+        for valores in _linhas(parte, medicao, inicio):
+            aba.append(valores)
+    livro.save(destino)
+
+
+def _gravar_csv(df, destino, medicao, nome_aba, abrir=open):
+    with abrir(destino, 'wt', encoding='utf-8', newline='') as arquivo:
+        if df.empty:
+            df.to_csv(arquivo, index=False)
+        for numero, bloco in enumerate(_blocos(df, medicao)):
+            bloco.to_csv(arquivo, index=False, header=numero == 0)
+
+
+def _gravar_csv_gzip(df, destino, medicao, nome_aba):
+    # O nível 6 compacta quase tanto quanto o 9 (padrão do gzip) em bem menos tempo
+    _gravar_csv(df, destino, medicao, nome_aba, abrir=functools.partial(gzip.open, compresslevel=6))
+
+
+def _tabela_arrow(df):
+    import pyarrow as pa
+
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Colunas com números e textos misturados (comuns nas planilhas do banco) são gravadas como texto
+        mistas = {coluna: 'string' for coluna, tipo in df.dtypes.items() if tipo == object}
+        return pa.Table.from_pandas(df.astype(mistas), preserve_index=False)
+
+
+def _gravar_parquet(df, destino, medicao, nome_aba):
+    import pyarrow.parquet as pq
+
+    tabela = _tabela_arrow(df.rename(columns=str))
+    with pq.ParquetWriter(destino, tabela.schema) as escritor:
+        if tabela.num_rows == 0:
+            escritor.write_table(tabela)
+        # Um grupo de linhas por bloco
+        for inicio in range(0, tabela.num_rows, TAMANHO_BLOCO_EXPORTACAO):
+            escritor.write_table(tabela.slice(inicio, TAMANHO_BLOCO_EXPORTACAO))
+            progresso(medicao, linhas_exportadas=min(inicio + TAMANHO_BLOCO_EXPORTACAO, tabela.num_rows))
+
+
+ESCRITORES = {
+    'xlsx': _gravar_xlsx,
+    'csv': _gravar_csv,
+    'csv_gzip': _gravar_csv_gzip,
+    'parquet': _gravar_parquet,
+}
+
+
+def exportar(df, destino, medicao=None, nome_aba='Sheet1'):
+    """Grava o DataFrame (sem o índice) no formato indicado pela extensão do destino.
+
+    O arquivo é gravado em um temporário que só substitui o destino quando está completo;
+    com erro ou cancelamento, o temporário é removido e um arquivo anterior é preservado.
+    """
+    escritor = ESCRITORES[formato_do_arquivo(destino)]
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    try:
+        escritor(df, temporario, medicao, nome_aba)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, destino)
+    return len(df)
+
+
+class ExportacaoEmAndamento(Exception):
+    """Já há uma exportação de outro resultado para o mesmo arquivo."""
+
+
+def enviar_exportacao(df, destino, conciliacao, nome_contagem='linhas'):
+    """Executa a exportação no agendador (veja Tarefas); o resultado da tarefa é a Medicao, ainda não finalizada.
+
+    Exportar de novo o mesmo resultado para o mesmo arquivo acompanha a exportação em andamento;
+    um resultado diferente para esse arquivo levanta ExportacaoEmAndamento.
+    """
+    from Tarefas import obter_agendador
+
+    agendador = obter_agendador()
+    destino_absoluto = os.path.abspath(destino)
+    # O DataFrame fica referenciado pela tarefa até ela terminar, então o id não é reaproveitado antes disso
+    chave = ('exportacao', destino_absoluto, id(df))
+    for tarefa in agendador.ativas():
+        if tarefa.chave[:2] == chave[:2] and tarefa.chave != chave and not tarefa.concluida:
+            raise ExportacaoEmAndamento(f"Já existe uma exportação em andamento para {destino}.")
+
+    def exportar_tarefa(tarefa):
+        with tarefa.medir(conciliacao, destino=destino) as medicao:
+            with medicao.etapa('Exportação'):
+                exportar(df, destino, medicao)
+            contar(medicao, nome_contagem, len(df))
+        return medicao
+
+    return agendador.enviar(chave, exportar_tarefa)
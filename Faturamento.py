@@ -1,40 +1,46 @@
-import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import threading
-
-# Leitura das planilhas, desconsiderando as linhas de cabeçalho da planilha AX
-def ler_planilha(caminho, skiprows=0, encoding='utf-8'):
-    if caminho.endswith('.xlsx') or caminho.endswith('.xls'):
-        return pd.read_excel(caminho, skiprows=skiprows)
-    elif caminho.endswith('.csv'):
-        try:
-            # Tenta ler o arquivo com a codificação padrão e delimitador detectado automaticamente, ou seja, delimitado por ;
-            return pd.read_csv(caminho, encoding=encoding, skiprows=skiprows, on_bad_lines='warn', delimiter=';')
-        except UnicodeDecodeError:
-            # Tenta novamente com uma codificação diferente se a primeira falhar
-            return pd.read_csv(caminho, encoding='iso-8859-1', skiprows=skiprows, on_bad_lines='warn', delimiter=';')
-    else:
-        raise ValueError("Formato de arquivo não suportado.")
+
+from Chaves import normalizar_chave
+from Compacto import compactar_resultado, liberar_memoria
+from Historico import registrar
+from Metricas import MB, contar, etapa, memoria_rss, progresso
+from Planilha import TAMANHO_BLOCO, deve_ler_em_blocos, juntar_blocos, ler_csv_em_blocos, ler_planilha
+from Sessao import PlanilhaAX, ax_da_janela, caminho_ax_da_sessao
+from Exportacao import FORMATOS_EXPORTACAO
+from Tarefas import obter_agendador
+from Visualizacao import IndicadorProgresso, PainelPaginado, exportar_em_segundo_plano, selecionar_planilhas_ax
+
+# Colunas lidas da planilha de emitidas e seus tipos (None mantém a inferência do pandas).
+# A chave é lida como texto e convertida para inteiro sem passar por float.
+COLUNAS_FATURAMENTO = {'Título': str, 'Nº da Nota Fiscal Eletrônica': None}
 
 # Repassando os campos de busca, ou seja, relacionando as Tabelas com colunas correspondentes
 # Coluna 'Fatura' da Planilha do AX
 # Coluna 'Título' da Planilha de Faturamento
-def encontrar_nfs_e(planilha_ax, planilha_faturamento):
-    ax_df = ler_planilha(planilha_ax, skiprows=11)
-    faturamento_df = ler_planilha(planilha_faturamento, skiprows=7)
+# planilha_ax é o caminho da planilha ou a PlanilhaAX já carregada na sessão.
+# Com medicao, o tempo e a memória de cada etapa são registrados (veja Metricas)
+def encontrar_nfs_e(planilha_ax, planilha_faturamento, medicao=None):
+    if deve_ler_em_blocos(planilha_faturamento):
+        with etapa(medicao, 'Leitura e junção em blocos'):
+            return juntar_blocos(encontrar_nfs_e_em_blocos(planilha_ax, planilha_faturamento, medicao=medicao), ['Título'])
+
+    ax = PlanilhaAX.obter(planilha_ax, medicao)
+    with etapa(medicao, 'Leitura emitidas'):
+        faturamento_df = ler_planilha(planilha_faturamento, skiprows=7, colunas=COLUNAS_FATURAMENTO)
+    contar(medicao, 'emitidas', len(faturamento_df))
     
     # Remove duplicate columns in 'faturamento_df' by renaming them
     faturamento_df = faturamento_df.rename(columns=lambda x: f"{x}_{faturamento_df.columns.tolist().count(x)}" if faturamento_df.columns.tolist().count(x) > 1 else x)
     
-    ax_df['Fatura'] = ax_df['Fatura'].astype(float)
-    faturamento_df['Título'] = faturamento_df['Título'].astype(float)
+    with etapa(medicao, 'Normalização'):
+        faturamento_df['Título'] = normalizar_chave(faturamento_df['Título'])
+    registrar('emitidas', planilha_faturamento, faturamento_df, medicao)
     
-    # Realiza o merge para pegar os registros de faturamento que não têm correspondência em AX (left anti join)
-    resultado = pd.merge(faturamento_df[['Título']], ax_df[['Fatura']], left_on='Título', right_on='Fatura', how='left', indicator=True)
-    
-    # Filtra os registros da planilha de faturamento que não têm correspondência na planilha AX
-    resultado_final = resultado[resultado['_merge'] == 'left_only'].drop(columns=['_merge'])
+    # Registros de faturamento que não têm correspondência em AX (left anti join)
+    with etapa(medicao, 'Junção'):
+        resultado = faturamento_df[['Título']]
+        resultado_final = resultado[~ax.contem(resultado['Título'])]
     
     # Seleciona as colunas para o resultado final, verificando se elas existem antes de tentar acessá-las
     colunas_resultado = ['Título']
@@ -44,13 +50,25 @@ def encontrar_nfs_e(planilha_ax, planilha_faturamento):
     resultado_final = resultado_final[colunas_resultado]
     return resultado_final
 
-class ApplicationComparador(tk.Toplevel):
+# Versão em blocos para arquivos CSV grandes de emitidas: só as faturas do AX ficam em memória
+# e cada bloco do CSV é filtrado contra elas (left anti join)
+def encontrar_nfs_e_em_blocos(planilha_ax, planilha_faturamento, tamanho_bloco=TAMANHO_BLOCO, medicao=None):
+    ax = PlanilhaAX.obter(planilha_ax)
+
+    linhas_lidas = 0
+    for bloco in ler_csv_em_blocos(planilha_faturamento, skiprows=7, colunas=COLUNAS_FATURAMENTO, tamanho_bloco=tamanho_bloco):
+        linhas_lidas += len(bloco)
+        progresso(medicao, linhas_lidas=linhas_lidas)
+        titulos = normalizar_chave(bloco['Título'])
+        yield titulos[~ax.contem(titulos)].to_frame()
+
+class ApplicationFaturamento(tk.Toplevel):
     def __init__(self, master=None):
         super().__init__(master)  # Chama o inicializador da classe base corretamente
         self.title("Sistema de Validação")
         self.geometry("800x600")
         self.create_widgets()
-        self.ax_file_path = ""  # Inicializa a variável
+        self.ax_file_path = caminho_ax_da_sessao(self)  # A planilha AX já carregada no menu, se houver
         self.faturamento_file_path = ""  # Inicializa a variável
 
     def create_widgets(self):
@@ -74,8 +92,15 @@ class ApplicationComparador(tk.Toplevel):
         self.btn_process = ttk.Button(frame, text="Processar", command=self.process_files)
         self.btn_process.pack(side=tk.LEFT, padx=10)
         
-        self.text_result = tk.Text(self.tab_nfs_e, height=10, width=75)
-        self.text_result.pack(pady=20)
+        self.indicador = IndicadorProgresso(self.tab_nfs_e)
+        self.indicador.pack()
+        
+        # Tempo de cada etapa da última execução
+        self.label_metricas = ttk.Label(self.tab_nfs_e, text="", wraplength=760)
+        self.label_metricas.pack()
+        
+        self.painel_resultado = PainelPaginado(self.tab_nfs_e, height=10, width=75)
+        self.painel_resultado.pack(pady=20, expand=True, fill=tk.BOTH)
         
         frame_botoes_inferiores = ttk.Frame(self.tab_nfs_e)
         frame_botoes_inferiores.pack(pady=10)
@@ -89,10 +114,10 @@ class ApplicationComparador(tk.Toplevel):
         self.ax_file_path = ""
         self.faturamento_file_path = ""
         self.last_result = None
-        self.loading_label = None  # Inicializa o label de carregamento
 
     def load_file(self, file_type):
-        file_path = filedialog.askopenfilename()
+        # Várias planilhas AX (por exemplo, uma por empresa ou período) são unidas antes da comparação
+        file_path = selecionar_planilhas_ax() if file_type == "ax" else filedialog.askopenfilename()
         if file_path:
             if file_type == "ax":
                 self.ax_file_path = file_path
@@ -102,61 +127,88 @@ class ApplicationComparador(tk.Toplevel):
                 self.btn_select_faturamento.config(bg='green')
 
     def process_files(self):
+        if self.indicador.ocupado:
+            return  # Já existe um processamento em andamento nesta janela
         if self.ax_file_path and self.faturamento_file_path:
-            self.loading_label = tk.Label(self.tab_nfs_e, text="Processando...", fg="blue")
-            self.loading_label.pack()
-            thread = threading.Thread(target=self.process_files_in_thread)
-            thread.start()
+            tarefa = obter_agendador().enviar(
+                ('faturamento', self.ax_file_path, self.faturamento_file_path),
+                self.process_files_in_thread, self.ax_file_path, self.faturamento_file_path,
+            )
+            self.indicador.acompanhar(
+                tarefa,
+                ao_concluir=lambda resultado: self.show_processed(resultado, tarefa.medicao),
+                ao_falhar=lambda erro: self.show_failure(erro, tarefa.medicao),
+                ao_cancelar=lambda: self.show_cancelled(tarefa.medicao),
+            )
         else:
             messagebox.showerror("Erro", "Por favor, selecione ambos os arquivos antes de processar.")
 
-    def process_files_in_thread(self):
-        try:
-            self.last_result = encontrar_nfs_e(self.ax_file_path, self.faturamento_file_path)
-            self.show_result(self.last_result)
-        except Exception as e:
-            messagebox.showerror("Erro", str(e))
-            self.show_error(str(e))
-        finally:
-            if self.loading_label:
-                self.loading_label.destroy()  # Remove o indicador de carregamento
-
-    def show_result(self, resultado):
-        self.text_result.delete('1.0', tk.END)
-        if not resultado.empty:
-            resultado_str = resultado.applymap(lambda x: int(x) if isinstance(x, float) and x.is_integer() else x)
-            self.text_result.insert(tk.END, resultado_str.to_string(index=False))
-        else:
-            self.text_result.insert(tk.END, "Nenhuma correspondência encontrada.")
+    # Roda em uma thread do agendador: não acessa os widgets, que só são atualizados pelos callbacks do indicador
+    def process_files_in_thread(self, tarefa, ax_file_path, faturamento_file_path):
+        with tarefa.medir('faturamento', ax=ax_file_path, emitidas=faturamento_file_path) as medicao:
+            resultado = encontrar_nfs_e(ax_da_janela(self, ax_file_path, medicao), faturamento_file_path, medicao)
+            return compactar_resultado(resultado, medicao, chaves=('Título', 'Nº da Nota Fiscal Eletrônica'))
+
+    def show_processed(self, resultado, medicao):
+        self.last_result = resultado
+        self.show_result(resultado, medicao)
+
+    def show_failure(self, erro, medicao):
+        self.show_metrics(medicao)
+        self.show_error(str(erro))
+        messagebox.showerror("Erro", str(erro))
+
+    def show_cancelled(self, medicao):
+        self.show_metrics(medicao)
+        self.painel_resultado.mostrar_mensagem("Processamento cancelado.")
+
+    def show_result(self, resultado, medicao=None):
+        with etapa(medicao, 'Renderização'):
+            if not resultado.empty:
+                self.painel_resultado.mostrar(resultado)  # Formata e exibe apenas a primeira página
+            else:
+                self.painel_resultado.mostrar_mensagem("Nenhuma correspondência encontrada.")
+        if medicao:
+            contar(medicao, 'resultado', len(resultado))
+            medicao.finalizar()
+            self.show_metrics(medicao)
+            
+    def show_metrics(self, medicao):
+        if medicao:
+            self.label_metricas.config(text=medicao.resumo())
             
     def show_error(self, message):
-        self.text_result.delete('1.0', tk.END)
-        self.text_result.insert(tk.END, message)
+        self.painel_resultado.mostrar_mensagem(message)
         
     def export_result(self):
         if self.last_result is not None and not self.last_result.empty:
-            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+            file_type = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=FORMATOS_EXPORTACAO)
             if file_type:
-                if file_type.endswith('.xlsx'):
-                    self.last_result.to_excel(file_type, index=False)
-                elif file_type.endswith('.csv'):
-                    self.last_result.to_csv(file_type, index=False)
-                messagebox.showinfo("Exportar", "Resultado exportado com sucesso.")
+                # Grava em segundo plano, bloco a bloco, com o andamento no indicador
+                exportar_em_segundo_plano(self, self.last_result, file_type, 'faturamento_exportacao', 'resultado', "Resultado exportado com sucesso.")
             else:
                 messagebox.showinfo("Ação necessária", "Exportação cancelada.")
         else:
             messagebox.showerror("Erro", "Nenhum resultado para exportar. Por favor, processe os arquivos primeiro.")
             
     def clear_results(self):
-        self.text_result.delete('1.0', tk.END)
+        self.painel_resultado.limpar()
+        self.label_metricas.config(text="")
         self.btn_select_ax.config(bg='light grey')
         self.btn_select_faturamento.config(bg='light grey')
         self.ax_file_path = ""
         self.faturamento_file_path = ""
         self.last_result = None
-        
+        self.show_memory()
+
+    def show_memory(self):
+        """Memória do processo depois de liberar os resultados."""
+        liberar_memoria()
+        rss = memoria_rss()
+        self.label_metricas.config(text="" if rss is None else f"Memória do processo: {rss / MB:.0f} MB")
+
 if __name__ == "__main__":
     root = tk.Tk()
     root.withdraw()  # Esconde a janela principal
-    app = ApplicationComparador()
+    app = ApplicationFaturamento(master=root)
     app.mainloop()
@@ -0,0 +1,426 @@
+import argparse
+import contextlib
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+
+import Cache
+from Chaves import normalizar_chave
+from Metricas import etapa, progresso
+
+logger = logging.getLogger(__name__)
+
+# Banco SQLite com as planilhas já importadas (por padrão, no diretório do cache)
+HISTORICO_DB = os.environ.get('NFSE_HISTORICO', os.path.join(Cache.CACHE_DIR, 'historico.sqlite'))
+
+# Com NFSE_HISTORICO_AUTOMATICO=1, cada planilha lida por uma conciliação também é importada no histórico
+HISTORICO_AUTOMATICO = os.environ.get('NFSE_HISTORICO_AUTOMATICO', '0') == '1'
+
+# Fonte -> tabela e colunas da planilha -> colunas da tabela. As chaves são gravadas como inteiros
+# (veja normalizar_chave); as demais colunas, como texto.
+FONTES = {
+    'ax': {'Fatura': 'fatura', 'Status': 'status', 'Conta de cliente': 'conta_cliente'},
+    'prefeitura': {'Número do RPS': 'rps', 'Nº NFS-e': 'nfs_e', 'Nº da Nota Fiscal Eletrônica': 'nfs_e'},
+    'clinica': {'NFAX': 'nfax'},
+    'emitidas': {'Título': 'titulo', 'Nº da Nota Fiscal Eletrônica': 'nf_e'},
+    'banco': {'Nosso Número': 'nosso_numero'},
+}
+CHAVES = {
+    'ax': ['fatura'],
+    'prefeitura': ['rps', 'nfs_e'],
+    'clinica': ['nfax'],
+    'emitidas': ['titulo'],
+    'banco': ['nosso_numero'],
+}
+
+ESQUEMA = """
+PRAGMA foreign_keys = ON;
+CREATE TABLE IF NOT EXISTS importacoes (
+    id INTEGER PRIMARY KEY,
+    fonte TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    bytes INTEGER,
+    modificado_ns INTEGER,
+    data TEXT NOT NULL,
+    linhas INTEGER NOT NULL,
+    UNIQUE (fonte, arquivo, bytes, modificado_ns)
+);
+CREATE TABLE IF NOT EXISTS ax (importacao INTEGER NOT NULL REFERENCES importacoes (id) ON DELETE CASCADE, fatura INTEGER, status TEXT, conta_cliente TEXT);
+CREATE TABLE IF NOT EXISTS prefeitura (importacao INTEGER NOT NULL REFERENCES importacoes (id) ON DELETE CASCADE, rps INTEGER, nfs_e INTEGER);
+CREATE TABLE IF NOT EXISTS clinica (importacao INTEGER NOT NULL REFERENCES importacoes (id) ON DELETE CASCADE, nfax INTEGER);
+CREATE TABLE IF NOT EXISTS emitidas (importacao INTEGER NOT NULL REFERENCES importacoes (id) ON DELETE CASCADE, titulo INTEGER, nf_e INTEGER);
+CREATE TABLE IF NOT EXISTS banco (importacao INTEGER NOT NULL REFERENCES importacoes (id) ON DELETE CASCADE, nosso_numero INTEGER);
+CREATE INDEX IF NOT EXISTS ax_fatura ON ax (fatura, importacao);
+CREATE INDEX IF NOT EXISTS prefeitura_rps ON prefeitura (rps, importacao);
+CREATE INDEX IF NOT EXISTS prefeitura_nfs_e ON prefeitura (nfs_e, importacao);
+CREATE INDEX IF NOT EXISTS clinica_nfax ON clinica (nfax, importacao);
+CREATE INDEX IF NOT EXISTS emitidas_titulo ON emitidas (titulo, importacao);
+CREATE INDEX IF NOT EXISTS banco_nosso_numero ON banco (nosso_numero, importacao);
+CREATE INDEX IF NOT EXISTS ax_importacao ON ax (importacao);
+CREATE INDEX IF NOT EXISTS prefeitura_importacao ON prefeitura (importacao);
+CREATE INDEX IF NOT EXISTS clinica_importacao ON clinica (importacao);
+CREATE INDEX IF NOT EXISTS emitidas_importacao ON emitidas (importacao);
+CREATE INDEX IF NOT EXISTS banco_importacao ON banco (importacao);
+"""
+
+
+def conectar(caminho=None):
+    """Abre o histórico, criando as tabelas e os índices na primeira vez."""
+    caminho = caminho or HISTORICO_DB
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    conexao = sqlite3.connect(caminho, timeout=30)
+    # WAL: as consultas não esperam uma importação em andamento (e vice-versa)
+    conexao.execute('PRAGMA journal_mode = WAL')
+    conexao.execute('PRAGMA synchronous = NORMAL')
+    conexao.executescript(ESQUEMA)
+    return conexao
+
+
+@contextlib.contextmanager
+def _conexao(conexao=None, caminho=None):
+    if conexao is not None:
+        yield conexao
+        return
+    conexao = conectar(caminho)
+    try:
+        yield conexao
+    finally:
+        conexao.close()
+
+
+def _texto(valor):
+    # Números lidos como float (uma coluna com células vazias) voltam a ser inteiros: 1001.0 vira '1001'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _valores(serie, chave):
+    # Listas Python para o executemany, com None nas células vazias
+    if chave:
+        serie = normalizar_chave(serie)
+        return serie.astype(object).where(serie.notna(), None).tolist()
+    return [None if pd.isna(valor) else _texto(valor) for valor in serie.tolist()]
+
+
+def importar(fonte, caminho, df, conexao=None, medicao=None):
+    """Grava as linhas da planilha em uma única transação e retorna o id da importação.
+
+    Um arquivo já importado (mesmo caminho, tamanho e data de modificação) não é gravado de novo.
+    """
+    # Na prefeitura, a NFS-e vem em uma das duas colunas: vale a primeira que existir
+    colunas = {}
+    for coluna, destino in FONTES[fonte].items():
+        if coluna in df.columns and destino not in colunas.values():
+            colunas[coluna] = destino
+    if not colunas:
+        raise ValueError(f"A planilha não possui as colunas da fonte {fonte}: {', '.join(FONTES[fonte])}")
+
+    arquivo = os.path.abspath(caminho)
+    info = os.stat(caminho)
+    with _conexao(conexao) as conexao:
+        existente = conexao.execute(
+            'SELECT id FROM importacoes WHERE fonte = ? AND arquivo = ? AND bytes = ? AND modificado_ns = ?',
+            (fonte, arquivo, info.st_size, info.st_mtime_ns)).fetchone()
+        if existente:
+            logger.info("%s: já está no histórico", os.path.basename(caminho))
+            return existente[0]
+
+        # Com colunas repetidas na planilha, vale a primeira
+        listas = [_valores(df.loc[:, [coluna]].iloc[:, 0], destino in CHAVES[fonte]) for coluna, destino in colunas.items()]
+        with conexao:  # Uma transação por arquivo
+            cursor = conexao.execute(
+                'INSERT INTO importacoes (fonte, arquivo, bytes, modificado_ns, data, linhas) VALUES (?, ?, ?, ?, ?, ?)',
+                (fonte, arquivo, info.st_size, info.st_mtime_ns, time.strftime('%Y-%m-%dT%H:%M:%S'), len(df)))
+            importacao = cursor.lastrowid
+            nomes = ', '.join(['importacao'] + list(colunas.values()))
+            marcadores = ', '.join('?' * (len(colunas) + 1))
+            conexao.executemany(f'INSERT INTO {fonte} ({nomes}) VALUES ({marcadores})',
+                                zip([importacao] * len(df), *listas))
+        progresso(medicao, linhas={f'histórico {fonte}': len(df)})
+        logger.info("%s: %d linha(s) importada(s) no histórico (%s)", os.path.basename(caminho), len(df), fonte)
+        return importacao
+
+
+def registrar(fonte, caminho, df, medicao=None):
+    """Importa a planilha lida por uma conciliação, se a importação automática estiver ativada.
+
+    Uma falha ao gravar o histórico não interrompe a conciliação.
+    """
+    if not HISTORICO_AUTOMATICO:
+        return None
+    try:
+        with etapa(medicao, 'Histórico'):
+            return importar(fonte, caminho, df)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        logger.warning("%s: não foi possível gravar no histórico (%s)", os.path.basename(caminho), e)
+        return None
+
+
+def ler_fonte(fonte, caminho):
+    """Lê a planilha como a conciliação correspondente (mesmas colunas, linhas iniciais ignoradas e cache)."""
+    from Planilha import ler_planilha
+
+    if fonte == 'ax':
+        from Sessao import COLUNAS_AX
+        return ler_planilha(caminho, skiprows=11, colunas=COLUNAS_AX)
+    if fonte == 'prefeitura':
+        from Comparador import COLUNAS_PREFEITURA
+        return ler_planilha(caminho, colunas=COLUNAS_PREFEITURA)
+    if fonte == 'clinica':
+        from Clinica import COLUNAS_CLINICA
+        return ler_planilha(caminho, colunas=COLUNAS_CLINICA)
+    if fonte == 'emitidas':
+        from Faturamento import COLUNAS_FATURAMENTO
+        return ler_planilha(caminho, skiprows=7, colunas=COLUNAS_FATURAMENTO)
+    if fonte == 'banco':
+        from Banco import consolidar_planilhas_movimento
+        return consolidar_planilhas_movimento(caminho)
+    raise ValueError(f"Fonte desconhecida: {fonte}")
+
+
+def importar_arquivos(fonte, arquivos, caminho=None, medicao=None):
+    """Lê e importa cada arquivo; retorna os ids das importações."""
+    importacoes = []
+    with _conexao(caminho=caminho) as conexao:
+        for arquivo in arquivos:
+            with etapa(medicao, f"Importação {os.path.basename(arquivo)}"):
+                importacoes.append(importar(fonte, arquivo, ler_fonte(fonte, arquivo), conexao, medicao))
+    return importacoes
+
+
+def listar_importacoes(fonte=None, conexao=None):
+    with _conexao(conexao) as conexao:
+        return pd.read_sql_query(
+            'SELECT id, fonte, arquivo, data, linhas FROM importacoes WHERE ? IS NULL OR fonte = ? ORDER BY id',
+            conexao, params=(fonte, fonte))
+
+
+def consultar(numero, conexao=None):
+    """Ocorrências do número (fatura, RPS, NFS-e, NFAX, título ou nosso número) em todas as importações.
+
+    Retorna um DataFrame com a fonte, o arquivo e a data da importação e as colunas da linha encontrada.
+    Cada busca usa o índice da chave, então o tempo não cresce com o tamanho do histórico.
+    """
+    chave = normalizar_chave(pd.Series([numero]))[0]
+    if pd.isna(chave):
+        raise ValueError(f"Número inválido: {numero}")
+    chave = int(chave)
+
+    partes = []
+    with _conexao(conexao) as conexao:
+        for fonte, colunas in FONTES.items():
+            nomes = {}
+            for coluna, destino in colunas.items():
+                nomes.setdefault(destino, coluna)
+            selecao = ', '.join(f't.{destino} AS "{coluna}"' for destino, coluna in nomes.items())
+            filtro = ' OR '.join(f't.{chave_fonte} = :chave' for chave_fonte in CHAVES[fonte])
+            encontrados = pd.read_sql_query(
+                f'SELECT i.data AS "Importado em", i.arquivo AS "Arquivo", {selecao} '
+                f'FROM {fonte} t JOIN importacoes i ON i.id = t.importacao WHERE {filtro} ORDER BY i.id',
+                conexao, params={'chave': chave})
+            if len(encontrados):
+                encontrados.insert(0, 'Fonte', fonte)
+                partes.append(encontrados)
+    if not partes:
+        return pd.DataFrame(columns=['Fonte', 'Importado em', 'Arquivo'])
+    return pd.concat(partes, ignore_index=True)
+
+
+# Conciliações como junções SQL. :ax é uma importação da planilha AX; :outro é uma importação
+# da outra fonte ou NULL para comparar com todo o histórico dessa fonte (por exemplo, faturas
+# que não aparecem em nenhum arquivo do banco já importado).
+CONCILIACOES = {
+    'clinica': {
+        'faltando_na_clinica': """
+            SELECT c.nfax AS NFAX FROM clinica c
+            WHERE (:outro IS NULL OR c.importacao = :outro)
+              AND NOT EXISTS (SELECT 1 FROM ax a WHERE a.fatura = c.nfax AND a.importacao = :ax)
+            GROUP BY c.nfax ORDER BY MIN(c.rowid)""",
+        'faltando_no_ax': """
+            SELECT a.fatura AS Fatura FROM ax a
+            WHERE a.importacao = :ax AND a.fatura IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM clinica c WHERE c.nfax = a.fatura AND (:outro IS NULL OR c.importacao = :outro))
+            GROUP BY a.fatura ORDER BY MIN(a.rowid)""",
+    },
+    'comparador': {
+        'nfs_e': """
+            SELECT a.fatura AS Fatura, a.status AS Status, p.nfs_e AS "Nº NFS-e" FROM ax a
+            JOIN prefeitura p ON p.rps = a.fatura AND (:outro IS NULL OR p.importacao = :outro)
+            WHERE a.importacao = :ax AND a.status IS NOT NULL AND p.nfs_e IS NOT NULL
+            ORDER BY a.rowid, p.rowid""",
+    },
+    'faturamento': {
+        'emitidas_sem_ax': """
+            SELECT e.titulo AS "Título", e.nf_e AS "Nº da Nota Fiscal Eletrônica" FROM emitidas e
+            WHERE (:outro IS NULL OR e.importacao = :outro)
+              AND NOT EXISTS (SELECT 1 FROM ax a WHERE a.fatura = e.titulo AND a.importacao = :ax)
+            ORDER BY e.rowid""",
+    },
+    'banco': {
+        'faturas_sem_pagamento': """
+            SELECT a.status AS Status, a.fatura AS Fatura, a.conta_cliente AS "Conta de cliente" FROM ax a
+            WHERE a.importacao = :ax AND a.fatura IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM banco b WHERE b.nosso_numero = a.fatura AND (:outro IS NULL OR b.importacao = :outro))
+            ORDER BY a.rowid""",
+    },
+}
+
+
+def conciliar(tipo, importacao_ax=None, importacao_outro=None, conexao=None):
+    """Executa a conciliação no histórico e retorna os resultados nomeados (como em Lote).
+
+    Sem importacao_ax, usa a última planilha AX importada; sem importacao_outro, todo o histórico da outra fonte.
+    """
+    with _conexao(conexao) as conexao:
+        if importacao_ax is None:
+            ultima = conexao.execute("SELECT MAX(id) FROM importacoes WHERE fonte = 'ax'").fetchone()[0]
+            if ultima is None:
+                raise ValueError("Nenhuma planilha AX no histórico.")
+            importacao_ax = ultima
+        parametros = {'ax': importacao_ax, 'outro': importacao_outro}
+        return {nome: pd.read_sql_query(sql, conexao, params=parametros) for nome, sql in CONCILIACOES[tipo].items()}
+
+
+class ApplicationHistorico(tk.Toplevel):
+    def __init__(self, master=None):
+        super().__init__(master)
+        self.title("Histórico de Faturas")
+        self.geometry("900x600")
+        self.create_widgets()
+
+    def create_widgets(self):
+        from Visualizacao import IndicadorProgresso, PainelPaginado
+
+        frame_importacao = ttk.Frame(self)
+        frame_importacao.pack(pady=10)
+        ttk.Label(frame_importacao, text="Fonte:").pack(side=tk.LEFT)
+        self.fonte = tk.StringVar(value='ax')
+        ttk.Combobox(frame_importacao, textvariable=self.fonte, values=list(FONTES), state='readonly', width=12).pack(side=tk.LEFT, padx=5)
+        self.btn_importar = ttk.Button(frame_importacao, text="Importar Planilhas", command=self.import_files)
+        self.btn_importar.pack(side=tk.LEFT, padx=5)
+
+        self.indicador = IndicadorProgresso(self)
+        self.indicador.pack()
+
+        frame_consulta = ttk.Frame(self)
+        frame_consulta.pack(pady=10)
+        ttk.Label(frame_consulta, text="Fatura, RPS, NFS-e, NFAX ou Nosso Número:").pack(side=tk.LEFT)
+        self.numero = tk.StringVar()
+        entrada = ttk.Entry(frame_consulta, textvariable=self.numero, width=20)
+        entrada.pack(side=tk.LEFT, padx=5)
+        entrada.bind('<Return>', lambda event: self.search())
+        ttk.Button(frame_consulta, text="Consultar", command=self.search).pack(side=tk.LEFT, padx=5)
+
+        self.label_metricas = ttk.Label(self, text="", wraplength=860)
+        self.label_metricas.pack()
+
+        self.painel_resultado = PainelPaginado(self, height=15, width=100)
+        self.painel_resultado.pack(pady=10, expand=True, fill=tk.BOTH)
+
+    def import_files(self):
+        from Tarefas import obter_agendador
+
+        if self.indicador.ocupado:
+            return
+        arquivos = filedialog.askopenfilenames(title="Planilhas para o histórico")
+        if not arquivos:
+            return
+        fonte = self.fonte.get()
+        tarefa = obter_agendador().enviar(('historico', fonte, arquivos), self.import_files_in_thread, fonte, arquivos)
+        self.indicador.acompanhar(
+            tarefa,
+            ao_concluir=lambda medicao: self.show_imported(medicao, len(arquivos)),
+            ao_falhar=lambda erro: self.show_failure(erro, tarefa.medicao),
+            ao_cancelar=lambda: self.show_metrics(tarefa.medicao),
+        )
+
+    # Roda em uma thread do agendador: não acessa os widgets
+    def import_files_in_thread(self, tarefa, fonte, arquivos):
+        with tarefa.medir('historico_importacao', **{f'arquivo_{numero}': arquivo for numero, arquivo in enumerate(arquivos, start=1)}) as medicao:
+            importar_arquivos(fonte, arquivos, medicao=medicao)
+        return medicao
+
+    def show_imported(self, medicao, quantidade):
+        medicao.finalizar()
+        self.show_metrics(medicao)
+        messagebox.showinfo("Histórico", f"{quantidade} planilha(s) importada(s).")
+
+    def show_failure(self, erro, medicao):
+        self.show_metrics(medicao)
+        messagebox.showerror("Erro", str(erro))
+
+    def show_metrics(self, medicao):
+        if medicao:
+            self.label_metricas.config(text=medicao.resumo())
+
+    def search(self):
+        inicio = time.perf_counter()
+        try:
+            encontrados = consultar(self.numero.get().strip())
+        except (ValueError, sqlite3.Error) as e:
+            messagebox.showerror("Erro", str(e))
+            return
+        segundos = time.perf_counter() - inicio
+        self.label_metricas.config(text=f"{len(encontrados)} ocorrência(s) em {segundos:.3f}s")
+        if len(encontrados):
+            self.painel_resultado.mostrar(encontrados)
+        else:
+            self.painel_resultado.mostrar_mensagem("Número não encontrado no histórico.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Histórico das planilhas em SQLite: importação, consulta e conciliação.")
+    parser.add_argument('--banco', default=None, help=f"Arquivo SQLite (padrão: {HISTORICO_DB})")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    importacao = comandos.add_parser('importar', help="Importa planilhas de uma fonte")
+    importacao.add_argument('fonte', choices=list(FONTES))
+    importacao.add_argument('arquivos', nargs='+')
+
+    comandos.add_parser('importacoes', help="Lista as importações")
+
+    consulta = comandos.add_parser('consultar', help="Procura um número em todas as importações")
+    consulta.add_argument('numero')
+
+    conciliacao = comandos.add_parser('conciliar', help="Executa uma conciliação no histórico")
+    conciliacao.add_argument('tipo', choices=list(CONCILIACOES))
+    conciliacao.add_argument('--ax', type=int, default=None, help="Importação da planilha AX (padrão: a última)")
+    conciliacao.add_argument('--outro', type=int, default=None, help="Importação da outra fonte (padrão: todo o histórico)")
+    conciliacao.add_argument('--saida', default='.', help="Diretório dos CSVs de resultado")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    with _conexao(caminho=args.banco) as conexao:
+        try:
+            if args.comando == 'importar':
+                for arquivo in args.arquivos:
+                    importar(args.fonte, arquivo, ler_fonte(args.fonte, arquivo), conexao)
+            elif args.comando == 'importacoes':
+                print(listar_importacoes(conexao=conexao).to_string(index=False))
+            elif args.comando == 'consultar':
+                inicio = time.perf_counter()
+                encontrados = consultar(args.numero, conexao)
+                print(encontrados.to_string(index=False) if len(encontrados) else "Número não encontrado no histórico.")
+                print(f"{len(encontrados)} ocorrência(s) em {time.perf_counter() - inicio:.3f}s")
+            else:
+                os.makedirs(args.saida, exist_ok=True)
+                for nome, df in conciliar(args.tipo, args.ax, args.outro, conexao).items():
+                    destino = os.path.join(args.saida, f"{args.tipo}_{nome}.csv")
+                    df.to_csv(destino, index=False, sep=';')
+                    print(f"{destino}: {len(df)} linha(s)")
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
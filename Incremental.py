@@ -0,0 +1,199 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import Cache
+from Chaves import NULO, contem, juntar, valores_chave
+from Comparador import juntar_nfs_e, ler_nfs_e
+from Metricas import etapa
+
+# Estado de cada fonte: as planilhas normalizadas e o resultado da última execução
+ESTADO_DIR = os.path.join(Cache.CACHE_DIR, 'estado')
+PARTES = ('ax', 'prefeitura', 'resultado')
+COLUNAS_MUDANCAS = ['Fatura', 'Origem', 'Mudança', 'Antes', 'Depois']
+# Guardada só no estado: qual das linhas do AX com a mesma fatura (0 na primeira) gerou a linha do resultado
+OCORRENCIA = '_ocorrencia_ax'
+
+
+def _pasta(fonte):
+    return os.path.join(ESTADO_DIR, fonte)
+
+
+def carregar_estado(fonte):
+    """Retorna {'ax', 'prefeitura', 'resultado'} da última execução da fonte, ou None."""
+    pasta = _pasta(fonte)
+    arquivos = {parte: os.path.join(pasta, parte + '.pkl') for parte in PARTES}
+    if not all(os.path.exists(arquivo) for arquivo in arquivos.values()):
+        return None
+    return {parte: pd.read_pickle(arquivo) for parte, arquivo in arquivos.items()}
+
+
+def salvar_estado(fonte, **partes):
+    pasta = _pasta(fonte)
+    os.makedirs(pasta, exist_ok=True)
+    for parte in PARTES:
+        temporario = os.path.join(pasta, f"{parte}.{os.getpid()}.tmp")
+        partes[parte].to_pickle(temporario)
+        os.replace(temporario, os.path.join(pasta, parte + '.pkl'))
+
+
+def limpar_estado(fonte):
+    shutil.rmtree(_pasta(fonte), ignore_errors=True)
+
+
+def _uniforme(serie):
+    # Os mesmos valores lidos com outro tipo (10 e 10.0, ou uma coluna inteira que ganhou um vazio)
+    # ficam com o mesmo tipo, para não parecerem alterados: números em Float64, o restante em texto
+    if serie.dtype == object and pd.api.types.infer_dtype(serie, skipna=True) in ('integer', 'floating', 'mixed-integer-float'):
+        serie = pd.to_numeric(serie)
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        return serie.astype('Float64')
+    return serie.astype('string')
+
+
+def assinaturas(df, coluna_chave):
+    """Soma dos hashes das linhas de cada chave: muda quando qualquer linha da chave é incluída, removida ou alterada.
+
+    Os valores são comparados como números ou texto, então só o tipo de uma coluna mudar não altera a assinatura.
+    Trocar a ordem das linhas de uma mesma chave também a altera, porque muda a ordem do merge.
+    """
+    chaves = valores_chave(df[coluna_chave])
+    valores = pd.DataFrame({coluna: _uniforme(df[coluna]) for coluna in df.columns if coluna != coluna_chave})
+    valores[coluna_chave] = chaves
+    valores[OCORRENCIA] = _ocorrencias(chaves)
+    hashes = pd.util.hash_pandas_object(valores, index=False).to_numpy()
+    unicas, grupos = np.unique(chaves, return_inverse=True)
+    soma = np.zeros(len(unicas), dtype='uint64')
+    np.add.at(soma, grupos, hashes)
+    return unicas, soma
+
+
+def comparar_assinaturas(anterior, atual):
+    """Retorna as chaves incluídas, removidas e alteradas entre duas assinaturas."""
+    todas = np.union1d(anterior[0], atual[0])
+
+    def localizar(chaves, soma):
+        if len(chaves) == 0:
+            return np.zeros(len(todas), dtype=bool), np.zeros(len(todas), dtype='uint64')
+        posicoes = np.minimum(np.searchsorted(chaves, todas), len(chaves) - 1)
+        presente = chaves[posicoes] == todas
+        return presente, np.where(presente, soma[posicoes], 0)
+
+    estava, soma_anterior = localizar(*anterior)
+    esta, soma_atual = localizar(*atual)
+    incluidas = todas[esta & ~estava]
+    removidas = todas[estava & ~esta]
+    alteradas = todas[esta & estava & (soma_anterior != soma_atual)]
+    return incluidas, removidas, alteradas
+
+
+def _descrever(df, coluna_chave, colunas, chaves):
+    """Texto dos valores de cada chave (apenas para as chaves que mudaram)."""
+    if len(chaves) == 0 or not colunas:
+        return pd.Series(dtype=object)
+    linhas = df.loc[contem(df[coluna_chave], pd.Series(chaves)), [coluna_chave] + colunas]
+    texto = linhas[colunas].astype('string').fillna('').agg(' / '.join, axis=1)  # Células vazias viram ''
+    return texto.groupby(valores_chave(linhas[coluna_chave])).agg(lambda valores: ', '.join(pd.unique(valores)))
+
+
+def _mudancas(origem, anterior, atual, coluna_chave, colunas, incluidas, removidas, alteradas):
+    antes = _descrever(anterior, coluna_chave, colunas, np.concatenate([removidas, alteradas]))
+    depois = _descrever(atual, coluna_chave, colunas, np.concatenate([incluidas, alteradas]))
+    partes = []
+    for mudanca, chaves in (('incluída', incluidas), ('removida', removidas), ('alterada', alteradas)):
+        chaves = chaves[chaves != NULO]  # Linhas sem chave (como a de totais) não entram no relatório
+        partes.append(pd.DataFrame({
+            'Fatura': pd.array(chaves, dtype='Int64'),
+            'Origem': origem,
+            'Mudança': mudanca,
+            'Antes': antes.reindex(chaves).to_numpy(),
+            'Depois': depois.reindex(chaves).to_numpy(),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+
+def _ocorrencias(chaves):
+    """Número de cada linha entre as linhas com a mesma chave (0 na primeira)."""
+    return pd.Series(chaves).groupby(chaves).cumcount().to_numpy()
+
+
+def _juntar(ax_df, prefeitura_df, ocorrencias):
+    """juntar_nfs_e, com a ocorrência da linha do AX que gerou cada linha do resultado."""
+    resultado = juntar_nfs_e(ax_df, prefeitura_df)
+    # O índice do resultado é a linha do merge, na ordem das posições devolvidas por juntar
+    posicoes_ax, _ = juntar(ax_df['Fatura'], prefeitura_df['Número do RPS'], como='left')
+    linhas_ax = posicoes_ax[resultado.index.to_numpy()]
+    resultado = resultado.reset_index(drop=True)
+    resultado[OCORRENCIA] = ocorrencias[linhas_ax]
+    return resultado
+
+
+def _ordenar_como_ax(resultado, ax_df, ocorrencias):
+    """Ordena o resultado pela linha do AX que gerou cada linha, como no merge completo."""
+    linhas_ax = pd.MultiIndex.from_arrays([valores_chave(ax_df['Fatura']), ocorrencias])
+    posicoes = linhas_ax.get_indexer(pd.MultiIndex.from_arrays([valores_chave(resultado['Fatura']), resultado[OCORRENCIA].to_numpy()]))
+    return resultado.iloc[np.argsort(posicoes, kind='stable')].reset_index(drop=True)
+
+
+# Conciliação AX x prefeitura incremental: compara as planilhas com as da última execução da fonte,
+# refaz o merge apenas das faturas que mudaram e reaproveita o restante do resultado anterior.
+# Retorna o resultado completo e as mudanças desde a última execução.
+def encontrar_nfs_e_incremental(planilha_ax, planilha_prefeitura, fonte='prefeitura', medicao=None):
+    ax_df, prefeitura_df = ler_nfs_e(planilha_ax, planilha_prefeitura, medicao)
+    with etapa(medicao, 'Junção incremental'):
+        return _conciliar_incremental(ax_df[['Fatura', 'Status']], prefeitura_df, fonte)
+
+
+def _conciliar_incremental(ax_df, prefeitura_df, fonte):
+    estado = carregar_estado(fonte)
+    ocorrencias = _ocorrencias(valores_chave(ax_df['Fatura']))
+
+    if (estado is None or list(estado['prefeitura'].columns) != list(prefeitura_df.columns)
+            or OCORRENCIA not in estado['resultado'].columns):
+        # Primeira execução (ou planilha com outras colunas, ou estado de uma versão anterior): merge completo
+        resultado = _juntar(ax_df, prefeitura_df, ocorrencias)
+        salvar_estado(fonte, ax=ax_df, prefeitura=prefeitura_df, resultado=resultado)
+        resultado = resultado.drop(columns=OCORRENCIA)
+        mudancas = pd.DataFrame({
+            'Fatura': resultado['Fatura'].drop_duplicates().to_numpy(),
+            'Origem': 'Resultado',
+            'Mudança': 'primeira execução',
+            'Antes': None,
+            'Depois': None,
+        }, columns=COLUNAS_MUDANCAS)
+        return resultado, mudancas
+
+    colunas_nfs_e = [coluna for coluna in prefeitura_df.columns if coluna != 'Número do RPS']
+    mudancas_ax = comparar_assinaturas(assinaturas(estado['ax'], 'Fatura'), assinaturas(ax_df, 'Fatura'))
+    mudancas_prefeitura = comparar_assinaturas(
+        assinaturas(estado['prefeitura'], 'Número do RPS'),
+        assinaturas(prefeitura_df, 'Número do RPS'),
+    )
+    afetadas = pd.Series(np.unique(np.concatenate(mudancas_ax + mudancas_prefeitura)))
+
+    # Só as faturas afetadas passam pelo merge; as demais linhas do resultado anterior continuam válidas
+    anterior = estado['resultado']
+    mantido = anterior[~contem(anterior['Fatura'], afetadas)]
+    ax_afetado = contem(ax_df['Fatura'], afetadas)
+    refeito = _juntar(
+        ax_df[ax_afetado],
+        prefeitura_df[contem(prefeitura_df['Número do RPS'], afetadas)],
+        ocorrencias[ax_afetado],
+    )
+    # As faturas mantidas têm as mesmas linhas no AX, então a ocorrência guardada continua valendo
+    resultado = _ordenar_como_ax(pd.concat([mantido, refeito], ignore_index=True), ax_df, ocorrencias)
+
+    chaves_anteriores = np.unique(valores_chave(anterior['Fatura']))
+    chaves_atuais = np.unique(valores_chave(resultado['Fatura']))
+    sem_valores = np.array([], dtype='int64')
+    mudancas = pd.concat([
+        _mudancas('AX', estado['ax'], ax_df, 'Fatura', ['Status'], *mudancas_ax),
+        _mudancas('Prefeitura', estado['prefeitura'], prefeitura_df, 'Número do RPS', colunas_nfs_e, *mudancas_prefeitura),
+        _mudancas('Resultado', anterior, resultado, 'Fatura', [],
+                  np.setdiff1d(chaves_atuais, chaves_anteriores), np.setdiff1d(chaves_anteriores, chaves_atuais), sem_valores),
+    ], ignore_index=True)
+
+    salvar_estado(fonte, ax=ax_df, prefeitura=prefeitura_df, resultado=resultado)
+    return resultado.drop(columns=OCORRENCIA), mudancas
@@ -0,0 +1,254 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import Banco
+import Clinica
+import Comparador
+import Faturamento
+from Planilha import deve_ler_em_blocos
+from Sessao import PlanilhaAX
+
+
+# Cada conciliação recebe a planilha AX e a planilha do parceiro e devolve os resultados nomeados
+def conciliar_clinica(caminho_ax, caminho_outro):
+    faltando_na_clinica, faltando_no_ax = Clinica.comparar_planilhas(caminho_ax, caminho_outro)
+    return {'faltando_na_clinica': faltando_na_clinica, 'faltando_no_ax': faltando_no_ax}
+
+
+# Arquivos CSV grandes são conciliados em blocos e gravados à medida que são processados
+def conciliar_comparador(caminho_ax, caminho_outro):
+    if deve_ler_em_blocos(caminho_outro):
+        return {'nfs_e': Comparador.encontrar_nfs_e_em_blocos(caminho_ax, caminho_outro)}
+    return {'nfs_e': Comparador.encontrar_nfs_e(caminho_ax, caminho_outro)}
+
+
+def conciliar_faturamento(caminho_ax, caminho_outro):
+    if deve_ler_em_blocos(caminho_outro):
+        return {'emitidas_sem_ax': Faturamento.encontrar_nfs_e_em_blocos(caminho_ax, caminho_outro)}
+    return {'emitidas_sem_ax': Faturamento.encontrar_nfs_e(caminho_ax, caminho_outro)}
+
+
+# outro é a pasta, o padrão glob ou a lista das planilhas das unidades; o AX é dividido pela Conta de cliente
+def conciliar_clinicas(caminho_ax, caminho_outro):
+    resumo, faltando_na_clinica, faltando_no_ax = Clinica.comparar_unidades(caminho_ax, caminho_outro)
+    return {'unidades': resumo, 'faltando_na_clinica': faltando_na_clinica, 'faltando_no_ax': faltando_no_ax}
+
+
+def conciliar_banco(caminho_ax, caminho_outro):
+    consolidado_df = Banco.consolidar_planilhas_movimento(caminho_outro)
+    return {'faturas_sem_pagamento': Banco.comparar_consolidado_ax(consolidado_df, caminho_ax)}
+
+
+# Pelo valor: pagamentos parciais, créditos duplicados e valores divergentes (as faturas conciliadas não são gravadas)
+def conciliar_banco_valores(caminho_ax, caminho_outro):
+    consolidado_df = Banco.consolidar_planilhas_movimento(caminho_outro)
+    faturas, creditos_sem_fatura = Banco.conciliar_valores(consolidado_df, caminho_ax)
+    return {'faturas_divergentes': faturas[faturas['Situação'] != 'Conciliada'], 'creditos_sem_fatura': creditos_sem_fatura}
+
+
+CONCILIACOES = {
+    'clinica': conciliar_clinica,
+    'clinicas': conciliar_clinicas,
+    'comparador': conciliar_comparador,
+    'faturamento': conciliar_faturamento,
+    'banco': conciliar_banco,
+    'banco_valores': conciliar_banco_valores,
+}
+
+# Conciliações que recebem várias planilhas do parceiro (uma por unidade)
+VARIAS_PLANILHAS = {'clinicas'}
+
+# Colunas dos resultados em blocos, gravadas no cabeçalho quando nenhum bloco é gerado (como em juntar_blocos)
+COLUNAS_BLOCOS = {'nfs_e': ['Fatura', 'Status'], 'emitidas_sem_ax': ['Título']}
+
+
+def gravar_csv(resultado, destino, colunas=()):
+    """Grava um DataFrame, ou os blocos gerados por uma conciliação em blocos, e retorna a quantidade de linhas."""
+    if isinstance(resultado, pd.DataFrame):
+        resultado.to_csv(destino, index=False, sep=';')
+        return len(resultado)
+    linhas = 0
+    with open(destino, 'w', encoding='utf-8', newline='') as arquivo:
+        numero = -1
+        for numero, bloco in enumerate(resultado):
+            bloco.to_csv(arquivo, index=False, sep=';', header=numero == 0)
+            linhas += len(bloco)
+        if numero < 0 and colunas:
+            pd.DataFrame(columns=list(colunas)).to_csv(arquivo, index=False, sep=';')
+    return linhas
+
+
+def executar_tarefa(tarefa):
+    """Executa uma conciliação e grava os resultados em CSV. Roda dentro de um processo do pool."""
+    inicio = time.perf_counter()
+    resumo = dict(tarefa, status='ok', arquivos=[], linhas={}, erro=None)
+    try:
+        # Com várias planilhas AX, as faturas com Status diferentes entre elas também são gravadas
+        ax = PlanilhaAX.obter(tarefa['ax'])
+        resultados = CONCILIACOES[tarefa['tipo']](ax, tarefa['outro'])
+        if len(ax.conflitos):
+            resultados['conflitos_ax'] = ax.conflitos
+        os.makedirs(tarefa['saida'], exist_ok=True)
+        for nome, df in resultados.items():
+            destino = os.path.join(tarefa['saida'], f"{tarefa['nome']}_{nome}.csv")
+            resumo['linhas'][nome] = gravar_csv(df, destino, COLUNAS_BLOCOS.get(nome, ()))
+            resumo['arquivos'].append(destino)
+    except Exception as e:
+        resumo['status'] = 'erro'
+        resumo['erro'] = f"{type(e).__name__}: {e}"
+    resumo['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resumo
+
+
+def ler_manifesto(caminho, saida):
+    """Lê um manifesto JSON (lista ou uma tarefa por linha) ou CSV delimitado por ; com as colunas tipo, ax, outro e, opcionalmente, nome e saida.
+
+    ax pode ser um padrão glob (por exemplo, AX_*.xlsx) ou, no JSON, uma lista de arquivos; o mesmo vale
+    para outro nas conciliações de VARIAS_PLANILHAS, em que também pode ser uma pasta.
+    """
+    with open(caminho, encoding='utf-8') as f:
+        conteudo = f.read()
+    if caminho.endswith('.json') or caminho.endswith('.jsonl'):
+        texto = conteudo.strip()
+        if texto.startswith('['):
+            linhas = json.loads(texto)
+        else:
+            linhas = [json.loads(linha) for linha in texto.splitlines() if linha.strip()]
+    else:
+        registros = [linha.split(';') for linha in conteudo.splitlines() if linha.strip()]
+        cabecalho = [campo.strip() for campo in registros[0]]
+        linhas = [dict(zip(cabecalho, (campo.strip() for campo in registro))) for registro in registros[1:]]
+
+    base = os.path.dirname(os.path.abspath(caminho))
+    tarefas = []
+    for indice, linha in enumerate(linhas, start=1):
+        if linha.get('tipo') not in CONCILIACOES or not linha.get('ax') or not linha.get('outro'):
+            raise ValueError(f"Linha {indice} do manifesto inválida: {linha}")
+        tarefas.append({
+            'tipo': linha['tipo'],
+            'ax': tuple(os.path.join(base, ax) for ax in linha['ax']) if isinstance(linha['ax'], list) else os.path.join(base, linha['ax']),
+            'outro': tuple(os.path.join(base, outro) for outro in linha['outro']) if isinstance(linha['outro'], list) else os.path.join(base, linha['outro']),
+            'nome': linha.get('nome') or f"{indice:03d}_{linha['tipo']}",
+            'saida': os.path.join(saida, linha['saida']) if linha.get('saida') else saida,
+        })
+    return tarefas
+
+
+def tarefas_do_diretorio(diretorio, tipo, saida):
+    """Cada subdiretório é uma tarefa: os arquivos com 'ax' no nome são as planilhas AX e o outro é a do parceiro.
+
+    Nas conciliações de VARIAS_PLANILHAS, os demais arquivos são as planilhas das unidades.
+    """
+    tarefas = []
+    for nome in sorted(os.listdir(diretorio)):
+        pasta = os.path.join(diretorio, nome)
+        if not os.path.isdir(pasta):
+            continue
+        arquivos = sorted(a for a in os.listdir(pasta) if a.lower().endswith(('.xlsx', '.xls', '.csv')))
+        ax = [a for a in arquivos if 'ax' in os.path.splitext(a)[0].lower()]
+        outros = [a for a in arquivos if a not in ax]
+        varias = tipo in VARIAS_PLANILHAS
+        if not ax or not outros or (len(outros) != 1 and not varias):
+            raise ValueError(f"O diretório {pasta} deve conter ao menos uma planilha AX e exatamente uma planilha do parceiro.")
+        tarefas.append({
+            'tipo': tipo,
+            'ax': os.path.join(pasta, ax[0]) if len(ax) == 1 else tuple(os.path.join(pasta, a) for a in ax),
+            'outro': tuple(os.path.join(pasta, o) for o in outros) if varias else os.path.join(pasta, outros[0]),
+            'nome': f"{nome}_{tipo}",
+            'saida': saida,
+        })
+    return tarefas
+
+
+def _mostrar(resumo):
+    duracao = '-' if resumo['segundos'] is None else f"{resumo['segundos']}s"
+    print(f"[{resumo['status']}] {resumo['nome']} ({duracao}) {resumo['erro'] or ''}".rstrip())
+
+
+def executar_lote(tarefas, processos=None):
+    """Executa as tarefas em paralelo e devolve os resumos na ordem original.
+
+    Um processo encerrado à força (por exemplo, sem memória) interrompe o pool inteiro: as tarefas
+    interrompidas são executadas de novo, uma por vez, e só a que derrubar o processo fica com erro.
+    """
+    resumos = [None] * len(tarefas)
+    interrompidas = []
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = {executor.submit(executar_tarefa, tarefa): indice for indice, tarefa in enumerate(tarefas)}
+        for futuro in as_completed(futuros):
+            try:
+                resumos[futuros[futuro]] = futuro.result()
+            except BrokenProcessPool:
+                interrompidas.append(futuros[futuro])
+                continue
+            _mostrar(resumos[futuros[futuro]])
+
+    # Com um único processo, a primeira tarefa interrompida (na ordem de envio) é a que estava executando
+    interrompidas.sort()
+    while interrompidas:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            futuros = [executor.submit(executar_tarefa, tarefas[indice]) for indice in interrompidas]
+            for posicao, (indice, futuro) in enumerate(zip(interrompidas, futuros)):
+                try:
+                    resumos[indice] = futuro.result()
+                except BrokenProcessPool as e:
+                    resumos[indice] = dict(tarefas[indice], status='erro', arquivos=[], linhas={},
+                                           erro=f"{type(e).__name__}: {e}", segundos=None)
+                    _mostrar(resumos[indice])
+                    interrompidas = interrompidas[posicao + 1:]
+                    break
+                _mostrar(resumos[indice])
+            else:
+                interrompidas = []
+    return resumos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Executa conciliações em lote, sem interface gráfica.")
+    origem = parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument('--manifesto', help="Arquivo .json/.jsonl ou .csv (;) com as tarefas")
+    origem.add_argument('--diretorio', help="Diretório com um subdiretório por tarefa")
+    parser.add_argument('--tipo', choices=sorted(CONCILIACOES), help="Tipo de conciliação (obrigatório com --diretorio)")
+    parser.add_argument('--saida', default='resultados', help="Diretório de saída dos resultados")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos (padrão: núcleos disponíveis)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    try:
+        if args.manifesto:
+            tarefas = ler_manifesto(args.manifesto, args.saida)
+        elif args.tipo:
+            tarefas = tarefas_do_diretorio(args.diretorio, args.tipo, args.saida)
+        else:
+            parser.error("--tipo é obrigatório com --diretorio")
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+
+    inicio = time.perf_counter()
+    resumos = executar_lote(tarefas, args.processos)
+    falhas = [resumo for resumo in resumos if resumo['status'] != 'ok']
+
+    os.makedirs(args.saida, exist_ok=True)
+    with open(os.path.join(args.saida, 'resumo.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'tarefas': len(resumos),
+            'falhas': len(falhas),
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'resultados': resumos,
+        }, f, ensure_ascii=False, indent=2)
+
+    print(f"{len(resumos) - len(falhas)} de {len(resumos)} conciliação(ões) concluída(s); resumo em {os.path.join(args.saida, 'resumo.json')}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,182 @@
-from Clinica import ApplicationClinica  # Garanta que as classes estejam renomeadas corretamente
-from Comparador import ApplicationComparador
-from Banco import ApplicationBanco
+import time
+
+INICIO = time.perf_counter()  # Antes de qualquer outro import, para medir a inicialização
+
+import argparse
+import importlib
+import threading
 import tkinter as tk
-from tkinter import ttk
+from tkinter import filedialog, messagebox, ttk
+
+# As ferramentas (e o pandas) são importadas só quando abertas ou pré-carregadas em segundo plano,
+# para que o menu apareça imediatamente: texto do botão -> (módulo, classe)
+APLICACOES = {
+    "Validar Clinica e AX": ('Clinica', 'ApplicationClinica'),
+    "NF-e Canceladas": ('Comparador', 'ApplicationComparador'),
+    "Validação Banco": ('Banco', 'ApplicationBanco'),
+    "Emitidas sem AX": ('Faturamento', 'ApplicationFaturamento'),
+    "Histórico de Faturas": ('Historico', 'ApplicationHistorico'),
+}
+
+# Ordem do pré-carregamento: o pandas primeiro, pois todas as ferramentas dependem dele
+PRE_CARREGAMENTO = ['pandas'] + [modulo for modulo, _ in APLICACOES.values()]
+
+
+def carregar_aplicacao(modulo, classe):
+    return getattr(importlib.import_module(modulo), classe)
+
 
 class MainApplication(tk.Tk):
-    def __init__(self):
+    def __init__(self, pre_carregar=True, medir_inicializacao=False):
         super().__init__()
         self.title("Menu Principal")
-        self.geometry("600x200")
+        self.geometry("600x380")
+        self.sessao = None  # Criada no primeiro uso, pois importa o pandas
+        self.thread_ax = None
+        self.pre_carregamento = pre_carregar
+        self.medir_inicializacao = medir_inicializacao
+        self.tempos_pre_carregamento = {}
+        self.thread_pre_carregamento = None
         self.create_widgets()
+        # Depois que o menu for exibido, com a interface ociosa
+        self.after(0, self.menu_exibido)
+        if self.pre_carregamento:
+            self.after(100, self.iniciar_pre_carregamento)
 
     def create_widgets(self):
         """Cria os botões para abrir diferentes aplicações."""
-        apps = {
-            "Validar Clinica e AX": ApplicationClinica,
-            "NF-e Canceladas": ApplicationComparador,
-            "Validação Banco": ApplicationBanco,
-        }
-        
-        for text, app_class in apps.items():
-            self.create_button(text, app_class)
-
-    def create_button(self, text, app_class):
+        for text, (modulo, classe) in APLICACOES.items():
+            self.create_button(text, modulo, classe)
+
+        # A planilha AX carregada aqui é usada por todas as janelas, sem ler o arquivo novamente
+        frame_ax = ttk.Frame(self)
+        frame_ax.pack(pady=10)
+        self.btn_carregar_ax = ttk.Button(frame_ax, text="Carregar Planilha AX da sessão", command=self.carregar_ax)
+        self.btn_carregar_ax.pack(side=tk.LEFT, padx=5)
+        self.label_ax = ttk.Label(frame_ax, text="Nenhuma planilha AX carregada")
+        self.label_ax.pack(side=tk.LEFT, padx=5)
+
+    def create_button(self, text, modulo, classe):
         """Cria um botão para abrir a aplicação especificada."""
-        button = ttk.Button(self, text=text, command=lambda: self.run_app(app_class))
+        button = ttk.Button(self, text=text, command=lambda: self.run_app(modulo, classe))
         button.pack(pady=10)
 
-    def run_app(self, AppClass):
+    def obter_sessao(self):
+        if self.sessao is None:
+            from Sessao import Sessao
+            self.sessao = Sessao()
+        return self.sessao
+
+    def carregar_ax(self):
+        # Várias planilhas AX (por exemplo, uma por empresa ou período) são unidas em uma só
+        arquivos = filedialog.askopenfilenames(title="Planilhas AX")
+        if not arquivos or (self.thread_ax is not None and self.thread_ax.is_alive()):
+            return
+        caminho = arquivos[0] if len(arquivos) == 1 else tuple(arquivos)
+        sessao = self.obter_sessao()
+        self.label_ax.config(text="Carregando...")
+        self.resultado_ax = None
+        # A leitura roda fora da thread da interface; o resultado é conferido periodicamente
+        self.thread_ax = threading.Thread(target=self.ler_ax, args=(sessao, caminho), daemon=True)
+        self.thread_ax.start()
+        self.after(100, self.verificar_ax)
+
+    def ler_ax(self, sessao, caminho):
+        try:
+            self.resultado_ax = sessao.obter_ax(caminho)
+        except Exception as e:
+            self.resultado_ax = e
+
+    def verificar_ax(self):
+        if self.thread_ax.is_alive():
+            self.after(100, self.verificar_ax)
+        else:
+            self.atualizar_label_ax()
+            if isinstance(self.resultado_ax, Exception):
+                messagebox.showerror("Erro", str(self.resultado_ax))
+            elif len(self.resultado_ax.conflitos):
+                self.salvar_conflitos_ax(self.resultado_ax)
+
+    def salvar_conflitos_ax(self, ax):
+        quantidade = ax.conflitos['Fatura'].nunique()
+        if not messagebox.askyesno("Conflitos", f"{quantidade} fatura(s) aparecem com Status diferentes nas planilhas AX; "
+                                                f"foi mantido o Status do primeiro arquivo. Deseja salvar o relatório?"):
+            return
+        from Exportacao import FORMATOS_EXPORTACAO, exportar
+        destino = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=FORMATOS_EXPORTACAO)
+        if destino:
+            exportar(ax.conflitos, destino)  # O relatório tem apenas as faturas em conflito
+
+    def atualizar_label_ax(self):
+        ax = self.sessao.ax if self.sessao else None
+        if ax is not None:
+            conflitos = f", {ax.conflitos['Fatura'].nunique()} conflito(s) de Status" if len(ax.conflitos) else ""
+            self.label_ax.config(text=f"AX da sessão: {ax.descricao} ({len(ax.dados)} linha(s){conflitos})")
+        else:
+            self.label_ax.config(text="Nenhuma planilha AX carregada")
+
+    def menu_exibido(self):
+        self.update_idletasks()
+        if self.medir_inicializacao:
+            print(f"Menu exibido em {time.perf_counter() - INICIO:.3f}s", flush=True)
+            if not self.pre_carregamento:
+                self.after(0, self.encerrar_medicao)
+
+    def iniciar_pre_carregamento(self):
+        """Importa o pandas e as ferramentas em segundo plano enquanto o menu está ocioso."""
+        self.thread_pre_carregamento = threading.Thread(target=self.pre_carregar, daemon=True)
+        self.thread_pre_carregamento.start()
+        if self.medir_inicializacao:
+            self.after(50, self.encerrar_medicao)
+
+    def pre_carregar(self):
+        # Sem chamadas ao Tk: esta função roda fora da thread da interface
+        for modulo in PRE_CARREGAMENTO:
+            inicio = time.perf_counter()
+            try:
+                importlib.import_module(modulo)
+            except Exception:
+                continue  # O erro aparece quando a ferramenta for aberta
+            self.tempos_pre_carregamento[modulo] = time.perf_counter() - inicio
+
+    def encerrar_medicao(self):
+        if self.thread_pre_carregamento is not None and self.thread_pre_carregamento.is_alive():
+            self.after(50, self.encerrar_medicao)
+            return
+        for modulo, segundos in self.tempos_pre_carregamento.items():
+            print(f"  {modulo:<12} pré-carregado em {segundos:.3f}s")
+        print(f"Pré-carregamento concluído em {time.perf_counter() - INICIO:.3f}s", flush=True)
+        self.destroy()
+
+    def run_app(self, modulo, classe):
         """Executa a aplicação especificada e gerencia a janela principal."""
+        # Se a ferramenta ainda não foi pré-carregada, o import acontece aqui (ou aguarda o pré-carregamento)
+        self.config(cursor='watch')
+        self.update_idletasks()
+        try:
+            AppClass = carregar_aplicacao(modulo, classe)
+        finally:
+            self.config(cursor='')
+        self.obter_sessao()  # A janela usa (e preenche) a planilha AX da sessão
         self.withdraw()  # Oculta a janela principal
         app = AppClass(self)  # Passa a instância da janela principal para a aplicação
         app.grab_set()  # Garante que a atenção esteja na janela secundária
         app.wait_window(app)  # Espera a janela secundária fechar
         self.deiconify()  # Mostra a janela principal novamente
+        self.atualizar_label_ax()
 
-if __name__ == "__main__":
-    app = MainApplication()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Menu principal das conciliações.")
+    parser.add_argument('--medir-inicializacao', action='store_true',
+                        help="Mostra o tempo até o menu aparecer e até o fim do pré-carregamento, e encerra")
+    parser.add_argument('--sem-pre-carregamento', action='store_true',
+                        help="Importa cada ferramenta apenas quando ela for aberta")
+    args = parser.parse_args(argv)
+
+    app = MainApplication(pre_carregar=not args.sem_pre_carregamento, medir_inicializacao=args.medir_inicializacao)
     app.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import Cache
+
+# Uma linha JSON por execução, para agregar depois (por exemplo, com pd.read_json(..., lines=True))
+LOG_EXECUCOES = os.environ.get('NFSE_LOG_EXECUCOES', os.path.join(Cache.CACHE_DIR, 'execucoes.jsonl'))
+
+# Por padrão, cada etapa registra a memória residente do processo (RSS). Com NFSE_RASTREAR_MEMORIA=1,
+# o tracemalloc mede também o pico de memória alocada em cada etapa, mas deixa as alocações mais lentas
+RASTREAR_MEMORIA = os.environ.get('NFSE_RASTREAR_MEMORIA', '0') == '1'
+
+# Mensagens destes módulos (fallback de codificação, motor do Excel, cache, AX da sessão, abas do banco, histórico) entram no registro
+LOGGERS = ('Planilha', 'Cache', 'Sessao', 'Banco', 'Historico')
+
+MB = 1024 * 1024
+
+_trava = threading.Lock()
+_medicoes_ativas = 0
+
+
+def memoria_rss():
+    """Memória residente do processo em bytes, ou None quando não é possível obtê-la."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Sem /proc, o melhor disponível é o pico do processo
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+def _mb(valor):
+    return None if valor is None else round(valor / MB, 1)
+
+
+class _Coletor(logging.Handler):
+    """Guarda as mensagens emitidas pela thread da medição."""
+
+    def __init__(self, medicao):
+        super().__init__(logging.INFO)
+        self.medicao = medicao
+
+    def emit(self, record):
+        if record.thread == self.medicao.thread:
+            self.medicao.eventos.append(record.getMessage())
+
+
+class Medicao:
+    """Tempo e memória de cada etapa de uma conciliação, a quantidade de linhas de cada planilha
+    e as mensagens dos módulos de leitura durante a execução.
+
+    iniciar() e finalizar() podem ser chamados em threads diferentes (processamento e interface).
+    ao_progresso, se informado, recebe cada etapa iniciada e cada contagem de linhas (por exemplo,
+    Tarefa.progresso, que também interrompe a execução quando a tarefa é cancelada).
+    registrar_memoria guarda a memória ocupada pelos resultados que a janela mantém (veja Compacto).
+    """
+
+    def __init__(self, conciliacao, ao_progresso=None, **arquivos):
+        self.conciliacao = conciliacao
+        self.ao_progresso = ao_progresso
+        self.arquivos = {nome: caminho for nome, caminho in arquivos.items() if caminho}
+        self.etapas = []
+        self.linhas = {}
+        self.eventos = []
+        self.memoria = {}
+        self.thread = None
+        self.registro = None
+        self._coletor = _Coletor(self)
+        self._liberada = True  # Até iniciar() não há nada a liberar
+
+    def iniciar(self):
+        global _medicoes_ativas
+        self.thread = threading.get_ident()
+        self.data = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self._inicio = time.perf_counter()
+        for nome in LOGGERS:
+            logger = logging.getLogger(nome)
+            if logger.level == logging.NOTSET or logger.level > logging.INFO:
+                logger.setLevel(logging.INFO)
+            logger.addHandler(self._coletor)
+        if RASTREAR_MEMORIA:
+            with _trava:
+                if _medicoes_ativas == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                _medicoes_ativas += 1
+        self._liberada = False
+        return self
+
+    def liberar(self):
+        """Deixa de coletar as mensagens dos loggers e de contar para o tracemalloc; chamado por finalizar.
+
+        Separado de finalizar porque a renderização, medida depois na thread da interface, pode nunca
+        acontecer (a janela foi fechada): a medição não pode continuar presa aos loggers compartilhados.
+        """
+        global _medicoes_ativas
+        if self._liberada:
+            return
+        self._liberada = True
+        for nome in LOGGERS:
+            logging.getLogger(nome).removeHandler(self._coletor)
+        if RASTREAR_MEMORIA:
+            with _trava:
+                _medicoes_ativas -= 1
+                if _medicoes_ativas == 0 and tracemalloc.is_tracing():
+                    tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def etapa(self, nome):
+        self.progresso(etapa=nome)
+        # O pico do tracemalloc é do processo inteiro: com outra medição ativa (por exemplo, duas tarefas do
+        # agendador), zerá-lo atrapalharia a outra, então o pico desta etapa não é registrado
+        with _trava:
+            medir_pico = tracemalloc.is_tracing() and _medicoes_ativas == 1
+            if medir_pico:
+                tracemalloc.reset_peak()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            registro = {'nome': nome, 'segundos': round(time.perf_counter() - inicio, 3)}
+            if medir_pico and tracemalloc.is_tracing():
+                registro['memoria_pico_mb'] = _mb(tracemalloc.get_traced_memory()[1])
+            registro['rss_mb'] = _mb(memoria_rss())
+            self.etapas.append(registro)
+
+    def contar(self, nome, linhas):
+        self.linhas[nome] = int(linhas)
+        self.progresso(linhas={nome: int(linhas)})
+
+    def registrar_memoria(self, nome, antes, depois):
+        self.memoria[nome] = {'antes_mb': _mb(antes), 'mb': _mb(depois)}
+
+    def progresso(self, **dados):
+        if self.ao_progresso:
+            self.ao_progresso(**dados)
+
+    def finalizar(self, status='ok', erro=None, gravar=True):
+        """Encerra a medição, grava a linha no log de execuções e retorna o registro."""
+        if self.registro is not None:
+            return self.registro
+        self.liberar()
+
+        picos = [etapa['memoria_pico_mb'] for etapa in self.etapas if etapa.get('memoria_pico_mb') is not None]
+        rss = [etapa['rss_mb'] for etapa in self.etapas if etapa.get('rss_mb') is not None]
+        self.registro = {
+            'data': self.data,
+            'conciliacao': self.conciliacao,
+            'status': status,
+            'erro': None if erro is None else f"{type(erro).__name__}: {erro}" if isinstance(erro, BaseException) else str(erro),
+            'segundos': round(time.perf_counter() - self._inicio, 3),
+            'arquivos': {nome: _descrever_arquivo(caminho) for nome, caminho in self.arquivos.items()},
+            'linhas': self.linhas,
+            'etapas': self.etapas,
+            'memoria_pico_mb': max(picos, default=None),
+            'rss_pico_mb': max(rss, default=None),
+            'memoria_dados': self.memoria,
+            'eventos': self.eventos,
+        }
+        if gravar:
+            gravar_registro(self.registro)
+        return self.registro
+
+    def resumo(self):
+        """Texto curto para exibir na janela."""
+        partes = [f"{etapa['nome']} {etapa['segundos']:.2f}s" for etapa in self.etapas]
+        if self.registro:
+            partes.append(f"total {self.registro['segundos']:.2f}s")
+            if self.registro['memoria_pico_mb'] is not None:
+                partes.append(f"pico {self.registro['memoria_pico_mb']:.0f} MB")
+            elif self.registro['rss_pico_mb'] is not None:
+                partes.append(f"RSS {self.registro['rss_pico_mb']:.0f} MB")
+            if self.registro['status'] != 'ok':
+                partes.append(self.registro['status'])
+        partes += [f"{nome}: {linhas} linha(s)" for nome, linhas in self.linhas.items()]
+        for nome, memoria in self.memoria.items():
+            economia = f" (antes {memoria['antes_mb']:.1f} MB)" if memoria['antes_mb'] != memoria['mb'] else ""
+            partes.append(f"{nome} em memória: {memoria['mb']:.1f} MB{economia}")
+        return ' | '.join(partes)
+
+
+def _descrever_arquivo(caminho):
+    # Uma entrada com vários arquivos (por exemplo, as planilhas AX de várias empresas) vira uma lista
+    if isinstance(caminho, (list, tuple)):
+        return [_descrever_arquivo(arquivo) for arquivo in caminho]
+    return {'caminho': os.path.abspath(caminho), 'bytes': _tamanho(caminho)}
+
+
+def _tamanho(caminho):
+    try:
+        return os.path.getsize(caminho)
+    except OSError:
+        return None
+
+
+def gravar_registro(registro, caminho=None):
+    caminho = caminho or LOG_EXECUCOES
+    try:
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        with open(caminho, 'a', encoding='utf-8') as log:
+            log.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+    except OSError:
+        pass  # Falha ao gravar o log não deve interromper a conciliação
+
+
+# Atalhos para as funções de conciliação, que também são usadas sem medição (medicao=None)
+def etapa(medicao, nome):
+    return medicao.etapa(nome) if medicao else contextlib.nullcontext()
+
+
+def contar(medicao, nome, linhas):
+    if medicao:
+        medicao.contar(nome, linhas)
+
+
+def progresso(medicao, **dados):
+    if medicao:
+        medicao.progresso(**dados)
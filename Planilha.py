@@ -0,0 +1,324 @@
+import codecs
+import collections
+import logging
+import os
+import re
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+import Cache
+
+logger = logging.getLogger(__name__)
+
+# Arquivos CSV acima deste tamanho são processados em blocos, sem carregar o arquivo inteiro
+LIMITE_BLOCOS = int(os.environ.get('NFSE_LIMITE_BLOCOS_MB', '100')) * 1024 * 1024
+TAMANHO_BLOCO = 200_000
+
+# Motor de leitura das planilhas Excel: 'auto' tenta os motores na ordem de MOTORES_AUTO
+MOTOR_EXCEL = os.environ.get('NFSE_MOTOR_EXCEL', 'auto')
+MOTORES_AUTO = ['calamine', 'openpyxl_fluxo', 'padrao']
+ERROS_EXCEL = {'#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'}
+
+# Detecção do formato dos CSV: o delimitador e a linha de cabeçalho vêm do início do arquivo
+AMOSTRA_CSV = 64 * 1024
+DELIMITADORES = [';', ',', '\t', '|']
+LINHAS_CABECALHO = 50
+
+# Com NFSE_DTYPE_BACKEND=pyarrow, as planilhas são lidas em colunas Arrow: textos e chaves sem um objeto
+# Python por célula, chaves normalizadas em int64[pyarrow] e exportação Parquet sem conversão
+DTYPE_BACKEND = os.environ.get('NFSE_DTYPE_BACKEND', 'numpy')
+
+Dialeto = collections.namedtuple('Dialeto', ['encoding', 'delimitador', 'skiprows'])
+
+# Último dialeto detectado para cada tipo de planilha (identificado pelas colunas lidas)
+_dialetos = {}
+
+
+def _ler_excel_calamine(caminho, skiprows, usecols, dtype):
+    # Leitor em Rust (python-calamine), disponível no pandas 2.2 ou superior
+    return pd.read_excel(caminho, skiprows=skiprows, usecols=usecols, dtype=dtype, engine='calamine')
+
+
+def _converter_celula(valor):
+    """Converte o valor da célula como o leitor openpyxl do pandas."""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, str) and valor in ERROS_EXCEL:
+        return np.nan
+    return valor
+
+
+def _ler_excel_openpyxl_fluxo(caminho, skiprows, usecols, dtype):
+    # Percorre a primeira aba em modo somente leitura obtendo apenas os valores das células,
+    # sem criar um objeto por célula, e monta o DataFrame com o mesmo parser do read_excel
+    if not caminho.endswith('.xlsx'):
+        raise ValueError("O motor openpyxl_fluxo lê apenas arquivos .xlsx.")
+    import openpyxl
+
+    livro = openpyxl.load_workbook(caminho, read_only=True, data_only=True, keep_links=False)
+    try:
+        aba = livro.worksheets[0]
+        aba.reset_dimensions()
+        dados = []
+        ultima_com_dados = -1
+        for numero, linha in enumerate(aba.iter_rows(values_only=True)):
+            convertida = [_converter_celula(valor) for valor in linha]
+            while convertida and convertida[-1] == '':
+                convertida.pop()
+            if convertida:
+                ultima_com_dados = numero
+            dados.append(convertida)
+    finally:
+        livro.close()
+
+    dados = dados[:ultima_com_dados + 1]
+    if not dados:
+        return pd.DataFrame()
+    largura = max(len(linha) for linha in dados)
+    dados = [linha + [''] * (largura - len(linha)) for linha in dados]
+    return TextParser(dados, header=0, skiprows=skiprows, usecols=usecols, dtype=dtype, skip_blank_lines=False).read()
+
+
+def _ler_excel_padrao(caminho, skiprows, usecols, dtype):
+    return pd.read_excel(caminho, skiprows=skiprows, usecols=usecols, dtype=dtype)
+
+
+MOTORES = {
+    'calamine': _ler_excel_calamine,
+    'openpyxl_fluxo': _ler_excel_openpyxl_fluxo,
+    'padrao': _ler_excel_padrao,
+}
+
+
+def ler_excel(caminho, skiprows=0, usecols=None, dtype=None, motor=None):
+    """Lê a planilha Excel com o motor escolhido; no modo 'auto', passa ao próximo motor quando um deles não suporta o arquivo."""
+    motor = motor or MOTOR_EXCEL
+    if motor != 'auto':
+        return MOTORES[motor](caminho, skiprows, usecols, dtype)
+    for nome in MOTORES_AUTO[:-1]:
+        try:
+            return MOTORES[nome](caminho, skiprows, usecols, dtype)
+        except Exception as e:
+            logger.info("%s: motor %s indisponível (%s: %s)", os.path.basename(caminho), nome, type(e).__name__, e)
+            continue
+    return MOTORES[MOTORES_AUTO[-1]](caminho, skiprows, usecols, dtype)
+
+
+def converter_backend(df, dtype_backend=None):
+    """Com o backend pyarrow, converte as colunas para Arrow (category e colunas de tipos mistos não mudam)."""
+    if (dtype_backend or DTYPE_BACKEND) != 'pyarrow':
+        return df
+    return df.convert_dtypes(dtype_backend='pyarrow')
+
+
+def _opcoes_backend(dtype_backend):
+    return {'dtype_backend': 'pyarrow'} if (dtype_backend or DTYPE_BACKEND) == 'pyarrow' else {}
+
+
+def _ler_arquivo(caminho, skiprows=0, encoding='utf-8', usecols=None, dtype=None, motor=None, colunas=None, dtype_backend=None):
+    if caminho.endswith('.xlsx') or caminho.endswith('.xls'):
+        df = ler_excel(caminho, skiprows=skiprows, usecols=usecols, dtype=dtype, motor=motor)
+    elif caminho.endswith('.csv'):
+        # Codificação, delimitador e cabeçalho detectados antes, para o arquivo ser lido uma única vez
+        dialeto = detectar_dialeto(caminho, skiprows, colunas, encoding)
+        df = pd.read_csv(caminho, encoding=dialeto.encoding, skiprows=dialeto.skiprows, on_bad_lines='warn',
+                         delimiter=dialeto.delimitador, usecols=usecols, dtype=dtype, **_opcoes_backend(dtype_backend))
+    else:
+        raise ValueError("Formato de arquivo não suportado.")
+    return converter_backend(df, dtype_backend)
+
+
+def seletor_colunas(colunas):
+    """Seleciona as colunas pelo nome, incluindo as repetidas que o pandas renomeia com sufixo .n."""
+    if not colunas:
+        return None
+    nomes = set(colunas)
+    return lambda nome: nome in nomes or re.sub(r'\.\d+$', '', str(nome)) in nomes
+
+
+# Leitura das planilhas, desconsiderando as linhas de cabeçalho informadas em skiprows.
+# Com colunas, apenas as colunas informadas são lidas (as ausentes no arquivo são ignoradas).
+# colunas pode ser um dicionário {coluna: tipo}; o tipo (ou dtype) evita a inferência de tipos da coluna.
+# motor escolhe o leitor de Excel (veja MOTORES); todos devolvem o mesmo DataFrame, então o cache é compartilhado.
+# O resultado fica guardado no cache local, então uma nova leitura do mesmo arquivo é imediata.
+# dtype_backend='pyarrow' (ou NFSE_DTYPE_BACKEND) lê em colunas Arrow; veja DTYPE_BACKEND.
+def ler_planilha(caminho, skiprows=0, colunas=None, dtype=None, encoding='utf-8', usar_cache=True, motor=None, dtype_backend=None):
+    skiprows = skiprows or 0
+    if isinstance(colunas, dict):
+        dtype = dict({coluna: tipo for coluna, tipo in colunas.items() if tipo is not None}, **(dtype or {}))
+
+    def leitor():
+        return _ler_arquivo(caminho, skiprows=skiprows, encoding=encoding, usecols=seletor_colunas(colunas), dtype=dtype,
+                            motor=motor, colunas=colunas, dtype_backend=dtype_backend)
+
+    if not usar_cache:
+        return leitor()
+    df = Cache.obter_ou_ler(
+        caminho,
+        leitor,
+        skiprows=skiprows,
+        encoding=encoding,
+        colunas=sorted(colunas) if colunas else None,
+        dtype={coluna: str(tipo) for coluna, tipo in (dtype or {}).items()},
+        **_opcoes_backend(dtype_backend),
+    )
+    # O Parquet do cache devolve os textos Arrow como StringDtype: voltam a ser colunas Arrow
+    return converter_backend(df, dtype_backend)
+
+
+def deve_ler_em_blocos(caminho):
+    return caminho.endswith('.csv') and os.path.getsize(caminho) > LIMITE_BLOCOS
+
+
+def detectar_codificacao(caminho, encoding='utf-8'):
+    """Percorre os bytes do arquivo e retorna a codificação que o decodifica sem erros."""
+    decodificador = codecs.getincrementaldecoder(encoding)()
+    with open(caminho, 'rb') as arquivo:
+        inicio = arquivo.read(len(codecs.BOM_UTF8))
+        if inicio == codecs.BOM_UTF8 and codecs.lookup(encoding).name == 'utf-8':
+            encoding, inicio = 'utf-8-sig', b''
+        try:
+            decodificador.decode(inicio)
+            for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+                # Blocos só com ASCII (a maior parte de um relatório) não precisam ser decodificados,
+                # a não ser que o bloco anterior tenha terminado no meio de um caractere
+                if not bloco.isascii() or decodificador.getstate()[0]:
+                    decodificador.decode(bloco)
+            decodificador.decode(b'', final=True)
+        except UnicodeDecodeError:
+            logger.info("%s: não está em %s, lendo como iso-8859-1", os.path.basename(caminho), encoding)
+            return 'iso-8859-1'
+    return encoding
+
+
+def _detectar_delimitador(linhas):
+    # O delimitador aparece o mesmo número de vezes (e ao menos uma) no maior número de linhas
+    melhor, consistentes = ';', 0
+    for delimitador in DELIMITADORES:
+        contagens = [linha.count(delimitador) for linha in linhas if linha.strip()]
+        if not contagens:
+            continue
+        frequente = max(set(contagens), key=contagens.count)
+        if frequente and contagens.count(frequente) > consistentes:
+            melhor, consistentes = delimitador, contagens.count(frequente)
+    return melhor
+
+
+def _colunas_na_linha(linha, delimitador, colunas):
+    return len(set(colunas) & {campo.strip().strip('"') for campo in linha.split(delimitador)})
+
+
+def _detectar_cabecalho(linhas, delimitador, skiprows, colunas):
+    """Linha de cabeçalho: a informada em skiprows, se tiver alguma das colunas, ou a primeira que tiver."""
+    if not colunas or (skiprows < len(linhas) and _colunas_na_linha(linhas[skiprows], delimitador, colunas)):
+        return skiprows
+    for numero, linha in enumerate(linhas[:LINHAS_CABECALHO]):
+        if _colunas_na_linha(linha, delimitador, colunas):
+            return numero
+    return skiprows
+
+
+def detectar_dialeto(caminho, skiprows=0, colunas=None, encoding='utf-8'):
+    """Codificação (percorrendo os bytes), delimitador e linha de cabeçalho (pela amostra do início) do CSV.
+
+    O dialeto de cada tipo de planilha (as colunas lidas) fica guardado; o próximo arquivo do mesmo
+    tipo o reaproveita se o cabeçalho estiver no mesmo lugar, sem analisar a amostra novamente.
+    """
+    encoding = detectar_codificacao(caminho, encoding)
+    with open(caminho, 'rb') as arquivo:
+        amostra = arquivo.read(AMOSTRA_CSV)
+    linhas = amostra.decode(encoding, errors='replace').splitlines()
+    if len(amostra) == AMOSTRA_CSV:
+        linhas = linhas[:-1]  # A última linha da amostra pode estar incompleta
+
+    colunas = [str(coluna) for coluna in colunas] if colunas else None
+    tipo = tuple(sorted(colunas)) if colunas else None
+    anterior = _dialetos.get(tipo)
+    if (anterior is not None and anterior.skiprows < len(linhas)
+            and _colunas_na_linha(linhas[anterior.skiprows], anterior.delimitador, colunas)):
+        return anterior._replace(encoding=encoding)
+
+    delimitador = _detectar_delimitador(linhas[skiprows:skiprows + LINHAS_CABECALHO])
+    cabecalho = _detectar_cabecalho(linhas, delimitador, skiprows, colunas)
+    if cabecalho != skiprows:
+        logger.info("%s: cabeçalho encontrado na linha %d", os.path.basename(caminho), cabecalho + 1)
+        delimitador = _detectar_delimitador(linhas[cabecalho:cabecalho + LINHAS_CABECALHO])
+    if delimitador != ';':
+        logger.info("%s: delimitado por %r", os.path.basename(caminho), delimitador)
+    dialeto = Dialeto(encoding, delimitador, cabecalho)
+    if tipo is not None:
+        _dialetos[tipo] = dialeto
+    return dialeto
+
+
+def ler_csv_em_blocos(caminho, skiprows=0, colunas=None, dtype=None, tamanho_bloco=TAMANHO_BLOCO, encoding='utf-8', dtype_backend=None):
+    """Lê o CSV em blocos de tamanho_bloco linhas, apenas com as colunas informadas."""
+    if isinstance(colunas, dict):
+        dtype = dict({coluna: tipo for coluna, tipo in colunas.items() if tipo is not None}, **(dtype or {}))
+    dialeto = detectar_dialeto(caminho, skiprows or 0, colunas, encoding)
+    leitor = pd.read_csv(
+        caminho,
+        encoding=dialeto.encoding,
+        skiprows=dialeto.skiprows,
+        on_bad_lines='warn',
+        delimiter=dialeto.delimitador,
+        usecols=seletor_colunas(colunas),
+        dtype=dtype,
+        chunksize=tamanho_bloco,
+        **_opcoes_backend(dtype_backend),
+    )
+    with leitor:
+        for bloco in leitor:
+            yield converter_backend(bloco, dtype_backend)
+
+
+def juntar_blocos(blocos, colunas):
+    """Concatena os blocos de resultado mantendo a ordem das linhas da planilha de origem."""
+    blocos = list(blocos)
+    if not blocos:
+        return pd.DataFrame(columns=colunas)
+    return pd.concat(blocos).sort_index(kind='stable').reset_index(drop=True)
+
+
+def comparar_motores(caminho, skiprows=0, repeticoes=3):
+    """Mede o tempo de cada motor de leitura e confere se o resultado é igual ao do read_excel padrão."""
+    referencia = _ler_excel_padrao(caminho, skiprows, None, None)
+    resultados = []
+    for nome, leitor in MOTORES.items():
+        tempos = []
+        try:
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                df = leitor(caminho, skiprows, None, None)
+                tempos.append(time.perf_counter() - inicio)
+        except Exception as e:
+            resultados.append({'motor': nome, 'erro': f"{type(e).__name__}: {e}"})
+            continue
+        try:
+            pd.testing.assert_frame_equal(df, referencia, check_dtype=False)
+            igual = True
+        except AssertionError:
+            igual = False
+        resultados.append({'motor': nome, 'segundos': min(tempos), 'linhas': len(df), 'igual_ao_padrao': igual})
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara os motores de leitura de planilhas Excel.")
+    parser.add_argument('arquivo')
+    parser.add_argument('--skiprows', type=int, default=0)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    for resultado in comparar_motores(args.arquivo, args.skiprows, args.repeticoes):
+        if 'erro' in resultado:
+            print(f"{resultado['motor']:<16} indisponível ({resultado['erro']})")
+        else:
+            print(f"{resultado['motor']:<16} {resultado['segundos']:8.3f}s  {resultado['linhas']} linha(s)  igual ao padrão: {'sim' if resultado['igual_ao_padrao'] else 'não'}")
@@ -0,0 +1,571 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import Cache
+import Clinica
+import Lote
+from Metricas import MB, gravar_registro
+
+logger = logging.getLogger(__name__)
+
+HOST = os.environ.get('NFSE_SERVICO_HOST', '127.0.0.1')
+PORTA = int(os.environ.get('NFSE_SERVICO_PORTA', '8750'))
+# Planilhas enviadas e resultados, uma pasta por conciliação
+PASTA = os.environ.get('NFSE_SERVICO_PASTA', os.path.join(Cache.CACHE_DIR, 'servico'))
+# Os caminhos informados (em vez de enviados) precisam estar dentro de NFSE_SERVICO_RAIZ;
+# sem ela, dentro da subpasta 'entrada' da pasta do serviço
+RAIZ = os.environ.get('NFSE_SERVICO_RAIZ')
+MAX_ENVIO_MB = int(os.environ.get('NFSE_SERVICO_MAX_MB', '1024'))
+# Conciliações aguardando um processo livre além desta quantidade são recusadas (503)
+MAX_FILA = int(os.environ.get('NFSE_SERVICO_MAX_FILA', '200'))
+# Conciliações terminadas são esquecidas, e os resultados apagados, após este prazo
+# ou, das mais antigas para as mais novas, além desta quantidade
+RETENCAO_HORAS = float(os.environ.get('NFSE_SERVICO_RETENCAO_HORAS', '24'))
+MAX_TERMINADAS = int(os.environ.get('NFSE_SERVICO_MAX_TERMINADAS', '500'))
+
+EXTENSOES = ('.xlsx', '.xls', '.csv')
+BLOCO = 256 * 1024
+LIMITE_CABECALHO = 64 * 1024
+MAX_JSON = 1024 * 1024
+# Linhas convertidas por vez ao devolver um resultado em JSON
+LINHAS_JSON = 50_000
+
+ROTA = re.compile(r'^/conciliacoes(?:/(?P<id>[0-9a-f]{32})(?:/resultados/(?P<resultado>\w+))?)?/?$')
+MENSAGENS = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 409: 'Conflict', 411: 'Length Required', 413: 'Payload Too Large',
+    415: 'Unsupported Media Type', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class ErroHttp(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def _parametro(valor, nome):
+    """Parâmetro de um cabeçalho (por exemplo, boundary do Content-Type ou filename do Content-Disposition)."""
+    encontrado = re.search(rf'(?:^|;)\s*{nome}="([^"]*)"', valor, re.IGNORECASE) \
+        or re.search(rf'(?:^|;)\s*{nome}=([^;\s]+)', valor, re.IGNORECASE)
+    return encontrado.group(1) if encontrado else None
+
+
+def _cabecalhos(texto):
+    cabecalhos = {}
+    for linha in texto.split('\r\n'):
+        chave, separador, valor = linha.partition(':')
+        if separador:
+            cabecalhos[chave.strip().lower()] = valor.strip()
+    return cabecalhos
+
+
+class _Corpo:
+    """Corpo da requisição (Content-Length bytes), lido em blocos: um envio grande nunca fica inteiro na memória."""
+
+    def __init__(self, reader, tamanho):
+        self.reader = reader
+        self.restante = tamanho
+        self.buffer = b''
+
+    async def _ler(self):
+        if self.restante <= 0:
+            return False
+        dados = await self.reader.read(min(BLOCO, self.restante))
+        if not dados:
+            raise ErroHttp(400, "Corpo da requisição incompleto")
+        self.restante -= len(dados)
+        self.buffer += dados
+        return True
+
+    async def ler(self, tamanho):
+        while len(self.buffer) < tamanho:
+            if not await self._ler():
+                raise ErroHttp(400, "Corpo da requisição incompleto")
+        dados, self.buffer = self.buffer[:tamanho], self.buffer[tamanho:]
+        return dados
+
+    async def ate(self, separador, escrever=None, limite=None):
+        """Consome o corpo até o separador (que é descartado), passando o conteúdo anterior a escrever em partes."""
+        lidos = 0
+        while True:
+            posicao = self.buffer.find(separador)
+            seguro = posicao if posicao >= 0 else len(self.buffer) - len(separador) + 1
+            if seguro > 0:
+                lidos += seguro
+                if limite is not None and lidos > limite:
+                    raise ErroHttp(400, "Parte do formulário maior que o permitido")
+                if escrever:
+                    escrever(self.buffer[:seguro])
+                self.buffer = self.buffer[seguro:]
+            if posicao >= 0:
+                self.buffer = self.buffer[len(separador):]
+                return
+            if not await self._ler():
+                raise ErroHttp(400, "Formulário multipart malformado")
+
+    async def descartar(self):
+        while await self._ler():
+            self.buffer = b''
+        self.buffer = b''
+
+
+async def _ler_multipart(corpo, fronteira, pasta):
+    """Campos de texto e arquivos do formulário; os arquivos são gravados na pasta à medida que chegam.
+
+    Retorna os campos (listas de textos ou caminhos gravados) e o nome original de cada arquivo gravado.
+    """
+    delimitador = b'--' + fronteira.encode('latin-1')
+    campos, enviados = {}, {}
+    await corpo.ate(delimitador, limite=LIMITE_CABECALHO)  # Preâmbulo
+    while await corpo.ler(2) == b'\r\n':
+        partes = []
+        await corpo.ate(b'\r\n\r\n', partes.append, limite=LIMITE_CABECALHO)
+        disposicao = _cabecalhos(b''.join(partes).decode('utf-8', 'replace')).get('content-disposition', '')
+        nome = _parametro(disposicao, 'name')
+        arquivo = _parametro(disposicao, 'filename')
+        if not nome:
+            raise ErroHttp(400, "Parte do formulário sem nome")
+        if arquivo:
+            extensao = os.path.splitext(arquivo)[1].lower()
+            if extensao not in EXTENSOES:
+                raise ErroHttp(415, f"{arquivo}: envie planilhas {', '.join(EXTENSOES)}")
+            base = re.sub(r'[^\w.-]', '_', os.path.basename(arquivo.replace('\\', '/')))
+            destino = os.path.join(pasta, f"{nome}_{len(enviados) + 1}_{base}")
+            with open(destino, 'wb') as saida:
+                await corpo.ate(b'\r\n' + delimitador, saida.write)
+            campos.setdefault(nome, []).append(destino)
+            enviados[destino] = arquivo
+        else:
+            partes = []
+            await corpo.ate(b'\r\n' + delimitador, partes.append, limite=LIMITE_CABECALHO)
+            campos.setdefault(nome, []).append(b''.join(partes).decode('utf-8').strip())
+    await corpo.descartar()  # Epílogo
+    return campos, enviados
+
+
+class Trabalho:
+    """Uma conciliação recebida pelo serviço: a tarefa do Lote, o futuro no pool e o resumo ao terminar."""
+
+    def __init__(self, tarefa, pasta, enviados):
+        self.id = os.path.basename(pasta)
+        self.tarefa = tarefa
+        self.pasta = pasta
+        self.enviados = enviados
+        self.estado = 'na_fila'
+        self.criada = time.time()
+        self.terminada = None
+        self.futuro = None
+        self.resumo = None
+
+    def situacao(self):
+        if self.estado == 'na_fila' and self.futuro is not None and self.futuro.running():
+            return 'executando'
+        return self.estado
+
+    def resultado(self, nome):
+        return os.path.join(self.pasta, f"{self.tarefa['nome']}_{nome}.csv")
+
+    def descrever(self):
+        descricao = {
+            'id': self.id,
+            'tipo': self.tarefa['tipo'],
+            'estado': self.situacao(),
+            'criada': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.criada)),
+        }
+        if self.resumo:
+            descricao.update(segundos=self.resumo['segundos'], linhas=self.resumo['linhas'], erro=self.resumo['erro'])
+            if self.estado == 'concluida':
+                descricao['resultados'] = {nome: f"/conciliacoes/{self.id}/resultados/{nome}" for nome in self.resumo['linhas']}
+        return descricao
+
+
+class Servico:
+    """Serviço HTTP local que executa as conciliações do Lote em um pool de processos.
+
+    POST /conciliacoes recebe um formulário multipart (tipo, ax — um ou mais — e outro, como arquivos ou
+    caminhos no servidor) ou um JSON com os caminhos, e responde 202 com o id. GET /conciliacoes/{id}
+    informa o estado, GET /conciliacoes/{id}/resultados/{nome}?formato=csv|json devolve um resultado em
+    partes e DELETE /conciliacoes/{id} cancela a conciliação ou, se já terminou, apaga os arquivos.
+    Uma conciliação já em execução não é interrompida: o processo termina, e os resultados são descartados.
+    As conciliações terminadas ficam disponíveis por retencao_horas, até no máximo max_terminadas.
+    """
+
+    def __init__(self, pasta=PASTA, processos=None, raiz=RAIZ, max_envio_mb=MAX_ENVIO_MB, max_fila=MAX_FILA,
+                 retencao_horas=RETENCAO_HORAS, max_terminadas=MAX_TERMINADAS):
+        self.pasta = os.path.abspath(pasta)
+        self.processos = processos
+        self.raiz = os.path.realpath(raiz or os.path.join(self.pasta, 'entrada'))
+        self.max_envio = max_envio_mb * MB
+        self.max_fila = max_fila
+        self.retencao = retencao_horas * 3600
+        self.max_terminadas = max_terminadas
+        self.registro = os.path.join(self.pasta, 'servico.jsonl')
+        self.trabalhos = {}
+        self._executor = None
+        self._servidor = None
+        self._acompanhamentos = set()
+
+    async def iniciar(self, host=HOST, porta=PORTA):
+        """Abre a porta (0 escolhe uma livre) e retorna o endereço em que o serviço atende."""
+        os.makedirs(self.pasta, exist_ok=True)
+        os.makedirs(self.raiz, exist_ok=True)
+        self._servidor = await asyncio.start_server(self._atender, host, porta, limit=LIMITE_CABECALHO)
+        host, porta = self._servidor.sockets[0].getsockname()[:2]
+        return f"http://{host}:{porta}"
+
+    async def encerrar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processos)
+        return self._executor
+
+    def _reiniciar_pool(self, pool):
+        # Um processo encerrado à força (por exemplo, sem memória) inutiliza o pool inteiro
+        if pool is not self._executor:
+            return  # Já substituído
+        logger.warning("Pool de processos interrompido; criando um novo")
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    # Requisições
+
+    async def _atender(self, reader, writer):
+        try:
+            try:
+                await self._rotear(reader, writer)
+            except ErroHttp as e:
+                await self._responder(writer, e.status, {'erro': str(e)})
+            except Exception as e:
+                logger.exception("Erro ao atender a requisição")
+                await self._responder(writer, 500, {'erro': f"{type(e).__name__}: {e}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # O cliente desconectou
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _rotear(self, reader, writer):
+        try:
+            cabecalho = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise ErroHttp(431, "Cabeçalho da requisição muito grande")
+        linha, _, resto = cabecalho.decode('latin-1').partition('\r\n')
+        try:
+            metodo, alvo, _ = linha.split(' ', 2)
+        except ValueError:
+            raise ErroHttp(400, "Requisição malformada")
+        cabecalhos = _cabecalhos(resto)
+        self._expirar()
+        url = urlsplit(alvo)
+        consulta = parse_qs(url.query)
+        rota = ROTA.match(unquote(url.path))
+        if not rota:
+            raise ErroHttp(404, "Recurso não encontrado")
+
+        if rota['id'] is None:
+            if metodo == 'POST':
+                trabalho = await self._receber(reader, cabecalhos)
+                return await self._responder(writer, 202, trabalho.descrever(), {'Location': f"/conciliacoes/{trabalho.id}"})
+            if metodo == 'GET':
+                return await self._responder(writer, 200, [trabalho.descrever() for trabalho in self.trabalhos.values()])
+            raise ErroHttp(405, "Use GET ou POST")
+
+        trabalho = self.trabalhos.get(rota['id'])
+        if trabalho is None:
+            raise ErroHttp(404, "Conciliação não encontrada")
+        if rota['resultado'] is not None:
+            if metodo != 'GET':
+                raise ErroHttp(405, "Use GET")
+            formato = consulta.get('formato', ['csv'])[0]
+            return await self._enviar_resultado(writer, trabalho, rota['resultado'], formato)
+        if metodo == 'GET':
+            return await self._responder(writer, 200, trabalho.descrever())
+        if metodo == 'DELETE':
+            return await self._responder(writer, 200, self.cancelar(trabalho))
+        raise ErroHttp(405, "Use GET ou DELETE")
+
+    async def _receber(self, reader, cabecalhos):
+        if 'chunked' in cabecalhos.get('transfer-encoding', '').lower() or 'content-length' not in cabecalhos:
+            raise ErroHttp(411, "Informe o Content-Length")
+        try:
+            tamanho = int(cabecalhos['content-length'])
+        except ValueError:
+            raise ErroHttp(400, "Content-Length inválido")
+        if tamanho > self.max_envio:
+            raise ErroHttp(413, f"Envio maior que {self.max_envio // MB} MB")
+        if len(self.trabalhos_na_fila()) >= self.max_fila:
+            raise ErroHttp(503, "Fila cheia; tente novamente mais tarde")
+
+        tipo_conteudo = cabecalhos.get('content-type', '')
+        corpo = _Corpo(reader, tamanho)
+        pasta = os.path.join(self.pasta, uuid.uuid4().hex)
+        os.makedirs(pasta)
+        try:
+            if tipo_conteudo.lower().startswith('multipart/form-data'):
+                fronteira = _parametro(tipo_conteudo, 'boundary')
+                if not fronteira:
+                    raise ErroHttp(400, "Formulário multipart sem boundary")
+                campos, enviados = await _ler_multipart(corpo, fronteira, pasta)
+            elif tipo_conteudo.lower().startswith('application/json'):
+                if tamanho > MAX_JSON:
+                    raise ErroHttp(413, "JSON muito grande; envie as planilhas como multipart")
+                try:
+                    dados = json.loads(await corpo.ler(tamanho))
+                except (ValueError, UnicodeDecodeError):
+                    raise ErroHttp(400, "JSON inválido")
+                if not isinstance(dados, dict):
+                    raise ErroHttp(400, "O JSON deve ser um objeto com tipo, ax e outro")
+                campos = {chave: valor if isinstance(valor, list) else [valor] for chave, valor in dados.items()}
+                enviados = {}
+            else:
+                raise ErroHttp(415, "Use multipart/form-data ou application/json")
+            trabalho = Trabalho(self._montar_tarefa(campos, enviados, pasta), pasta, enviados)
+        except BaseException:
+            shutil.rmtree(pasta, ignore_errors=True)
+            raise
+        self._submeter(trabalho)
+        return trabalho
+
+    def _caminho(self, caminho, enviados, pasta=False):
+        if caminho in enviados:
+            return caminho
+        if not isinstance(caminho, str) or not caminho:
+            raise ErroHttp(400, f"Caminho inválido: {caminho!r}")
+        caminho = os.path.realpath(caminho)
+        if os.path.commonpath([self.raiz, caminho]) != self.raiz:
+            raise ErroHttp(403, f"{caminho} está fora de {self.raiz}")
+        if not (os.path.isfile(caminho) or pasta and os.path.isdir(caminho)):
+            raise ErroHttp(400, f"{caminho} não encontrado")
+        return caminho
+
+    def _montar_tarefa(self, campos, enviados, pasta):
+        tipo = (campos.get('tipo') or [None])[0]
+        if tipo not in Lote.CONCILIACOES:
+            raise ErroHttp(400, f"tipo deve ser {', '.join(sorted(Lote.CONCILIACOES))}")
+        varias = tipo in Lote.VARIAS_PLANILHAS
+        ax = [self._caminho(caminho, enviados) for caminho in campos.get('ax', [])]
+        outro = [self._caminho(caminho, enviados, pasta=varias) for caminho in campos.get('outro', [])]
+        if not ax or not outro or (len(outro) != 1 and not varias):
+            raise ErroHttp(400, "Informe ao menos uma planilha ax e exatamente uma planilha outro")
+        if varias and not (len(outro) == 1 and os.path.isdir(outro[0])):
+            # Uma planilha por unidade, identificada pelo nome original do arquivo (veja Clinica.planilhas_clinica)
+            unidades = {Clinica.unidade_da_planilha(enviados.get(caminho, caminho)): caminho for caminho in outro}
+            if len(unidades) != len(outro):
+                raise ErroHttp(400, "Há planilhas de unidades diferentes com o mesmo nome de arquivo")
+            outro = [unidades]
+        return {
+            'tipo': tipo,
+            'ax': ax[0] if len(ax) == 1 else tuple(ax),
+            'outro': outro[0],
+            'nome': 'resultado',
+            'saida': pasta,
+        }
+
+    # Conciliações
+
+    def trabalhos_na_fila(self):
+        return [trabalho for trabalho in self.trabalhos.values() if trabalho.situacao() == 'na_fila']
+
+    def _submeter(self, trabalho):
+        try:
+            pool = self._pool()
+            trabalho.futuro = pool.submit(Lote.executar_tarefa, trabalho.tarefa)
+        except BrokenProcessPool:
+            self._reiniciar_pool(self._executor)
+            pool = self._pool()
+            trabalho.futuro = pool.submit(Lote.executar_tarefa, trabalho.tarefa)
+        self.trabalhos[trabalho.id] = trabalho
+        acompanhamento = asyncio.get_running_loop().create_task(self._acompanhar(trabalho, pool))
+        self._acompanhamentos.add(acompanhamento)
+        acompanhamento.add_done_callback(self._acompanhamentos.discard)
+        logger.info("%s: %s recebida", trabalho.id, trabalho.tarefa['tipo'])
+
+    async def _acompanhar(self, trabalho, pool):
+        try:
+            resumo = await asyncio.wrap_future(trabalho.futuro)
+        except asyncio.CancelledError:
+            return  # Cancelada ainda na fila
+        except BrokenProcessPool as e:
+            resumo = dict(trabalho.tarefa, status='erro', arquivos=[], linhas={}, erro=f"{type(e).__name__}: {e}", segundos=None)
+            self._reiniciar_pool(pool)
+        trabalho.resumo = resumo
+        # As planilhas enviadas só servem para esta conciliação
+        for caminho in trabalho.enviados:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+        if trabalho.estado == 'cancelada':
+            shutil.rmtree(trabalho.pasta, ignore_errors=True)
+        else:
+            trabalho.estado = 'concluida' if resumo['status'] == 'ok' else 'erro'
+        trabalho.terminada = time.time()
+        gravar_registro(dict(resumo, id=trabalho.id, estado=trabalho.estado, total_segundos=round(time.time() - trabalho.criada, 3)), self.registro)
+        logger.info("%s: %s (%ss) %s", trabalho.id, trabalho.estado, resumo['segundos'], resumo['erro'] or '')
+        self._expirar()
+
+    def cancelar(self, trabalho):
+        """Cancela a conciliação; se já terminou, apaga os resultados e a esquece."""
+        if trabalho.terminada is not None:
+            self._remover(trabalho)
+            return dict(trabalho.descrever(), estado='removida')
+        if trabalho.estado != 'cancelada':
+            trabalho.estado = 'cancelada'
+            if trabalho.futuro.cancel():
+                shutil.rmtree(trabalho.pasta, ignore_errors=True)
+                trabalho.resumo = dict(trabalho.tarefa, status='cancelada', arquivos=[], linhas={}, erro=None, segundos=None)
+                trabalho.terminada = time.time()
+            logger.info("%s: cancelada", trabalho.id)
+        return trabalho.descrever()
+
+    def _remover(self, trabalho):
+        del self.trabalhos[trabalho.id]
+        shutil.rmtree(trabalho.pasta, ignore_errors=True)
+
+    def _expirar(self):
+        # Sem isso, cada conciliação terminada ficaria na memória e no disco enquanto o serviço rodasse
+        terminadas = sorted((trabalho for trabalho in self.trabalhos.values() if trabalho.terminada is not None),
+                            key=lambda trabalho: trabalho.terminada)
+        limite = time.time() - self.retencao
+        excedentes = len(terminadas) - self.max_terminadas
+        for posicao, trabalho in enumerate(terminadas):
+            if posicao < excedentes or trabalho.terminada < limite:
+                self._remover(trabalho)
+                logger.info("%s: expirada", trabalho.id)
+
+    # Respostas
+
+    async def _responder(self, writer, status, dados, cabecalhos=None):
+        corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+        cabecalhos = dict(cabecalhos or {}, **{'Content-Type': 'application/json; charset=utf-8', 'Content-Length': str(len(corpo))})
+        self._iniciar_resposta(writer, status, cabecalhos)
+        writer.write(corpo)
+        await writer.drain()
+
+    def _iniciar_resposta(self, writer, status, cabecalhos):
+        linhas = [f"HTTP/1.1 {status} {MENSAGENS.get(status, '')}"]
+        linhas += [f"{chave}: {valor}" for chave, valor in dict(cabecalhos, Connection='close').items()]
+        writer.write(('\r\n'.join(linhas) + '\r\n\r\n').encode('latin-1'))
+
+    async def _enviar_resultado(self, writer, trabalho, nome, formato):
+        if trabalho.situacao() != 'concluida':
+            raise ErroHttp(409, f"Conciliação {trabalho.situacao()}")
+        if nome not in trabalho.resumo['linhas']:
+            raise ErroHttp(404, f"Resultado não encontrado; disponíveis: {', '.join(trabalho.resumo['linhas'])}")
+        if formato == 'csv':
+            partes, tipo = _partes_csv(trabalho.resultado(nome)), 'text/csv; charset=utf-8'
+        elif formato == 'json':
+            partes, tipo = _partes_json(trabalho.resultado(nome)), 'application/json; charset=utf-8'
+        else:
+            raise ErroHttp(400, "formato deve ser csv ou json")
+
+        # Sem Content-Length: o resultado é enviado em partes e a conexão fecha ao final
+        loop = asyncio.get_running_loop()
+        primeira = await loop.run_in_executor(None, next, partes, None)
+        self._iniciar_resposta(writer, 200, {
+            'Content-Type': tipo,
+            'Content-Disposition': f'attachment; filename="{trabalho.tarefa["nome"]}_{nome}.{formato}"',
+        })
+        parte = primeira
+        while parte is not None:
+            writer.write(parte)
+            await writer.drain()
+            parte = await loop.run_in_executor(None, next, partes, None)
+
+
+def _partes_csv(caminho):
+    with open(caminho, 'rb') as arquivo:
+        while parte := arquivo.read(BLOCO):
+            yield parte
+
+
+def _partes_json(caminho):
+    """Lista JSON de registros, convertida em blocos de LINHAS_JSON linhas do CSV.
+
+    A primeira parte já traz o primeiro bloco convertido: um erro ao ler o CSV acontece antes
+    de o cabeçalho da resposta ser enviado e ainda vira um 500.
+    """
+    import pandas as pd
+
+    try:
+        blocos = pd.read_csv(caminho, sep=';', chunksize=LINHAS_JSON)
+    except pd.errors.EmptyDataError:
+        yield b'[]'  # Arquivo vazio, sem cabeçalho
+        return
+    abertura = b'['
+    with blocos:
+        for bloco in blocos:
+            registros = bloco.to_json(orient='records', force_ascii=False, date_format='iso')[1:-1]
+            if registros:
+                yield abertura + registros.encode('utf-8')
+                abertura = b','
+    yield (b'[]' if abertura == b'[' else b']')
+
+
+async def servir(host=HOST, porta=PORTA, **opcoes):
+    """Atende até Ctrl+C (ou SIGTERM); as conciliações na fila são canceladas ao encerrar."""
+    servico = Servico(**opcoes)
+    endereco = await servico.iniciar(host, porta)
+    print(f"Serviço em {endereco}; arquivos em {servico.pasta}", flush=True)
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sinal, parar.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C interrompe asyncio.run
+    try:
+        await parar.wait()
+    finally:
+        await servico.encerrar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de conciliação, com fila de processamento.")
+    parser.add_argument('--host', default=HOST, help="Endereço (padrão: 127.0.0.1, apenas esta máquina)")
+    parser.add_argument('--porta', type=int, default=PORTA, help="Porta (0 escolhe uma livre)")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos (padrão: núcleos disponíveis)")
+    parser.add_argument('--pasta', default=PASTA, help="Diretório das planilhas enviadas e dos resultados")
+    parser.add_argument('--raiz', default=RAIZ, help="Só aceita caminhos no servidor dentro deste diretório (padrão: a subpasta 'entrada' da pasta)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%H:%M:%S')
+
+    if args.raiz and not os.path.isdir(args.raiz):
+        print(f"Erro: {args.raiz} não é uma pasta", file=sys.stderr)
+        return 2
+    try:
+        asyncio.run(servir(args.host, args.porta, pasta=args.pasta, processos=args.processos, raiz=args.raiz))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
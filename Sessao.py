@@ -0,0 +1,212 @@
+import glob
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Chaves import contem, indexar, juntar, normalizar_chave
+from Historico import registrar
+from Metricas import contar, etapa
+from Planilha import ler_planilha
+
+logger = logging.getLogger(__name__)
+
+# Colunas da planilha AX usadas pelas conciliações (cada uma seleciona as que precisa).
+# Lidas sempre com o mesmo conjunto de colunas, as conciliações compartilham também a entrada do cache.
+# Valor e Data são usados pela conciliação por valor do banco (veja Banco.conciliar_valores).
+COLUNAS_AX = {'Fatura': str, 'Status': 'category', 'Conta de cliente': None, 'Valor': None, 'Data': None}
+
+
+def arquivos_ax(entrada):
+    """Arquivos AX de uma entrada: um caminho, um padrão glob (por exemplo, 'AX_*.xlsx') ou uma sequência deles."""
+    if isinstance(entrada, (str, os.PathLike)):
+        entrada = [entrada]
+    arquivos = []
+    for item in map(os.fspath, entrada):
+        if any(caractere in item for caractere in '*?[') and not os.path.exists(item):
+            encontrados = sorted(glob.glob(item))
+            if not encontrados:
+                raise FileNotFoundError(f"Nenhuma planilha AX corresponde a {item}")
+            arquivos += encontrados
+        else:
+            arquivos.append(item)
+    return tuple(dict.fromkeys(arquivos))  # Sem repetir o mesmo arquivo
+
+
+def caminho_ax(entrada):
+    """O caminho, quando a entrada é um único arquivo, ou a tupla dos arquivos."""
+    arquivos = arquivos_ax(entrada)
+    return arquivos[0] if len(arquivos) == 1 else arquivos
+
+
+def _versao(caminho):
+    if isinstance(caminho, tuple):
+        return tuple(_versao(arquivo) for arquivo in caminho)
+    info = os.stat(caminho)
+    return info.st_size, info.st_mtime_ns
+
+
+def _ler_arquivo_ax(caminho):
+    dados = ler_planilha(caminho, skiprows=11, colunas=COLUNAS_AX)
+    dados['Fatura'] = normalizar_chave(dados['Fatura'])
+    registrar('ax', caminho, dados)
+    return dados
+
+
+def _unir_arquivos_ax(partes, arquivos):
+    """Concatena as planilhas AX, sem a linha de totais de cada uma, mantendo a primeira ocorrência de cada fatura.
+
+    Retorna também as faturas que aparecem em mais de um arquivo com Status diferentes (Fatura, Status, Arquivo).
+    """
+    partes = [parte[parte['Fatura'].notna()] for parte in partes]
+    # Mesmas categorias de Status em todas as partes, para a concatenação manter o tipo category
+    categorias = pd.api.types.union_categoricals([parte['Status'] for parte in partes]).categories
+    partes = [parte.assign(Status=parte['Status'].cat.set_categories(categorias)) for parte in partes]
+    dados = pd.concat(partes, ignore_index=True)
+    origem = np.repeat(np.arange(len(partes)), [len(parte) for parte in partes])
+
+    repetidas = dados['Fatura'].duplicated(keep=False).to_numpy()
+    conflitos = dados.loc[repetidas, ['Fatura', 'Status']]
+    conflitos['Arquivo'] = pd.Categorical.from_codes(origem[repetidas], [os.path.basename(arquivo) for arquivo in arquivos])
+    status_distintos = conflitos.groupby('Fatura')['Status'].nunique(dropna=False)
+    conflitos = conflitos[conflitos['Fatura'].isin(status_distintos.index[status_distintos > 1])]
+    conflitos = conflitos.sort_values('Fatura', kind='stable').reset_index(drop=True)
+
+    dados = dados[~dados['Fatura'].duplicated()].reset_index(drop=True)
+    return dados, conflitos
+
+
+class PlanilhaAX:
+    """Planilha AX lida uma única vez: Fatura já normalizada, Status e Conta de cliente.
+
+    As linhas ficam na ordem do arquivo (inclusive a linha de totais, que cada conciliação trata
+    como antes); o índice das faturas é montado na primeira consulta e reaproveitado nas seguintes.
+
+    Com vários arquivos (caminho é então a tupla dos arquivos), eles são lidos em paralelo e unidos
+    sem as linhas de totais; uma fatura repetida fica com o Status do primeiro arquivo em que aparece,
+    e as que aparecem com Status diferentes ficam em conflitos.
+    """
+
+    def __init__(self, caminho, dados, versao=None, conflitos=None):
+        self.caminho = caminho
+        self.dados = dados
+        self.versao = versao
+        self.conflitos = conflitos if conflitos is not None else pd.DataFrame(columns=['Fatura', 'Status', 'Arquivo'])
+        self._indice = None
+
+    @classmethod
+    def carregar(cls, caminho, medicao=None):
+        """caminho pode ser um arquivo, um padrão glob ou uma sequência deles (veja arquivos_ax)."""
+        caminho = caminho_ax(caminho)
+        versao = _versao(caminho)
+        if isinstance(caminho, tuple):
+            with etapa(medicao, 'Leitura AX'):
+                # A leitura e a normalização de cada arquivo rodam em paralelo
+                with ThreadPoolExecutor(max_workers=min(len(caminho), os.cpu_count() or 1)) as executor:
+                    partes = list(executor.map(_ler_arquivo_ax, caminho))
+            with etapa(medicao, 'União AX'):
+                dados, conflitos = _unir_arquivos_ax(partes, caminho)
+            if len(conflitos):
+                logger.warning("%d fatura(s) com Status diferentes entre os arquivos AX", conflitos['Fatura'].nunique())
+            planilha = cls(caminho, dados, versao, conflitos)
+        else:
+            with etapa(medicao, 'Leitura AX'):
+                dados = ler_planilha(caminho, skiprows=11, colunas=COLUNAS_AX)
+            with etapa(medicao, 'Normalização AX'):
+                dados['Fatura'] = normalizar_chave(dados['Fatura'])
+            registrar('ax', caminho, dados, medicao)
+            planilha = cls(caminho, dados, versao)
+        planilha.contar(medicao)
+        return planilha
+
+    @classmethod
+    def obter(cls, planilha_ax, medicao=None):
+        """Aceita o caminho da planilha (ou os arquivos, veja carregar) ou uma PlanilhaAX já carregada (por exemplo, a da sessão)."""
+        if isinstance(planilha_ax, cls):
+            planilha_ax.contar(medicao)
+            return planilha_ax
+        return cls.carregar(planilha_ax, medicao)
+
+    def contar(self, medicao):
+        contar(medicao, 'AX', len(self.dados))
+        if len(self.conflitos):
+            contar(medicao, 'conflitos AX', self.conflitos['Fatura'].nunique())
+
+    @property
+    def descricao(self):
+        """Nome do arquivo, ou a quantidade de arquivos, para exibir."""
+        if isinstance(self.caminho, tuple):
+            return f"{len(self.caminho)} arquivos AX"
+        return os.path.basename(self.caminho)
+
+    def atualizada(self):
+        """Indica se os arquivos ainda são os mesmos que foram lidos."""
+        try:
+            return _versao(self.caminho) == self.versao
+        except OSError:
+            return False
+
+    def colunas(self, *nomes):
+        """DataFrame com as colunas pedidas; alterá-lo não altera os dados compartilhados."""
+        return self.dados[list(nomes)].copy(deep=False)
+
+    @property
+    def indice(self):
+        if self._indice is None:
+            self._indice = indexar(self.dados['Fatura'])
+        return self._indice
+
+    def contem(self, chaves):
+        """Máscara das chaves que são faturas da planilha AX."""
+        return contem(chaves, self.indice)
+
+    def consultar(self, faturas):
+        """Linhas da planilha AX das faturas informadas (na ordem das faturas)."""
+        _, posicoes = juntar(normalizar_chave(faturas), self.indice, como='inner')
+        return self.dados.iloc[posicoes].reset_index(drop=True)
+
+
+def _mesmos_arquivos(caminho, outro):
+    return [os.path.abspath(arquivo) for arquivo in arquivos_ax(caminho)] == [os.path.abspath(arquivo) for arquivo in arquivos_ax(outro)]
+
+
+class Sessao:
+    """Dados compartilhados pelas janelas abertas a partir do menu principal."""
+
+    def __init__(self):
+        self.ax = None
+        self._trava = threading.Lock()
+
+    def obter_ax(self, caminho, medicao=None):
+        """Retorna a planilha AX da sessão, lendo o arquivo apenas se ele ainda não foi lido ou mudou."""
+        with self._trava:
+            if (self.ax is not None and _mesmos_arquivos(self.ax.caminho, caminho)
+                    and self.ax.atualizada()):
+                logger.info("%s: planilha AX da sessão reaproveitada", self.ax.descricao)
+                self.ax.contar(medicao)
+                return self.ax
+            self.ax = PlanilhaAX.carregar(caminho, medicao)
+            return self.ax
+
+    def limpar(self):
+        with self._trava:
+            self.ax = None
+
+
+def sessao_da_janela(janela):
+    """Sessão do menu principal que abriu a janela (None quando a janela é executada sozinha)."""
+    return getattr(janela.master, 'sessao', None)
+
+
+def caminho_ax_da_sessao(janela):
+    sessao = sessao_da_janela(janela)
+    return sessao.ax.caminho if sessao and sessao.ax else ""
+
+
+def ax_da_janela(janela, caminho, medicao=None):
+    """A planilha AX da sessão, quando a janela foi aberta pelo menu principal, ou o próprio caminho."""
+    sessao = sessao_da_janela(janela)
+    return sessao.obter_ax(caminho, medicao) if sessao else caminho
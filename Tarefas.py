@@ -0,0 +1,167 @@
+import contextlib
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Quantidade de conciliações executadas ao mesmo tempo; as demais aguardam na fila
+MAX_TAREFAS = int(os.environ.get('NFSE_MAX_TAREFAS', '2'))
+
+
+class Cancelada(Exception):
+    """A tarefa foi cancelada pelo usuário."""
+
+
+class Tarefa:
+    """Uma execução em segundo plano, com cancelamento cooperativo e eventos de andamento.
+
+    A função da tarefa recebe a própria Tarefa como primeiro argumento e chama progresso(...)
+    a cada etapa; quando a tarefa foi cancelada, progresso (ou verificar) levanta Cancelada.
+    Cada observador recebe os eventos em uma fila própria: ('progresso', dados), e por último
+    ('concluida', resultado), ('erro', exceção) ou ('cancelada', None). Uma tarefa acompanhada
+    por várias janelas só é cancelada quando a última deixa de acompanhá-la (veja desassinar).
+    """
+
+    def __init__(self, chave):
+        self.chave = chave
+        self.estado = 'aguardando'
+        self.resultado = None
+        self.medicao = None  # Preenchida por medir()
+        self._cancelamento = threading.Event()
+        self._trava = threading.Lock()
+        self._filas = []
+        self._final = None
+
+    def assinar(self):
+        fila = queue.Queue()
+        with self._trava:
+            self._filas.append(fila)
+            if self._final is not None:
+                fila.put(self._final)
+        return fila
+
+    def desassinar(self, fila):
+        """Para de enviar eventos à fila; sem nenhum observador, a tarefa ainda em andamento é cancelada."""
+        with self._trava:
+            if fila in self._filas:
+                self._filas.remove(fila)
+            restantes = len(self._filas)
+        if restantes == 0 and not self.concluida:
+            self.cancelar()
+
+    @property
+    def observadores(self):
+        with self._trava:
+            return len(self._filas)
+
+    def _publicar(self, evento, final=False):
+        with self._trava:
+            if final:
+                self._final = evento
+            for fila in self._filas:
+                fila.put(evento)
+
+    def cancelar(self):
+        self._cancelamento.set()
+
+    @property
+    def cancelada(self):
+        return self._cancelamento.is_set()
+
+    @property
+    def concluida(self):
+        return self._final is not None
+
+    def verificar(self):
+        if self.cancelada:
+            raise Cancelada()
+
+    def progresso(self, **dados):
+        self.verificar()
+        self._publicar(('progresso', dados))
+
+    @contextlib.contextmanager
+    def medir(self, conciliacao, **arquivos):
+        """Medição da execução (veja Metricas) que informa o andamento da tarefa e registra o erro ou o cancelamento."""
+        from Metricas import Medicao
+        self.medicao = Medicao(conciliacao, ao_progresso=self.progresso, **arquivos).iniciar()
+        try:
+            yield self.medicao
+        except Cancelada:
+            self.medicao.finalizar('cancelada')
+            raise
+        except Exception as e:
+            self.medicao.finalizar('erro', e)
+            raise
+        # A renderização, feita depois na thread da interface, não informa andamento nem é cancelada.
+        # A janela pode ser fechada antes de renderizar: a medição já solta os loggers e o tracemalloc aqui
+        self.medicao.ao_progresso = None
+        self.medicao.liberar()
+
+    def _executar(self, funcao, args, kwargs):
+        try:
+            self.verificar()  # Cancelada enquanto aguardava na fila
+            self.estado = 'executando'
+            self.resultado = funcao(self, *args, **kwargs)
+        except Cancelada:
+            self.estado = 'cancelada'
+            self._publicar(('cancelada', None), final=True)
+        except Exception as e:
+            self.estado = 'erro'
+            self._publicar(('erro', e), final=True)
+        else:
+            self.estado = 'concluida'
+            self._publicar(('concluida', self.resultado), final=True)
+
+
+class Agendador:
+    """Executa as tarefas em um número limitado de threads.
+
+    Uma tarefa com a mesma chave de outra ainda em andamento não é iniciada de novo:
+    enviar devolve a tarefa existente. Se essa tarefa já foi cancelada (por exemplo, pela
+    janela que a iniciou), uma nova é iniciada no lugar dela.
+    """
+
+    def __init__(self, max_tarefas=MAX_TAREFAS):
+        self._executor = ThreadPoolExecutor(max_workers=max_tarefas, thread_name_prefix='tarefa')
+        self._ativas = {}
+        self._trava = threading.Lock()
+
+    def enviar(self, chave, funcao, *args, **kwargs):
+        with self._trava:
+            tarefa = self._ativas.get(chave)
+            if tarefa is not None and not tarefa.concluida and not tarefa.cancelada:
+                return tarefa
+            tarefa = Tarefa(chave)
+            self._ativas[chave] = tarefa
+        self._executor.submit(self._executar, tarefa, funcao, args, kwargs)
+        return tarefa
+
+    def _executar(self, tarefa, funcao, args, kwargs):
+        try:
+            tarefa._executar(funcao, args, kwargs)
+        finally:
+            with self._trava:
+                if self._ativas.get(tarefa.chave) is tarefa:
+                    del self._ativas[tarefa.chave]
+
+    def ativas(self):
+        with self._trava:
+            return list(self._ativas.values())
+
+    def cancelar_todas(self):
+        for tarefa in self.ativas():
+            tarefa.cancelar()
+
+
+_agendador = None
+_trava_agendador = threading.Lock()
+
+
+def obter_agendador():
+    """Agendador compartilhado por todas as janelas."""
+    global _agendador
+    with _trava_agendador:
+        if _agendador is None:
+            _agendador = Agendador()
+        return _agendador
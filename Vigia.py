@@ -0,0 +1,293 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import Lote
+from Metricas import gravar_registro
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre as varreduras das pastas e tempo sem alteração (tamanho e data) para considerar o arquivo completo
+INTERVALO = float(os.environ.get('NFSE_VIGIA_INTERVALO', '1'))
+ESPERA = float(os.environ.get('NFSE_VIGIA_ESPERA', '2'))
+
+EXTENSOES = ('.xlsx', '.xls', '.csv')
+# Arquivos temporários do Excel (~$) e ocultos
+PREFIXOS_IGNORADOS = ('~$', '.')
+
+# A fonte é identificada pelas colunas de cabeçalho encontradas nas primeiras linhas (na ordem abaixo)
+LINHAS_IDENTIFICACAO = 20
+AMOSTRA_CSV = 64 * 1024
+ASSINATURAS = [
+    ('ax', {'Fatura', 'Status'}),
+    ('banco', {'Nosso Número'}),
+    ('clinica', {'NFAX'}),
+    ('prefeitura', {'Número do RPS'}),
+    ('emitidas', {'Título'}),
+]
+
+# Conciliação (veja Lote.CONCILIACOES) afetada por cada planilha de parceiro; a AX afeta todas
+CONCILIACAO_DA_FONTE = {
+    'clinica': 'clinica',
+    'prefeitura': 'comparador',
+    'emitidas': 'faturamento',
+    'banco': 'banco',
+}
+
+
+def _primeiras_linhas(caminho):
+    """Valores das primeiras linhas da planilha (da primeira aba, no Excel), sem ler o arquivo inteiro."""
+    if caminho.lower().endswith('.csv'):
+        with open(caminho, 'rb') as arquivo:
+            amostra = arquivo.read(AMOSTRA_CSV)
+        try:
+            texto = amostra.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            texto = amostra.decode('iso-8859-1')
+        linhas = texto.splitlines()[:LINHAS_IDENTIFICACAO]
+        return [[campo.strip().strip('"') for campo in linha.replace(',', ';').replace('\t', ';').split(';')] for linha in linhas]
+    if caminho.lower().endswith('.xlsx'):
+        import openpyxl
+
+        livro = openpyxl.load_workbook(caminho, read_only=True, data_only=True, keep_links=False)
+        try:
+            linhas = livro.worksheets[0].iter_rows(max_row=LINHAS_IDENTIFICACAO, values_only=True)
+            return [[str(valor).strip() for valor in linha if valor is not None] for linha in linhas]
+        finally:
+            livro.close()
+    import pandas as pd
+
+    df = pd.read_excel(caminho, header=None, nrows=LINHAS_IDENTIFICACAO)
+    return [[str(valor).strip() for valor in linha if pd.notna(valor)] for linha in df.itertuples(index=False, name=None)]
+
+
+def identificar_fonte(caminho):
+    """Fonte da planilha ('ax', 'banco', 'clinica', 'prefeitura' ou 'emitidas') pelo cabeçalho, ou None."""
+    for linha in _primeiras_linhas(caminho):
+        campos = set(linha)
+        for fonte, colunas in ASSINATURAS:
+            if colunas <= campos:
+                return fonte
+    return None
+
+
+class Vigia:
+    """Acompanha as pastas e executa as conciliações afetadas por cada planilha nova ou alterada.
+
+    As pastas são varridas a cada intervalo (apenas os metadados dos arquivos); um arquivo é processado
+    quando seu tamanho e sua data ficam inalterados por espera segundos, ou seja, quando a gravação terminou.
+    Cada conciliação usa a última planilha AX e a última planilha do parceiro recebidas e roda em um
+    processo do pool (veja Lote.executar_tarefa); uma conciliação acionada de novo enquanto ainda está em
+    andamento é executada mais uma vez ao terminar, com os arquivos mais recentes.
+    """
+
+    def __init__(self, pastas, saida, processos=None, intervalo=INTERVALO, espera=ESPERA, processar_existentes=False):
+        self.pastas = [os.path.abspath(pasta) for pasta in pastas]
+        self.saida = os.path.abspath(saida)
+        self.processos = processos
+        self.intervalo = intervalo
+        self.espera = espera
+        self.processar_existentes = processar_existentes
+        self.registro = os.path.join(self.saida, 'vigia.jsonl')
+        self.ultimos = {}  # Fonte -> (caminho, momento em que o arquivo foi gravado)
+        self._arquivos = {}  # Caminho -> estado da observação
+        self._em_andamento = {}  # Conciliação -> (futuro, tarefa, pool)
+        self._pendentes = {}  # Conciliação -> momento do arquivo que a acionou
+        self._parar = threading.Event()
+        self._executor = None
+
+    def _listar(self):
+        arquivos = {}
+        for pasta in self.pastas:
+            if pasta == self.saida:
+                continue  # Os próprios resultados não são conciliados
+            try:
+                entradas = list(os.scandir(pasta))
+            except OSError as e:
+                logger.warning("%s: pasta inacessível (%s)", pasta, e)
+                continue
+            for entrada in entradas:
+                nome = entrada.name
+                if nome.startswith(PREFIXOS_IGNORADOS) or not nome.lower().endswith(EXTENSOES):
+                    continue
+                try:
+                    if not entrada.is_file():
+                        continue
+                    info = entrada.stat()
+                except OSError:
+                    continue  # Removido durante a varredura
+                arquivos[entrada.path] = (info.st_size, info.st_mtime_ns)
+        return arquivos
+
+    def varrer(self, agora=None):
+        """Uma varredura: registra as alterações e processa os arquivos que ficaram estáveis."""
+        agora = time.monotonic() if agora is None else agora
+        arquivos = self._listar()
+        for caminho in set(self._arquivos) - set(arquivos):
+            del self._arquivos[caminho]
+            for fonte, (ultimo, _) in list(self.ultimos.items()):
+                if ultimo == caminho:
+                    del self.ultimos[fonte]
+                    logger.info("%s: removido (%s)", os.path.basename(caminho), fonte)
+
+        estaveis = []
+        for caminho, assinatura in arquivos.items():
+            estado = self._arquivos.get(caminho)
+            if estado is None or estado['assinatura'] != assinatura:
+                self._arquivos[caminho] = {
+                    'assinatura': assinatura,
+                    'desde': agora,
+                    'processada': estado['processada'] if estado else None,
+                }
+            elif estado['processada'] != assinatura and agora - estado['desde'] >= self.espera:
+                estaveis.append(caminho)
+
+        # Os mais antigos primeiro, para que o último gravado de cada fonte prevaleça
+        for caminho in sorted(estaveis, key=lambda caminho: self._arquivos[caminho]['assinatura'][1]):
+            self._processar_arquivo(caminho, agora)
+
+    def _processar_arquivo(self, caminho, agora):
+        estado = self._arquivos[caminho]
+        try:
+            fonte = identificar_fonte(caminho)
+        except Exception as e:
+            # Ainda bloqueado ou incompleto (por exemplo, um .xlsx em cópia): tenta de novo após a espera
+            logger.info("%s: ainda não pode ser lido (%s: %s)", os.path.basename(caminho), type(e).__name__, e)
+            estado['desde'] = agora
+            return
+        estado['processada'] = estado['assinatura']
+        if fonte is None:
+            logger.info("%s: fonte não reconhecida, ignorado", os.path.basename(caminho))
+            return
+
+        gravado = estado['assinatura'][1] / 1e9
+        self.ultimos[fonte] = (caminho, gravado)
+        logger.info("%s: planilha %s", os.path.basename(caminho), fonte)
+        tipos = list(CONCILIACAO_DA_FONTE.values()) if fonte == 'ax' else [CONCILIACAO_DA_FONTE[fonte]]
+        for tipo in tipos:
+            self._acionar(tipo, gravado)
+
+    def _acionar(self, tipo, gravado):
+        fonte = next(fonte for fonte, conciliacao in CONCILIACAO_DA_FONTE.items() if conciliacao == tipo)
+        if 'ax' not in self.ultimos or fonte not in self.ultimos:
+            return  # Aguarda a outra planilha
+        if tipo in self._em_andamento:
+            self._pendentes[tipo] = max(gravado, self._pendentes.get(tipo, 0))
+            return
+        tarefa = {
+            'tipo': tipo,
+            'ax': self.ultimos['ax'][0],
+            'outro': self.ultimos[fonte][0],
+            'nome': f"{time.strftime('%Y%m%d_%H%M%S')}_{tipo}",
+            'saida': self.saida,
+            'gravado': gravado,
+        }
+        try:
+            futuro = self._pool().submit(Lote.executar_tarefa, tarefa)
+        except BrokenProcessPool:
+            self._reiniciar_pool(self._executor)
+            futuro = self._pool().submit(Lote.executar_tarefa, tarefa)
+        self._em_andamento[tipo] = (futuro, tarefa, self._executor)
+        logger.info("%s: %s x %s", tipo, os.path.basename(tarefa['ax']), os.path.basename(tarefa['outro']))
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processos)
+        return self._executor
+
+    def _reiniciar_pool(self, pool):
+        # Um processo encerrado à força (por exemplo, sem memória) inutiliza o pool inteiro
+        if pool is not self._executor:
+            return  # Já substituído
+        logger.warning("Pool de processos interrompido; criando um novo")
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def coletar(self):
+        """Registra as conciliações concluídas e executa de novo as que foram acionadas nesse meio tempo."""
+        for tipo, (futuro, tarefa, pool) in list(self._em_andamento.items()):
+            if not futuro.done():
+                continue
+            del self._em_andamento[tipo]
+            try:
+                resumo = futuro.result()
+            except CancelledError:
+                # Ainda na fila ao parar: o pool é encerrado com cancel_futures=True
+                resumo = dict(tarefa, status='cancelada', arquivos=[], linhas={}, erro=None, segundos=None)
+            except BrokenProcessPool as e:
+                resumo = dict(tarefa, status='erro', arquivos=[], linhas={}, erro=f"{type(e).__name__}: {e}", segundos=None)
+                self._reiniciar_pool(pool)
+            # Latência: do momento em que o arquivo foi gravado até os resultados estarem no disco
+            resumo['latencia_segundos'] = round(time.time() - tarefa['gravado'], 3)
+            gravar_registro(resumo, self.registro)
+            duracao = '-' if resumo['segundos'] is None else f"{resumo['segundos']}s"
+            mensagem = f"[{resumo['status']}] {resumo['nome']} ({duracao}, {resumo['latencia_segundos']}s após a gravação)"
+            print(f"{mensagem} {resumo['erro'] or ''}".rstrip(), flush=True)
+            if tipo in self._pendentes and not self._parar.is_set():
+                self._acionar(tipo, self._pendentes.pop(tipo))
+
+    def iniciar(self):
+        """Primeira varredura: sem processar_existentes, os arquivos já presentes apenas definem as últimas planilhas."""
+        os.makedirs(self.saida, exist_ok=True)
+        arquivos = self._listar()
+        for caminho, assinatura in sorted(arquivos.items(), key=lambda item: item[1][1]):
+            self._arquivos[caminho] = {'assinatura': assinatura, 'desde': float('-inf'), 'processada': None}
+            if self.processar_existentes:
+                continue
+            self._arquivos[caminho]['processada'] = assinatura
+            try:
+                fonte = identificar_fonte(caminho)
+            except Exception:
+                continue
+            if fonte:
+                self.ultimos[fonte] = (caminho, assinatura[1] / 1e9)
+        logger.info("Acompanhando %s (%d arquivo(s)); resultados em %s", ', '.join(self.pastas), len(arquivos), self.saida)
+
+    def executar(self):
+        """Varre as pastas até parar() ser chamado (ou Ctrl+C); as conciliações em andamento são concluídas."""
+        self.iniciar()
+        try:
+            while True:
+                self.varrer()
+                self.coletar()
+                if self._parar.wait(self.intervalo):
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._parar.set()  # Também no Ctrl+C: coletar não aciona de novo as pendentes
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+            self.coletar()
+
+    def parar(self):
+        self._parar.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Acompanha pastas e concilia automaticamente as planilhas novas ou alteradas.")
+    parser.add_argument('pastas', nargs='+', help="Pastas em que as planilhas são gravadas")
+    parser.add_argument('--saida', default='resultados', help="Diretório dos resultados (e do registro vigia.jsonl)")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos (padrão: núcleos disponíveis)")
+    parser.add_argument('--intervalo', type=float, default=INTERVALO, help="Segundos entre as varreduras")
+    parser.add_argument('--espera', type=float, default=ESPERA, help="Segundos sem alteração para considerar o arquivo completo")
+    parser.add_argument('--processar-existentes', action='store_true', help="Concilia também os arquivos já presentes nas pastas")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%H:%M:%S')
+
+    for pasta in args.pastas:
+        if not os.path.isdir(pasta):
+            print(f"Erro: {pasta} não é uma pasta", file=sys.stderr)
+            return 2
+    Vigia(args.pastas, args.saida, args.processos, args.intervalo, args.espera, args.processar_existentes).executar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+import queue
+
+import numpy as np
+import pandas as pd
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+
+
+class TabelaVirtual(ttk.Frame):
+    """Treeview que mantém o DataFrame como dados e cria apenas as linhas visíveis.
+
+    Rolagem, ordenação (clique no cabeçalho) e busca operam sobre o DataFrame; a Treeview
+    só tem os itens que cabem na tela, que são reaproveitados a cada rolagem.
+    """
+
+    def __init__(self, master, dataframe, colunas=None):
+        super().__init__(master)
+        self.dados = dataframe.reset_index(drop=True)
+        self.colunas = list(colunas or self.dados.columns)
+        self.ordenacao = np.arange(len(self.dados))  # Posições no DataFrame, na ordem de exibição
+        self.filtro = np.ones(len(self.dados), dtype=bool)
+        self.visiveis = self.ordenacao
+        self.coluna_ordenada = None
+        self.decrescente = False
+        self.inicio = 0
+        self.itens = []
+        self.create_widgets()
+
+    def create_widgets(self):
+        barra_busca = ttk.Frame(self)
+        barra_busca.pack(fill=tk.X)
+        ttk.Label(barra_busca, text="Buscar:").pack(side=tk.LEFT)
+        self.texto_busca = tk.StringVar()
+        entrada = ttk.Entry(barra_busca, textvariable=self.texto_busca)
+        entrada.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        entrada.bind('<Return>', lambda event: self.buscar(self.texto_busca.get()))
+        self.label_contagem = ttk.Label(barra_busca)
+        self.label_contagem.pack(side=tk.RIGHT)
+
+        corpo = ttk.Frame(self)
+        corpo.pack(expand=True, fill=tk.BOTH)
+        self.barra = ttk.Scrollbar(corpo, orient=tk.VERTICAL, command=self.rolar)
+        self.barra.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tabela = ttk.Treeview(corpo, columns=self.colunas, show="headings", selectmode='browse')
+        for coluna in self.colunas:
+            self.tabela.heading(coluna, text=coluna, command=lambda c=coluna: self.ordenar(c))
+            self.tabela.column(coluna, anchor='center')
+        self.tabela.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
+
+        self.tabela.bind('<Configure>', self.ajustar_linhas)
+        self.tabela.bind('<MouseWheel>', lambda event: self.rolar('scroll', -1 if event.delta > 0 else 1, 'units'))
+        self.tabela.bind('<Button-4>', lambda event: self.rolar('scroll', -1, 'units'))
+        self.tabela.bind('<Button-5>', lambda event: self.rolar('scroll', 1, 'units'))
+        self.tabela.bind('<Prior>', lambda event: self.rolar('scroll', -1, 'pages'))
+        self.tabela.bind('<Next>', lambda event: self.rolar('scroll', 1, 'pages'))
+        self.atualizar_contagem()
+
+    def ajustar_linhas(self, event=None):
+        """Cria ou remove itens da Treeview para caber exatamente na altura atual."""
+        altura_linha = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        quantidade = max(1, (self.tabela.winfo_height() - altura_linha) // altura_linha)
+        while len(self.itens) < quantidade:
+            self.itens.append(self.tabela.insert('', 'end', values=()))
+        while len(self.itens) > quantidade:
+            self.tabela.delete(self.itens.pop())
+        self.mostrar(self.inicio)
+
+    def mostrar(self, inicio):
+        """Preenche os itens existentes com as linhas a partir de inicio."""
+        total = len(self.visiveis)
+        self.inicio = max(0, min(inicio, total - len(self.itens)))
+        for deslocamento, item in enumerate(self.itens):
+            posicao = self.inicio + deslocamento
+            if posicao < total:
+                linha = self.dados.iloc[self.visiveis[posicao]]
+                self.tabela.item(item, values=[self.formatar(linha[coluna]) for coluna in self.colunas])
+            else:
+                self.tabela.item(item, values=())
+        if total:
+            self.barra.set(self.inicio / total, min(1.0, (self.inicio + len(self.itens)) / total))
+        else:
+            self.barra.set(0, 1)
+
+    @staticmethod
+    def formatar(valor):
+        return '' if pd.isna(valor) else valor
+
+    def rolar(self, acao, quantidade, unidade=None):
+        """Recebe os comandos da barra de rolagem ('moveto', fração) ou ('scroll', n, 'units'/'pages')."""
+        if acao == 'moveto':
+            self.mostrar(int(float(quantidade) * len(self.visiveis)))
+        else:
+            passo = len(self.itens) if unidade == 'pages' else 1
+            self.mostrar(self.inicio + int(quantidade) * passo)
+
+    def ordenar(self, coluna):
+        """Ordena pelo DataFrame; um novo clique na mesma coluna inverte a ordem."""
+        self.decrescente = not self.decrescente if self.coluna_ordenada == coluna else False
+        self.coluna_ordenada = coluna
+        serie = self.dados[coluna].sort_values(kind='stable', ascending=not self.decrescente, na_position='last')
+        self.ordenacao = serie.index.to_numpy()
+        self.aplicar()
+
+    def buscar(self, texto):
+        """Filtra as linhas que contêm o texto em qualquer coluna exibida."""
+        texto = texto.strip()
+        if texto:
+            self.filtro = np.zeros(len(self.dados), dtype=bool)
+            for coluna in self.colunas:
+                self.filtro |= self.dados[coluna].astype(str).str.contains(texto, case=False, regex=False).to_numpy()
+        else:
+            self.filtro = np.ones(len(self.dados), dtype=bool)
+        self.aplicar()
+
+    def aplicar(self):
+        self.visiveis = self.ordenacao[self.filtro[self.ordenacao]]
+        self.atualizar_contagem()
+        self.mostrar(0)
+
+    def atualizar_contagem(self):
+        self.label_contagem.config(text=f"{len(self.visiveis)} de {len(self.dados)} linha(s)")
+
+
+def colunas_inteiras(df):
+    """Colunas float em que todos os valores preenchidos são inteiros."""
+    inteiras = []
+    for coluna in df.columns:
+        if pd.api.types.is_float_dtype(df[coluna].dtype):
+            valores = df[coluna].to_numpy(dtype='float64', na_value=np.nan)
+            preenchidos = valores[~np.isnan(valores)]
+            if np.array_equal(preenchidos, np.floor(preenchidos)):
+                inteiras.append(coluna)
+    return inteiras
+
+
+def formatar_inteiros(df, inteiras=None):
+    """Remove o '.0' dos números inteiros para exibição, coluna a coluna (sem percorrer as células em Python).
+
+    Colunas float em que todos os valores são inteiros (ou as informadas em inteiras) viram Int64;
+    em colunas de tipos mistos, o sufixo '.0' é retirado do texto dos valores numéricos.
+    """
+    inteiras = colunas_inteiras(df) if inteiras is None else inteiras
+    resultado = df.copy()
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_float_dtype(serie.dtype):
+            if coluna in inteiras:
+                resultado[coluna] = serie.astype('Int64')
+        elif serie.dtype == object:
+            numericos = pd.to_numeric(serie, errors='coerce')
+            inteiros = numericos.notna() & (numericos % 1 == 0)
+            if inteiros.any():
+                texto = serie.astype(str).str.replace(r'\.0$', '', regex=True)
+                resultado[coluna] = serie.where(~inteiros, texto)
+    return resultado
+
+
+class PainelPaginado(ttk.Frame):
+    """Área de texto que exibe o resultado página a página, com a quantidade de linhas.
+
+    O DataFrame é guardado como recebido; só a página exibida é formatada.
+    """
+
+    TAMANHO_PAGINA = 500
+
+    def __init__(self, master, height=10, width=75):
+        super().__init__(master)
+        self.dados = None
+        self.inteiras = []
+        self.pagina = 0
+
+        navegacao = ttk.Frame(self)
+        navegacao.pack(fill=tk.X)
+        self.btn_anterior = ttk.Button(navegacao, text="◀ Anterior", command=lambda: self.ir_para(self.pagina - 1))
+        self.btn_anterior.pack(side=tk.LEFT)
+        self.btn_proxima = ttk.Button(navegacao, text="Próxima ▶", command=lambda: self.ir_para(self.pagina + 1))
+        self.btn_proxima.pack(side=tk.LEFT, padx=5)
+        self.label_info = ttk.Label(navegacao)
+        self.label_info.pack(side=tk.LEFT, padx=5)
+
+        self.text_result = tk.Text(self, height=height, width=width)
+        self.text_result.pack(expand=True, fill=tk.BOTH)
+        self.atualizar_navegacao()
+
+    @property
+    def total_paginas(self):
+        if self.dados is None or self.dados.empty:
+            return 0
+        return (len(self.dados) - 1) // self.TAMANHO_PAGINA + 1
+
+    def mostrar(self, dataframe):
+        """Exibe a primeira página; as demais só são convertidas em texto quando visitadas."""
+        self.dados = dataframe
+        self.inteiras = colunas_inteiras(dataframe)
+        self.ir_para(0)
+
+    def ir_para(self, pagina):
+        if not self.total_paginas:
+            return
+        self.pagina = max(0, min(pagina, self.total_paginas - 1))
+        inicio = self.pagina * self.TAMANHO_PAGINA
+        trecho = formatar_inteiros(self.dados.iloc[inicio:inicio + self.TAMANHO_PAGINA], self.inteiras)
+        self.text_result.delete('1.0', tk.END)
+        self.text_result.insert(tk.END, trecho.to_string(index=False))
+        self.atualizar_navegacao()
+
+    def mostrar_mensagem(self, mensagem):
+        self.dados = None
+        self.text_result.delete('1.0', tk.END)
+        self.text_result.insert(tk.END, mensagem)
+        self.atualizar_navegacao()
+
+    def limpar(self):
+        self.mostrar_mensagem('')
+
+    def atualizar_navegacao(self):
+        total = self.total_paginas
+        if total:
+            self.label_info.config(text=f"{len(self.dados)} linha(s) — página {self.pagina + 1} de {total}")
+        else:
+            self.label_info.config(text="")
+        self.btn_anterior.config(state=tk.NORMAL if self.pagina > 0 and total else tk.DISABLED)
+        self.btn_proxima.config(state=tk.NORMAL if self.pagina + 1 < total else tk.DISABLED)
+
+
+def selecionar_planilhas_ax(title="Planilhas AX"):
+    """Seleciona uma ou mais planilhas AX: retorna o caminho, a tupla dos caminhos ou "" se nada foi escolhido."""
+    arquivos = filedialog.askopenfilenames(title=title)
+    if not arquivos:
+        return ""
+    return arquivos[0] if len(arquivos) == 1 else tuple(arquivos)
+
+
+def descrever_progresso(dados):
+    """Texto de um evento de andamento: etapa, linhas lidas, aba concluída, bloco processado ou linhas exportadas."""
+    partes = []
+    if 'etapa' in dados:
+        partes.append(dados['etapa'])
+    if 'linhas' in dados:
+        partes += [f"{nome}: {linhas} linha(s)" for nome, linhas in dados['linhas'].items()]
+    if 'aba' in dados:
+        partes.append(f"aba {dados['aba']} concluída ({dados.get('linhas_aba', 0)} linha(s))")
+    if 'linhas_lidas' in dados:
+        partes.append(f"{dados['linhas_lidas']} linha(s) lida(s)")
+    if 'linhas_exportadas' in dados:
+        partes.append(f"{dados['linhas_exportadas']} linha(s) exportada(s)")
+    return ', '.join(partes)
+
+
+class IndicadorProgresso(ttk.Frame):
+    """Mostra o andamento de uma tarefa em segundo plano e permite cancelá-la.
+
+    Os eventos da tarefa chegam por uma fila, lida periodicamente com after(); assim os
+    callbacks (ao_concluir, ao_falhar, ao_cancelar) sempre rodam na thread da interface.
+    """
+
+    INTERVALO = 100
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.tarefa = None
+        self.fila = None
+        self.callbacks = {}
+        self.agendado = None
+        self.ultimos = {}
+        self.label = tk.Label(self, fg="blue")
+        self.btn_cancelar = ttk.Button(self, text="Cancelar", command=self.cancelar)
+        # Fechar a janela deixa de acompanhar a tarefa, que é cancelada se nenhuma outra janela a acompanha
+        self.bind('<Destroy>', self.ao_destruir)
+
+    @property
+    def ocupado(self):
+        return self.tarefa is not None
+
+    def acompanhar(self, tarefa, ao_concluir, ao_falhar=None, ao_cancelar=None):
+        self.tarefa = tarefa
+        self.fila = tarefa.assinar()
+        self.callbacks = {'concluida': ao_concluir, 'erro': ao_falhar, 'cancelada': ao_cancelar}
+        self.ultimos = {}
+        self.label.config(text="Processando...")
+        self.label.pack(side=tk.LEFT)
+        self.btn_cancelar.config(state=tk.NORMAL)
+        self.btn_cancelar.pack(side=tk.LEFT, padx=5)
+        self.agendado = self.after(self.INTERVALO, self.verificar)
+
+    def verificar(self):
+        self.agendado = None
+        if self.fila is None:
+            return
+        while True:
+            try:
+                tipo, dados = self.fila.get_nowait()
+            except queue.Empty:
+                break
+            if tipo == 'progresso':
+                # Mantém a etapa atual e a última informação de cada tipo
+                self.ultimos.update({chave: valor for chave, valor in dados.items() if chave != 'linhas'})
+                self.ultimos.setdefault('linhas', {}).update(dados.get('linhas', {}))
+                self.label.config(text=f"Processando... {descrever_progresso(self.ultimos)}")
+                continue
+            callback = self.callbacks.get(tipo)
+            self.encerrar()
+            if callback and tipo == 'cancelada':
+                callback()
+            elif callback:
+                callback(dados)
+            return
+        self.agendado = self.after(self.INTERVALO, self.verificar)
+
+    def cancelar(self):
+        if self.tarefa is None:
+            return
+        if self.tarefa.observadores > 1:
+            # Outra janela acompanha a mesma tarefa (veja Agendador.enviar): ela continua para a outra
+            self.tarefa.desassinar(self.fila)
+            if self.agendado is not None:
+                self.after_cancel(self.agendado)
+                self.agendado = None
+            callback = self.callbacks.get('cancelada')
+            self.encerrar()
+            if callback:
+                callback()
+            return
+        self.tarefa.cancelar()
+        self.label.config(text="Cancelando...")
+        self.btn_cancelar.config(state=tk.DISABLED)
+
+    def ao_destruir(self, event):
+        if event.widget is not self:
+            return
+        if self.agendado is not None:
+            self.after_cancel(self.agendado)
+        if self.tarefa is not None:
+            if self.tarefa.estado == 'concluida' and self.tarefa.medicao is not None and self.tarefa.observadores == 1:
+                # Concluída, mas a janela fechou antes de renderizar: grava a execução sem a renderização
+                self.tarefa.medicao.finalizar()
+            self.tarefa.desassinar(self.fila)
+        self.tarefa = None
+        self.fila = None
+
+    def encerrar(self):
+        # Os callbacks referenciam a tarefa e, com ela, os resultados: não devem mantê-los em memória
+        self.tarefa = None
+        self.fila = None
+        self.callbacks = {}
+        self.label.pack_forget()
+        self.btn_cancelar.pack_forget()
+
+
+def exportar_em_segundo_plano(janela, df, destino, conciliacao, nome_contagem, mensagem, titulo="Exportar"):
+    """Exporta o DataFrame no agendador, com o andamento no indicador da janela (janela.indicador).
+
+    Ao final, na thread da interface, a medição é exibida por janela.show_metrics e a mensagem é mostrada.
+    """
+    from Exportacao import ExportacaoEmAndamento, enviar_exportacao
+
+    if janela.indicador.ocupado:
+        messagebox.showinfo("Aguarde", "Aguarde o processamento em andamento terminar.")
+        return
+    try:
+        tarefa = enviar_exportacao(df, destino, conciliacao, nome_contagem)
+    except ExportacaoEmAndamento as e:
+        messagebox.showinfo("Aguarde", f"{e} Aguarde ela terminar ou escolha outro arquivo.")
+        return
+
+    def concluir(medicao):
+        medicao.finalizar()
+        janela.show_metrics(medicao)
+        messagebox.showinfo(titulo, mensagem)
+
+    def falhar(erro):
+        janela.show_metrics(tarefa.medicao)
+        messagebox.showerror("Erro", str(erro))
+
+    janela.indicador.acompanhar(tarefa, ao_concluir=concluir, ao_falhar=falhar,
+                                ao_cancelar=lambda: janela.show_metrics(tarefa.medicao))
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+import Incremental
+from Chaves import normalizar_chave
+
+
+@pytest.fixture(autouse=True)
+def estado(tmp_path, monkeypatch):
+    monkeypatch.setattr(Incremental, 'ESTADO_DIR', str(tmp_path))
+
+
+def _ax(faturas, status=None):
+    return pd.DataFrame({
+        'Fatura': normalizar_chave(pd.Series(faturas)),
+        'Status': status or ['Aberta'] * len(faturas),
+    })
+
+
+def _prefeitura(rps, nfs_e, tomador):
+    return pd.DataFrame({
+        'Número do RPS': normalizar_chave(pd.Series(rps)),
+        'Nº NFS-e': nfs_e,
+        'Tomador': tomador,
+    })
+
+
+def test_celula_vazia_alterada():
+    ax = _ax([1, 2])
+    Incremental._conciliar_incremental(ax, _prefeitura([1, 2], [10, 20], ['y', 'z']), 'teste')
+    _, mudancas = Incremental._conciliar_incremental(ax, _prefeitura([1, 2], [10, 20], ['y', None]), 'teste')
+
+    alterada = mudancas[mudancas['Mudança'] == 'alterada']
+    assert alterada['Fatura'].tolist() == [2]
+    assert alterada['Antes'].tolist() == ['20 / z']
+    assert alterada['Depois'].tolist() == ['20 / ']
+
+
+def test_mesmos_valores_com_outro_tipo():
+    ax = _ax([1, 2, 3])
+    Incremental._conciliar_incremental(ax, _prefeitura([1, 2, 3], [10, 20, 30], ['x', 'y', 'z']), 'teste')
+    prefeitura = _prefeitura([1, 2, 3], [10.0, 20.0, None], ['x', 'y', 'z'])
+    _, mudancas = Incremental._conciliar_incremental(ax, prefeitura, 'teste')
+
+    alterada = mudancas[(mudancas['Origem'] == 'Prefeitura') & (mudancas['Mudança'] == 'alterada')]
+    assert alterada['Fatura'].tolist() == [3]
+
+
+def test_ordem_igual_ao_merge_completo():
+    from Comparador import juntar_nfs_e
+
+    prefeitura = _prefeitura([1, 2, 3], [10, 20, 30], ['x', 'y', 'z'])
+    Incremental._conciliar_incremental(_ax([1, 2, 1, 3], ['A', 'B', 'C', 'D']), prefeitura, 'teste')
+    ax = _ax([1, 2, 1, 3], ['A', 'B', 'C', 'E'])
+    resultado, _ = Incremental._conciliar_incremental(ax, prefeitura, 'teste')
+
+    completo = juntar_nfs_e(ax, prefeitura).reset_index(drop=True)
+    pd.testing.assert_frame_equal(resultado, completo)
+    assert resultado['Status'].tolist() == ['A', 'B', 'C', 'E']